@@ -1,16 +1,87 @@
 try:
+    import re
+    import time
     import logging
+    import threading
+    from itertools import islice
+    from collections import namedtuple
     from sqlite3 import Error as SQliteError
+    from cache import BloomFilter
     from mysql.connector.errors import Error as MySQLError
     from abc import ABC, abstractmethod
 except ImportError as e:
     logging.error(f"Import error: {e}")
     raise ImportError("Failed to import necessary modules")
 
+
+# Outcome of BookStore.insert_book. id is None for a duplicate
+InsertResult = namedtuple("InsertResult", ["inserted", "id"])
+
+# Outcome of BookStore.delete_book. record is the deleted (id, title,
+# author, qty) row where the database can return it, otherwise None
+DeleteResult = namedtuple("DeleteResult", ["deleted", "record"])
+
+# A page of BookStore.search_books. has_more tells whether books follow
+SearchPage = namedtuple("SearchPage", ["books", "has_more"])
+
+# Outcome of BookStore.apply_qty_deltas. applied is the number of items
+# applied, failures lists the (item, reason) pairs of the others
+QtyDeltaResult = namedtuple("QtyDeltaResult", ["applied", "failures"])
+
+# Counters of a statement of BookStore.statement_stats. seconds is the 
+# total time its executions took
+StatementStats = namedtuple("StatementStats", ["executions", "seconds"])
+
+
+class StockError(Exception):
+    '''A quantity update that would leave a negative stock, or whose
+    stock kept changing. update_book raises it as it is'''
+
+
+class VersionConflictError(Exception):
+    '''An update made with the version of a book read earlier, after
+    someone else changed the book. update_book raises it as it is'''
+
+
 class BookStore(ABC):
     '''An abstract class to manage the book store inventory. It takes
     the database file and an optional table as arguments
     '''
+    # How many times update_book retries a quantity update when the
+    # stock, or the version of the book, changes between the UPDATE and
+    # the check that follows it
+    UPDATE_ATTEMPTS = 3
+    # How many records import_records inserts and commits at a time,
+    # and how often, in seconds, it reports its progress
+    IMPORT_CHUNK_SIZE = 10000
+    IMPORT_REPORT_INTERVAL = 5
+    # How many rows iter_books fetches at a time
+    EXPORT_BATCH_SIZE = 1000
+    # How many books a page of search results shows, and its headers
+    SEARCH_PAGE_SIZE = 20
+    SEARCH_HEADERS = ["ID", "Title", "Author", "Quantity"]
+    # The key filter has room for twice the books in the store, and at
+    # least this many. Once stale, e.g. after another connection wrote,
+    # it is rebuilt in the background at most every 
+    # KEY_FILTER_REBUILD_INTERVAL seconds and the database answers in 
+    # between. The rebuild reads KEY_FILTER_BATCH_SIZE books at a time,
+    # so writers never wait long for it
+    KEY_FILTER_MIN_CAPACITY = 1024
+    KEY_FILTER_REBUILD_INTERVAL = 30
+    KEY_FILTER_BATCH_SIZE = 10000
+    # The SQL statements of a backend by name, with {table} standing 
+    # for the table name. Backends add the statements of their DIALECT,
+    # and every BookStore of a dialect and table shares one compiled 
+    # set, see compile_statements
+    DIALECT = None
+    STATEMENTS = {
+        "count_books": "SELECT COUNT(*) FROM {table}",
+        "max_id": "SELECT MAX(id) FROM {table}",
+    }
+    # (dialect, table name): the compiled statements of that table
+    _statement_registry = {}
+    _statement_registry_lock = threading.Lock()
+
     @abstractmethod
     def __init__(self, database_file, table_name='book', table_records=None):
         pass
@@ -30,6 +101,60 @@ class BookStore(ABC):
         pass
 
 
+    @abstractmethod
+    def _insert_records_chunk(self, records):
+        pass
+
+
+    def import_records(self, records, chunk_size=None):
+        '''Insert (id, title, author, qty) records into the database.
+        id may be None to let the database assign it. Books already in 
+        the store are skipped. records can be any iterable, e.g. a 
+        generator reading a file. It is consumed in chunks of chunk_size
+        records (import_chunk_size by default), each inserted with one
+        executemany and committed, so an import of any size runs in 
+        constant memory. It prints its progress and throughput and 
+        returns the number of books inserted. During a bulk load the
+        records are only staged, and the bulk load prints how many books
+        it inserted instead. If there is an error, it raises a 
+        DatabaseError; the chunks before it stay committed
+        '''
+        chunk_size = chunk_size or self.import_chunk_size
+        records = iter(records)
+        read = inserted = 0
+        start = last_report = time.perf_counter()
+        try:
+            while chunk := list(islice(records, chunk_size)):
+                inserted += self._insert_records_chunk(chunk)
+                self.db.commit()
+                self._book_written()
+                if getattr(self, "key_filter", None) is not None:
+                    for _, title, author, _ in chunk:
+                        self._book_added(None, title, author)
+                read += len(chunk)
+                now = time.perf_counter()
+                if now - last_report >= self.IMPORT_REPORT_INTERVAL:
+                    print(
+                        f"Imported {read:,} records "
+                        f"({read / (now - start):,.0f} records/s)"
+                    )
+                    last_report = now
+        except (SQliteError, MySQLError) as e:
+            self._handle_db_error(e)
+        if read:
+            elapsed = time.perf_counter() - start
+            # The staged records of a bulk load aren't inserted yet
+            new = (
+                "" if getattr(self, "_bulk_load_table", None) 
+                else f", {inserted:,} new,"
+            )
+            print(
+                f"Imported {read:,} records{new} in {elapsed:.1f}s "
+                f"({read / max(elapsed, 1e-9):,.0f} records/s)"
+            )
+        return inserted
+
+
     def _handle_db_error(self, e):
         """Handle errors"""
         self.db.rollback()
@@ -53,11 +178,83 @@ class BookStore(ABC):
             ) from e
 
 
+    @classmethod
+    def compile_statements(cls, table_name):
+        '''Return the statements of a table by name, compiled from 
+        STATEMENTS the first time a BookStore of this dialect uses the
+        table. Later calls return the same string objects, so the text 
+        isn't built again on every execution and a MySQL prepared cursor
+        can tell it already prepared a statement
+        '''
+        key = (cls.DIALECT, table_name)
+        with cls._statement_registry_lock:
+            statements = cls._statement_registry.get(key)
+            if statements is None:
+                statements = cls._statement_registry[key] = {
+                    name: statement.format(table=table_name) 
+                    for name, statement in cls.STATEMENTS.items()
+                }
+        return statements
+
+
+    def _prepare_statements(self):
+        '''Look up the compiled statements of the table and reset the 
+        statement counters'''
+        self.statements = self.compile_statements(self.table_name)
+        self._statement_stats = {}
+        self._statement_stats_lock = threading.Lock()
+
+
+    def _statement_cursor(self, name):
+        '''Return the cursor to execute the statement name with'''
+        return self.cursor
+
+
+    def _execute(self, name, params=(), statement=None):
+        '''Execute the compiled statement name, or statement if it is
+        built per call (e.g. a search), and return the cursor holding 
+        its result. Each execution is counted, with the time it took, 
+        under name
+        '''
+        if statement is None:
+            cursor = self._statement_cursor(name)
+            statement = self.statements[name]
+        else:
+            cursor = self.cursor
+        start = time.perf_counter()
+        cursor.execute(statement, params)
+        elapsed = time.perf_counter() - start
+        with self._statement_stats_lock:
+            executions, seconds = self._statement_stats.get(name, (0, 0.0))
+            self._statement_stats[name] = (executions + 1, seconds + elapsed)
+        return cursor
+
+
+    def statement_stats(self):
+        '''Return the number of executions of each statement and the 
+        time they took, as a dictionary of StatementStats by statement 
+        name, the slowest in total first
+        '''
+        with self._statement_stats_lock:
+            stats = list(self._statement_stats.items())
+        return {
+            name: StatementStats(executions, seconds) 
+            for name, (executions, seconds) in sorted(
+                stats, key=lambda item: item[1][1], reverse=True
+            )
+        }
+
+
     @abstractmethod
     def update_qty_utility(self, qty, book_info):
         pass
 
 
+    @abstractmethod
+    def adjust_qty_utility(self, delta, book_info):
+        pass
+
+
     @abstractmethod
     def update_title_utility(self, book_info):
         pass
@@ -69,9 +266,333 @@ class BookStore(ABC):
 
 
     @abstractmethod
-    def find_book(self, book_info):
+    def _fetch_book(self, book_info, versioned=False):
         pass
- 
+
+
+    def find_book(self, book_info):
+        '''Find a book using a dictionary containing the book id, or 
+        its title and author. Returns the (id, title, author, qty) 
+        record if found, otherwise None. With a book cache, books found
+        are cached under both their id and their caseless title and 
+        author, and served from the cache until they expire, are 
+        evicted or are changed through this BookStore
+        '''
+        cache = getattr(self, "book_cache", None)
+        key = self.book_cache_key(book_info)
+        if key is None:
+            return self._fetch_book(book_info)
+        record = cache.get(key) if cache is not None else None
+        if record is None:
+            if self._known_missing(key, book_info):
+                return None
+            record = self._fetch_book(book_info)
+            if not record:
+                self._note_missing(key)
+            elif cache is not None:
+                record = tuple(record)
+                for key in self.book_cache_keys(record):
+                    cache.put(key, record)
+        return record
+
+
+    def book_version(self, book_info):
+        '''Return the version of a book, read from the database, or 
+        None if the book isn't found. Every update of a book adds one 
+        to its version. Passed to update_book as book_info["version"], 
+        the update only happens if nobody changed the book in between
+        '''
+        record = self._fetch_book(book_info, versioned=True)
+        return record[4] if record else None
+
+
+    def _known_missing(self, key, book_info):
+        '''Return True if the book of a book cache key is known not to 
+        exist without asking the database: an id in the negative cache,
+        or a title and author the key filter has never seen. Only when
+        one of them rules the book out is the database asked whether 
+        another connection wrote since the last check
+        '''
+        if key[0] == "id":
+            negative_cache = getattr(self, "negative_cache", None)
+            missing = (
+                negative_cache is not None 
+                and negative_cache.get(key[1]) is not None
+            )
+        else:
+            key_filter = self._usable_key_filter()
+            missing = key_filter is not None and self.key_filter_key(
+                book_info["title"], book_info["author"]
+            ) not in key_filter
+        return missing and not self._check_external_writes()
+
+
+    def _note_missing(self, key):
+        '''Remember that the book of an id book cache key is missing'''
+        negative_cache = getattr(self, "negative_cache", None)
+        if key[0] == "id" and negative_cache is not None:
+            negative_cache.put(key[1], True)
+
+
+    def _check_external_writes(self):
+        '''Forget the missing ids and mark the key filter stale if 
+        another connection wrote since the last check. Returns True if
+        one did. Only backends with an external generation can tell; on
+        the others, negative_cache_ttl bounds how long a miss is trusted
+        '''
+        if (
+            getattr(self, "negative_cache", None) is None 
+            and getattr(self, "key_filter", None) is None
+        ):
+            return False
+        generation = self._external_generation()
+        if generation == getattr(self, "_negative_generation", None):
+            return False
+        self._negative_generation = generation
+        if self.negative_cache is not None:
+            self.negative_cache.clear()
+        self.key_filter_stale = True
+        return True
+
+
+    @classmethod
+    def key_filter_key(cls, title, author):
+        '''Return the key of a title and author in the key filter: 
+        their collation_key, so that a book the database finds under 
+        another spelling is never ruled out'''
+        return (cls.collation_key(title), cls.collation_key(author))
+
+
+    def _scan_key_filter(self, cursor):
+        '''Return a key filter of every book, read with cursor a batch
+        of KEY_FILTER_BATCH_SIZE books at a time'''
+        cursor.execute(self.statements["count_books"])
+        count = cursor.fetchall()[0][0]
+        key_filter = BloomFilter(
+            max(2 * count, self.KEY_FILTER_MIN_CAPACITY),
+            self.key_filter_error_rate, 
+            self.key_filter_max_bytes
+        )
+        after_id = 0
+        while True:
+            cursor.execute(
+                self.statements["key_filter_batch"], 
+                (after_id, self.KEY_FILTER_BATCH_SIZE)
+            )
+            rows = cursor.fetchall()
+            for _, title, author in rows:
+                key_filter.add(self.key_filter_key(title, author))
+            if len(rows) < self.KEY_FILTER_BATCH_SIZE:
+                return key_filter
+            after_id = rows[-1][0]
+
+
+    def _build_key_filter(self):
+        '''Build the key filter, a Bloom filter of the key_filter_key
+        of every book, if key_filter_max_bytes is set'''
+        if not getattr(self, "key_filter_max_bytes", 0):
+            return
+        self._key_filter_lock = threading.Lock()
+        self._key_filter_thread = None
+        self._key_filter_added = None
+        self._load_key_filter()
+
+
+    def _load_key_filter(self):
+        '''Read the key filter through the connection of the store'''
+        self._check_external_writes()
+        cursor = self._streaming_cursor()
+        try:
+            self.key_filter = self._scan_key_filter(cursor)
+        finally:
+            self._close_streaming_cursor(cursor)
+        self.key_filter_stale = False
+        self._key_filter_built_at = self._key_filter_rebuilt_at = (
+            time.monotonic()
+        )
+
+
+    def _key_filter_connection(self):
+        '''Return a new connection for the key filter to be rebuilt on
+        in the background, or None if only the connection of the store 
+        can read its books'''
+        return None
+
+
+    def _start_key_filter_rebuild(self):
+        '''Rebuild the key filter on a thread and a connection of its
+        own, unless a rebuild is running or the last one started less 
+        than KEY_FILTER_REBUILD_INTERVAL seconds ago. The books added 
+        through this BookStore meanwhile are added to the new filter. 
+        Without a connection of its own, it is rebuilt at once
+        '''
+        with self._key_filter_lock:
+            now = time.monotonic()
+            if (
+                self._key_filter_added is not None 
+                or now - self._key_filter_rebuilt_at 
+                < self.KEY_FILTER_REBUILD_INTERVAL
+            ):
+                return
+            self._key_filter_rebuilt_at = now
+            connection = self._key_filter_connection()
+            if connection is None:
+                self._load_key_filter()
+                return
+            self._key_filter_added = []
+            self._key_filter_thread = threading.Thread(
+                target=self._rebuild_key_filter, args=(connection, ),
+                name=f"{type(self).__name__}-key-filter", daemon=True
+            )
+            self._key_filter_thread.start()
+
+
+    def _rebuild_key_filter(self, connection):
+        '''Run a rebuild of _start_key_filter_rebuild'''
+        key_filter = None
+        try:
+            cursor = connection.cursor()
+            try:
+                key_filter = self._scan_key_filter(cursor)
+            finally:
+                cursor.close()
+        except Exception as e:
+            logging.warning(f"Could not rebuild the key filter: {e}")
+        finally:
+            connection.close()
+        with self._key_filter_lock:
+            if key_filter is not None:
+                for key in self._key_filter_added:
+                    key_filter.add(key)
+                self.key_filter = key_filter
+                self.key_filter_stale = False
+                self._key_filter_built_at = time.monotonic()
+            self._key_filter_added = None
+
+
+    def _usable_key_filter(self):
+        '''Return the key filter if it can be trusted. A filter that is
+        stale, full or older than negative_cache_ttl is rebuilt in the 
+        background. Until then a full filter is still used, but for a 
+        stale or old one None is returned, as for no filter
+        '''
+        key_filter = getattr(self, "key_filter", None)
+        if key_filter is None:
+            return None
+        age = time.monotonic() - self._key_filter_built_at
+        ttl = getattr(self, "negative_cache_ttl", None)
+        expired = self.key_filter_stale or (ttl is not None and age >= ttl)
+        if expired or key_filter.items > key_filter.capacity:
+            self._start_key_filter_rebuild()
+            if expired and self.key_filter is key_filter:
+                return None
+        return self.key_filter
+
+
+    def _book_added(self, book_id, title, author):
+        '''Note a book added through this BookStore, so that neither 
+        the negative cache nor the key filter report it missing'''
+        negative_cache = getattr(self, "negative_cache", None)
+        if negative_cache is not None and book_id is not None:
+            negative_cache.pop(book_id)
+        if getattr(self, "key_filter", None) is not None:
+            key = self.key_filter_key(title, author)
+            with self._key_filter_lock:
+                self.key_filter.add(key)
+                if self._key_filter_added is not None:
+                    self._key_filter_added.append(key)
+
+
+    def _book_renamed(self, book_info):
+        '''Add the new title and author of a book whose title or author
+        update_book changed to the key filter'''
+        if getattr(self, "key_filter", None) is None:
+            return
+        if "id" in book_info:
+            record = self._fetch_book({"id": book_info["id"]})
+        else:
+            record = (
+                None, 
+                book_info.get("new_title", book_info["title"]), 
+                book_info.get("new_author", book_info["author"])
+            )
+        if record:
+            self._book_added(None, record[1], record[2])
+
+
+    @classmethod
+    def book_cache_key(cls, book_info):
+        '''Return the book cache key of a book_info dictionary, or None
+        if it names no book'''
+        if "id" in book_info:
+            return ("id", book_info["id"])
+        if "author" in book_info and "title" in book_info:
+            return (
+                "key", 
+                cls.casefold_key(book_info["title"]), 
+                cls.casefold_key(book_info["author"])
+            )
+        return None
+
+
+    @classmethod
+    def book_cache_keys(cls, record):
+        '''Return the book cache keys of an (id, title, author, qty) 
+        record'''
+        return (
+            ("id", record[0]), 
+            ("key", cls.casefold_key(record[1]), cls.casefold_key(record[2]))
+        )
+
+
+    def _invalidate_cached_book(self, book_info):
+        '''Remove a book that is being changed from the book cache, 
+        under both its keys. If the book isn't cached under the key 
+        book_info gives, an entry under its other key may still be, so
+        the cache is searched for it, comparing titles and authors by
+        their collation_key
+        '''
+        cache = getattr(self, "book_cache", None)
+        key = self.book_cache_key(book_info)
+        if cache is None or key is None:
+            return
+        record = cache.pop(key)
+        if record is not None:
+            for key in self.book_cache_keys(record):
+                cache.pop(key)
+        elif key[0] == "key":
+            # The database may take another spelling for the same book
+            title, author = map(self.collation_key, key[1:])
+            cache.pop_matching(
+                lambda _, record: 
+                self.collation_key(record[1]) == title 
+                and self.collation_key(record[2]) == author
+            )
+        else:
+            cache.pop_matching(lambda _, record: record[0] == key[1])
+
+
+    def clear_book_cache(self):
+        '''Empty the book cache, e.g. after a change to many books'''
+        if getattr(self, "book_cache", None) is not None:
+            self.book_cache.clear()
+
+
+    def _book_written(self, book_info=None):
+        '''Note a write to the book book_info names or, without 
+        book_info, to any number of books. The book leaves the book 
+        cache, and the table moves to a new generation so that search 
+        results cached before the write are no longer used
+        '''
+        self.table_generation = getattr(self, "table_generation", 0) + 1
+        if book_info is None:
+            self.clear_book_cache()
+            # Any id may have been added
+            if getattr(self, "negative_cache", None) is not None:
+                self.negative_cache.clear()
+        else:
+            self._invalidate_cached_book(book_info)
+
 
     @abstractmethod
     def insert_book(self, book):
@@ -84,10 +605,288 @@ class BookStore(ABC):
 
 
     @abstractmethod
-    def search_books(self, search_query):
+    def search_books(self, search_query, limit=None, after_id=None):
+        pass
+
+
+    @abstractmethod
+    def apply_qty_deltas(self, deltas):
         pass
 
 
+    @staticmethod
+    def _qty_delta_rows(deltas):
+        '''Utility function to validate the items of apply_qty_deltas.
+        Each item is a (book, delta) pair where book is an id or a
+        (title, author) pair and delta the integer to add to the
+        quantity. It returns the items, the (seq, id, title, author,
+        delta) rows to stage and the (item, reason) failures of the
+        items that are malformed. seq is the position of the item
+        '''
+        items, rows, failures = [], [], []
+        for seq, item in enumerate(deltas):
+            items.append(item)
+            try:
+                book, delta = item
+            except (TypeError, ValueError):
+                failures.append((item, "Expected a (book, delta) pair"))
+                continue
+            if not isinstance(delta, int) or isinstance(delta, bool):
+                failures.append((item, "Quantity change must be an integer"))
+            elif isinstance(book, int) and not isinstance(book, bool):
+                rows.append((seq, book, None, None, delta))
+            elif (
+                isinstance(book, (tuple, list)) and len(book) == 2 
+                and all(isinstance(value, str) for value in book)
+            ):
+                title, author = (value.strip() for value in book)
+                rows.append((seq, None, title, author, delta))
+            else:
+                failures.append(
+                    (item, "Book must be an id or a (title, author) pair")
+                )
+        return items, rows, failures
+
+
+    @staticmethod
+    def _qty_delta_failures(items, missing, short):
+        '''Utility function to turn the seqs of apply_qty_deltas items
+        whose book is missing, and the (seq, qty, net delta) of those
+        whose book would end up with a negative quantity, into
+        (item, reason) failures
+        '''
+        failures = [(items[seq], "Book not found") for (seq, ) in missing]
+        failures.extend(
+            (
+                items[seq], 
+                f"Quantity can't become negative: {qty} in stock, "
+                f"net change {delta}"
+            )
+            for seq, qty, delta in short
+        )
+        return failures
+
+
+    @abstractmethod
+    def _streaming_cursor(self):
+        pass
+
+
+    def _close_streaming_cursor(self, cursor):
+        cursor.close()
+
+
+    def iter_books(self, batch_size=None):
+        '''Yield every book as an (id, title, author, qty) row, in id
+        order. The rows are fetched batch_size at a time (by default 
+        EXPORT_BATCH_SIZE) from a cursor of their own that doesn't hold
+        the whole result, so memory use doesn't depend on the size of 
+        the table. If there is an error, it raises a DatabaseError
+        '''
+        cursor = self._streaming_cursor()
+        try:
+            cursor.execute(
+                f'''SELECT id, title, author, qty FROM {self.table_name} 
+                ORDER BY id
+                '''
+            )
+            batch_size = batch_size or self.EXPORT_BATCH_SIZE
+            while rows := cursor.fetchmany(batch_size):
+                yield from rows
+        except (SQliteError, MySQLError) as e:
+            self._handle_db_error(e)
+        finally:
+            self._close_streaming_cursor(cursor)
+
+
+    @abstractmethod
+    def _id_search_statement(self, id_ranges, after_id=None, limit=None):
+        pass
+
+
+    @abstractmethod
+    def _search_statement(self, search_query, after_id=None, limit=None):
+        pass
+
+
+    @staticmethod
+    def id_prefix_ranges(prefix, max_id):
+        '''Return the (first, last) id ranges of every id up to max_id
+        that starts with the digits of prefix. For example the prefix 30
+        with max_id 3050 gives (30, 30), (300, 309) and (3000, 3050)
+        '''
+        first = int(prefix)
+        scale = 1
+        id_ranges = []
+        while first and first * scale <= max_id:
+            id_ranges.append(
+                (first * scale, min((first + 1) * scale - 1, max_id))
+            )
+            scale *= 10
+        return id_ranges
+
+
+    def _search_records(self, search_query, limit=None, after_id=None):
+        '''Return the books that match a search query. A query made of
+        digits is usually an id read off a barcode sticker, so it is
+        first looked up through the primary key (and, with
+        id_prefix_search, as a prefix of the id). If no book has that
+        id, or the query isn't numeric, titles and authors are searched.
+        With a limit, it returns the page of at most limit books that 
+        follow the book after_id: in id order, or in order of relevance
+        then id with a search engine that ranks the books
+        '''
+        if search_query.isdigit():
+            id_ranges = [(int(search_query), int(search_query))]
+            if self.id_prefix_search and not search_query.startswith("0"):
+                max_id = self._execute("max_id").fetchall()[0][0] or 0
+                id_ranges = (
+                    self.id_prefix_ranges(search_query, max_id) or id_ranges
+                )
+            statement, params = self._id_search_statement(
+                id_ranges, after_id, limit
+            )
+            records = self._execute("id_search", params, statement).fetchall()
+            if records:
+                return records
+            if after_id:
+                # The books with a matching id may all be on the earlier
+                # pages, in which case there are no more
+                statement, params = self._id_search_statement(
+                    id_ranges, limit=1
+                )
+                if self._execute("id_search", params, statement).fetchall():
+                    return []
+
+        statement, params = self._search_statement(
+            search_query, after_id, limit
+        )
+        return self._execute("search", params, statement).fetchall()
+
+
+    @staticmethod
+    def normalize_search_query(search_query):
+        '''Return a query stripped and with runs of spaces collapsed, 
+        as get_book_search_query gives it'''
+        return re.sub(r" +", " ", search_query.strip())
+
+
+    @staticmethod
+    def search_cache_query(search_query):
+        '''Return the search cache form of a normalized query, 
+        casefolded if the query is ASCII. Every search engine ignores 
+        the case of ASCII letters, but LIKE on SQLite doesn't ignore the
+        case of other letters, so such a query keeps its case
+        '''
+        return search_query.casefold() if search_query.isascii() else (
+            search_query
+        )
+
+
+    def _external_generation(self):
+        '''Return a value that changes when another connection writes,
+        or None if the backend can't tell'''
+        return None
+
+
+    def _table_generation(self):
+        '''Return a value that changes whenever the books change. Writes
+        through this BookStore bump table_generation, and backends that
+        can tell when another connection wrote add their own counter
+        '''
+        return (
+            getattr(self, "table_generation", 0), self._external_generation()
+        )
+
+
+    def search(self, search_query, limit=None, after_id=None):
+        '''Return a page of the books that match a search query: at
+        most limit books (SEARCH_PAGE_SIZE by default) that follow the
+        book after_id. The books are in id order, or in order of 
+        relevance then id with a search engine that ranks them, and a
+        page starts after the (relevance, id) of the book after_id. Pass
+        the id of the last book of a page as after_id to get the next 
+        page. Every page is a single query that stops after limit rows,
+        so in id order the first page comes back as fast for a query 
+        that matches every book as for one that matches a few.
+        The query is normalized as get_book_search_query does. With a 
+        search cache, pages are cached under the normalized query
+        and the table generation, so a repeated search is served from 
+        memory until the books change. If there is an error, it raises
+        a DatabaseError
+        '''
+        limit = limit or self.SEARCH_PAGE_SIZE
+        search_query = self.normalize_search_query(search_query)
+        cache = getattr(self, "search_cache", None)
+        if cache is None:
+            return self._search(search_query, limit, after_id)
+        try:
+            key = (
+                self._table_generation(), 
+                self.search_cache_query(search_query), 
+                limit, 
+                after_id
+            )
+        except (SQliteError, MySQLError) as e:
+            self._handle_db_error(e)
+        records = cache.get(key)
+        if records is None:
+            records = tuple(self._search(search_query, limit, after_id))
+            cache.put(key, records)
+        return list(records)
+
+
+    def _search(self, search_query, limit, after_id):
+        '''search without the search cache'''
+        try:
+            return self._search_records(search_query, limit, after_id)
+        except (SQliteError, MySQLError) as e:
+            self._handle_db_error(e)
+
+
+    def iter_search(self, search_query, batch_size=None):
+        '''Yield every book that matches a search query, in the order
+        of search. The books are fetched a page of batch_size (by default 
+        EXPORT_BATCH_SIZE) at a time, so the first ones come as fast 
+        however many books match
+        '''
+        batch_size = batch_size or self.EXPORT_BATCH_SIZE
+        after_id = None
+        # Large batches read once aren't worth caching
+        while books := self._search(search_query, batch_size, after_id):
+            yield from books
+            if len(books) < batch_size:
+                return
+            after_id = books[-1][0]
+
+
+    def search_page(self, search_query, limit=None, after_id=None):
+        '''Return the SearchPage of search_books. One more book than
+        the page holds is fetched to tell whether another page follows
+        '''
+        limit = limit or self.SEARCH_PAGE_SIZE
+        books = self.search(search_query, limit + 1, after_id)
+        return SearchPage(books[:limit], len(books) > limit)
+
+
+    @staticmethod
+    def casefold_key(value):
+        '''Return the caseless key for a title or an author. The key is
+        stored alongside the value so that uniqueness checks and equality
+        lookups can compare keys with the database's own collation
+        '''
+        return value.casefold() if value is not None else None
+
+
+    @classmethod
+    def collation_key(cls, value):
+        '''Return the key by which the database compares a title or an
+        author, or a looser one. Values the database takes as equal must
+        have the same key. casefold_key by default
+        '''
+        return cls.casefold_key(value)
+
+
     @staticmethod
     def get_update_qty_utility(book_info, record):
         '''Utility function to get the updated quantity of a book. It
@@ -106,7 +905,7 @@ class BookStore(ABC):
         else:  # Set database quantity to a specific value
             qty = book_info["qty"]  
         if qty < 0:  # Book quantity can't be negative
-            raise Exception(
+            raise StockError(
                 "You can't perform this operation. You only "
                 f"have {record[3]} of this book in stock, "
                 "but you want to reduce the stock by "
@@ -133,32 +932,106 @@ class BookStore(ABC):
             self.update_author_utility(book_info)
 
 
+    def apply_update_utility(self, book_info):
+        '''Utility function to apply the update described by book_info
+        with a single UPDATE statement. Quantities are added and
+        subtracted by the database itself, and a subtraction only
+        happens if the stock covers it, so concurrent sales can't lose
+        updates. If book_info has a version, the row is only changed if
+        it still has that version. Every change adds one to the version.
+        It returns True if a row was changed
+        '''
+        if book_info["field"] == "quantity":
+            if book_info["action"] == "set":
+                return self.update_qty_utility(book_info["qty"], book_info)
+            if book_info["action"] == "add":
+                return self.adjust_qty_utility(book_info["qty"], book_info)
+            return self.adjust_qty_utility(-book_info["qty"], book_info)
+        elif book_info["field"] == "title":
+            return self.update_title_utility(book_info)
+        else:
+            return self.update_author_utility(book_info)
+
+
     def update_book(self, book_info):
         '''Update a book in the database. It takes a dictionary as an
         argument. The dictionary contains the book id, title, author,
         the field to update and the new value, and if quantity to 
-        update, the action on the quantity. If the book is found, it
+        update, the action on the quantity. It may also contain the
+        version of the book from book_version, in which case the update
+        is only made if the book still has that version. A quantity
+        added or subtracted is then applied to the current stock, 
+        retrying up to UPDATE_ATTEMPTS times, while any other update 
+        raises a VersionConflictError. If the book is found, it
         updates the book details and prints a message that the book was
         updated successfully. If the book is not found, it prints a
-        message that the book was not found. If there is an error, it
-        raises a DatabaseError
+        message that the book was not found. Returns True if the book
+        was found. If the stock doesn't cover a subtraction, it raises a
+        StockError. If there is an error, it raises a DatabaseError
         '''
         try:
-            record = None  # Initialize record variable
-            if "id" in book_info:  # If user provides the book id
-                record = self.find_book(book_info) 
-                if record:  # If book exists 
-                    self.update_books_utilty(book_info, record)       
-            else:  # If user provides the book author and title 
-                record = self.find_book(book_info)
-                if record:  # If book exists
-                    self.update_books_utilty(book_info, record)
-                    
-            if record:
+            book_found = False  # Inform user if book not found
+            relative = book_info["field"] == "quantity" and (
+                book_info["action"] != "set"
+            )
+
+            # The update is a single conditional UPDATE. Only when it
+            # changes nothing is the book read back, to tell a missing
+            # book from a stock shortage or a version conflict
+            for _ in range(self.UPDATE_ATTEMPTS):
+                changed = self.apply_update_utility(book_info)
+                # The book is read from the database from here on
+                self._book_written(book_info)
+                if changed:
+                    book_found = True
+                    break
+                if book_info.get("version") is None:
+                    record = self.find_book(book_info)
+                    version = None
+                else:
+                    record = self._fetch_book(book_info, versioned=True)
+                    version = record[4] if record else None
+                if not record:
+                    break
+                book_found = True
+                if version is not None and version != book_info["version"]:
+                    if not relative:
+                        raise VersionConflictError(
+                            "This book was changed by someone else since "
+                            "you read it. Please try again"
+                        )
+                    # A quantity added or subtracted doesn't depend on
+                    # the stock read, so it is applied to the new one
+                    book_info = dict(book_info, version=version)
+                    continue
+                if not relative or not book_info["qty"]:
+                    break  # Nothing to change
+                # Raises the stock error if the stock is still too low.
+                # Otherwise the stock was replenished since the UPDATE
+                # and the update is tried again
+                self.get_update_qty_utility(book_info, record)
+            else:
+                if version is not None:
+                    raise VersionConflictError(
+                        "This book kept changing. Please try again"
+                    )
+                raise StockError(
+                    "The stock of this book kept changing. Please try again"
+                )
+
+            if book_found:
                 self.db.commit()
+                if book_info["field"] != "quantity":
+                    self._book_renamed(book_info)
                 print("\nBook updated successfully")
             else:
                 print("\nBook not found")
+            return book_found
+        except (StockError, VersionConflictError):
+            # Not errors of the database: the caller is told why the
+            # update can't be made
+            self.db.rollback()
+            raise
         except SQliteError as e:
             self.db.rollback()
             # Get the line number and file name where the error occurred
@@ -183,3 +1056,7 @@ class BookStore(ABC):
             raise Exception(
                 f"Error on line {line_no} in '{file_name}': {str(e)}"
             ) from e
+        finally:
+            # A book read back above may hold a change that was rolled 
+            # back
+            self._book_written(book_info)
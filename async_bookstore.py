@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from classes import BookStoreMySQL, BookStoreSqlite
+
+
+class _Call:
+    '''A call of AsyncBookStore._run. store and connection_id are set
+    while a worker thread runs it, so a caller that stops waiting can
+    interrupt the statement in progress
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.store = None
+        self.connection_id = None
+
+
+class AsyncBookStore(ABC):
+    '''An asyncio façade over a BookStore. Every call runs on a worker
+    thread of an executor of its own, so the event loop is never blocked
+    by the database, and at most workers calls run at a time. Each
+    method takes a timeout in seconds (by default the timeout given to
+    the constructor, or none). A call that times out or whose task is
+    cancelled raises TimeoutError or CancelledError; if it is still
+    waiting for a worker it never runs, and if it is running the
+    statement in progress is interrupted. The stores still print their
+    status messages. Use AsyncBookStoreSqlite or AsyncBookStoreMySQL,
+    and close the store when done, e.g. with async with
+    '''
+    # How many calls run at a time by default
+    WORKERS = 4
+
+    def __init__(self, workers=None, timeout=None):
+        self.workers = workers or self.WORKERS
+        self.timeout = timeout
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix=type(self).__name__
+        )
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+    @abstractmethod
+    def _store(self):
+        '''Return the BookStore of the calling worker thread'''
+        pass
+
+
+    def _connection_id(self, store):
+        '''Return what _interrupt needs to find the statement the
+        calling worker thread runs, if anything'''
+        return None
+
+
+    @abstractmethod
+    def _interrupt(self, call):
+        '''Stop the statement call is running'''
+        pass
+
+
+    @abstractmethod
+    def _close_store(self):
+        '''Close or release the database connection of the calling
+        worker thread'''
+        pass
+
+
+    def _call(self, call, name, args):
+        '''Run store.name(*args) on a worker thread, unless the caller
+        stopped waiting before a worker was free'''
+        if call.cancelled:
+            return None
+        store = self._store()
+        connection_id = self._connection_id(store)
+        with call.lock:
+            if call.cancelled:
+                return None
+            call.store, call.connection_id = store, connection_id
+        try:
+            return getattr(call.store, name)(*args)
+        finally:
+            with call.lock:
+                call.store = None
+
+
+    async def _run(self, name, *args, timeout=None):
+        '''Run a BookStore method on a worker thread and return its
+        result. If the call times out or is cancelled, the statement it
+        runs is interrupted
+        '''
+        call = _Call()
+        future = asyncio.wrap_future(
+            self._executor.submit(self._call, call, name, args)
+        )
+        try:
+            return await asyncio.wait_for(
+                future, timeout if timeout is not None else self.timeout
+            )
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            with call.lock:
+                call.cancelled = True
+                if call.store is not None:
+                    try:
+                        self._interrupt(call)
+                    except Exception as e:
+                        logging.warning(f"Could not interrupt {name}: {e}")
+            raise
+
+
+    async def insert_book(self, book, timeout=None):
+        '''Insert a Book. Returns an InsertResult'''
+        return await self._run("insert_book", book, timeout=timeout)
+
+
+    async def find_book(self, book_info, timeout=None):
+        '''Find a book by id, or by title and author. Returns the
+        (id, title, author, qty) record, or None'''
+        return await self._run("find_book", book_info, timeout=timeout)
+
+
+    async def book_version(self, book_info, timeout=None):
+        '''Return the version of a book for update_book, or None'''
+        return await self._run("book_version", book_info, timeout=timeout)
+
+
+    async def update_book(self, book_info, timeout=None):
+        '''Update a book as BookStore.update_book does. Returns True if
+        the book was found'''
+        return await self._run("update_book", book_info, timeout=timeout)
+
+
+    async def delete_book(self, book_info, timeout=None):
+        '''Delete a book by id, or by title and author. Returns a
+        DeleteResult'''
+        return await self._run("delete_book", book_info, timeout=timeout)
+
+
+    async def search_books(
+            self, search_query, limit=None, after_id=None, timeout=None
+        ):
+        '''Return the SearchPage of the books that match a search query,
+        as BookStore.search_page does. The books aren't printed'''
+        return await self._run(
+            "search_page", search_query, limit, after_id, timeout=timeout
+        )
+
+
+    async def close(self):
+        '''Close the database connection of every worker thread and
+        shut the executor down. Calls still running are waited for
+        '''
+        # Every worker thread takes one of the jobs, as none can finish
+        # before all are taken
+        barrier = threading.Barrier(self.workers)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self._executor, self._close_worker, barrier)
+            for _ in range(self.workers)
+        ))
+        self._executor.shutdown(wait=False)
+
+
+    def _close_worker(self, barrier):
+        barrier.wait()
+        self._close_store()
+
+
+class AsyncBookStoreSqlite(AsyncBookStore):
+    '''An AsyncBookStore over an SQLite database file. Each worker
+    thread opens a BookStoreSqlite of its own, as SQLite connections
+    can't be shared between threads, so the caches of a store are those
+    of its worker: a book cached by one worker isn't invalidated by
+    writes through another until book_cache_ttl expires. The table is
+    created, and table_records imported, by the constructor. The other
+    keyword arguments are passed to BookStoreSqlite
+    '''
+    def __init__(
+            self, database_file, table_name='book', table_records=None,
+            workers=None, timeout=None, **store_options
+        ):
+        self.database_file = database_file
+        self.table_name = table_name
+        self.store_options = store_options
+        BookStoreSqlite(
+            database_file, table_name, table_records, **store_options
+        ).db.close()
+        self._stores = []
+        self._stores_lock = threading.Lock()
+        super().__init__(workers, timeout)
+
+
+    def _store(self):
+        store = getattr(self._local, "store", None)
+        if store is None:
+            store = self._local.store = BookStoreSqlite(
+                self.database_file, self.table_name, **self.store_options
+            )
+            with self._stores_lock:
+                self._stores.append(store)
+        return store
+
+
+    def _interrupt(self, call):
+        # Connection.interrupt can be called from any thread
+        call.store.db.interrupt()
+
+
+    def _close_store(self):
+        store = getattr(self._local, "store", None)
+        if store is not None:
+            self._local.store = None
+            store.cursor.close()
+            store.db.close()
+            with self._stores_lock:
+                self._stores.remove(store)
+
+
+class AsyncBookStoreMySQL(AsyncBookStore):
+    '''An AsyncBookStore over a MySQL database. The worker threads
+    share one BookStoreMySQL, and so its caches, and each checks out
+    a connection of its pool of workers connections. The keyword
+    arguments are passed to BookStoreMySQL
+    '''
+    def __init__(
+            self, database_connection, table_name='book',
+            table_records=None, workers=None, timeout=None,
+            **store_options
+        ):
+        workers = (
+            workers or int(database_connection.get("pool_size", 0))
+            or self.WORKERS
+        )
+        self.store = BookStoreMySQL(
+            dict(database_connection, pool_size=workers), table_name,
+            table_records, **store_options
+        )
+        # The workers need every connection of the pool
+        self.store.release_connection()
+        super().__init__(workers, timeout)
+
+
+    def _store(self):
+        return self.store
+
+
+    def _connection_id(self, store):
+        return store.db.connection_id
+
+
+    def _interrupt(self, call):
+        # KILL QUERY opens a connection, so it is sent from another
+        # thread and the event loop goes on
+        threading.Thread(
+            target=self._kill_query, args=(call.connection_id, ),
+            daemon=True
+        ).start()
+
+
+    def _kill_query(self, connection_id):
+        try:
+            self.store.kill_query(connection_id)
+        except Exception as e:
+            logging.warning(f"Could not stop query {connection_id}: {e}")
+
+
+    def _close_store(self):
+        self.store.release_connection()
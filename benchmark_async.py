@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+'''Measure the throughput of AsyncBookStore under many concurrent
+coroutine clients. Each client looks books up by id, searches and sells
+a copy, in a mix set by the options, and the calls per second and the
+latency percentiles are printed next to those of the same calls made
+one after the other through a BookStore. By default the benchmark runs
+on a temporary SQLite database; pass --database-url to run it on MySQL
+
+    python benchmark_async.py --clients 200 --calls 50 --workers 4
+'''
+
+# Import the following if they are not already imported:
+try:
+    import os
+    import sys
+    import time
+    import random
+    import asyncio
+    import logging
+    import argparse
+    import tempfile
+    import contextlib
+    from async_bookstore import AsyncBookStoreMySQL, AsyncBookStoreSqlite
+    from classes import BookStoreMySQL, BookStoreSqlite
+    from functions import get_database_connection_params
+except ImportError as e:
+    logging.error(f"Import error: {e}")
+    raise ImportError("Failed to import necessary modules")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument(
+        '--calls', type=int, default=50, help='Calls made by each client'
+    )
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument(
+        '--books', type=int, default=10000,
+        help='Books in the table before the run'
+    )
+    parser.add_argument(
+        '--search-share', type=float, default=0.1,
+        help='The share of calls that are searches'
+    )
+    parser.add_argument(
+        '--sale-share', type=float, default=0.1,
+        help='The share of calls that sell a copy of a book'
+    )
+    parser.add_argument(
+        '--database-url',
+        help='A mysql:// connection string. Its table is emptied first'
+    )
+    parser.add_argument('--table-name', default='benchmark_book')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+def plan_calls(args):
+    '''Return the (method, argument) calls of every client'''
+    rng = random.Random(args.seed)
+    plans = []
+    for _ in range(args.clients):
+        calls = []
+        for _ in range(args.calls):
+            book_id = rng.randint(1, args.books)
+            draw = rng.random()
+            if draw < args.search_share:
+                calls.append(("search_books", f"Book {book_id // 10}"))
+            elif draw < args.search_share + args.sale_share:
+                calls.append(("update_book", {
+                    "id": book_id, "field": "quantity", "action": "sub",
+                    "qty": 1
+                }))
+            else:
+                calls.append(("find_book", {"id": book_id}))
+        plans.append(calls)
+    return plans
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return tuple(
+        latencies[min(len(latencies) - 1, int(len(latencies) * share))]
+        * 1000
+        for share in (0.5, 0.99)
+    )
+
+
+def report(name, calls, seconds, latencies):
+    p50, p99 = percentiles(latencies)
+    print(
+        f"{name:<28} {calls / seconds:>10,.0f} calls/s  "
+        f"p50 {p50:>8.2f} ms  p99 {p99:>8.2f} ms",
+        file=sys.stderr
+    )
+
+
+def run_sync(store, plans):
+    '''Make every call one after the other'''
+    latencies = []
+    started = time.perf_counter()
+    for calls in plans:
+        for method, argument in calls:
+            start = time.perf_counter()
+            if method == "search_books":
+                store.search_page(argument)
+            else:
+                getattr(store, method)(argument)
+            latencies.append(time.perf_counter() - start)
+    return time.perf_counter() - started, latencies
+
+
+async def run_async(store, plans):
+    '''Run a coroutine per client, each making its calls in turn'''
+    latencies = []
+
+    async def client(calls):
+        for method, argument in calls:
+            start = time.perf_counter()
+            await getattr(store, method)(argument)
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(calls) for calls in plans))
+    return time.perf_counter() - started, latencies
+
+
+def main():
+    args = parse_args()
+    records = [
+        (i, f"Book {i}", f"Author {i % 500}", 1000000)
+        for i in range(1, args.books + 1)
+    ]
+    plans = plan_calls(args)
+    total_calls = args.clients * args.calls
+
+    with tempfile.TemporaryDirectory() as temp_dir, \
+            contextlib.redirect_stdout(open(os.devnull, "w")):
+        if args.database_url:
+            params = get_database_connection_params(args.database_url)
+            store = BookStoreMySQL(params, args.table_name)
+            store.cursor.execute(f"DELETE FROM {args.table_name}")
+            store.db.commit()
+            store.import_records(records)
+
+            def open_async():
+                return AsyncBookStoreMySQL(
+                    params, args.table_name, workers=args.workers
+                )
+        else:
+            database_file = os.path.join(temp_dir, "benchmark.db")
+            store = BookStoreSqlite(database_file, args.table_name, records)
+
+            def open_async():
+                return AsyncBookStoreSqlite(
+                    database_file, args.table_name, workers=args.workers
+                )
+
+        seconds, latencies = run_sync(store, plans)
+        report("BookStore, one at a time", total_calls, seconds, latencies)
+
+        async def benchmark():
+            async with open_async() as async_store:
+                return await run_async(async_store, plans)
+
+        seconds, latencies = asyncio.run(benchmark())
+        report(
+            f"AsyncBookStore, {args.clients} clients", total_calls, seconds,
+            latencies
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# Import the following if they are not already imported:
+try:
+    import math
+    import time
+    import hashlib
+    import logging
+    import threading
+    from collections import OrderedDict, namedtuple
+except ImportError as e:
+    logging.error(f"Import error: {e}")
+    raise ImportError("Failed to import necessary modules")
+
+
+# Counters of an LRUCache, to help choose its size and time to live
+CacheStats = namedtuple(
+    "CacheStats", ["hits", "misses", "evictions", "size", "max_size"]
+)
+
+
+class LRUCache:
+    '''A size bounded in-process cache. When it is full, the least
+    recently used entry is evicted to make room, and if ttl (in seconds)
+    is given, entries older than that are treated as missing. Lookups
+    and changes hold a lock, so the cache can be shared between threads
+    '''
+    def __init__(self, max_size, ttl=None, clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError("The cache size must be at least 1")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        # key: (expiry time or None, value), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def get(self, key, default=None):
+        '''Return the value cached for key, or default if there is none
+        or it has expired. A hit makes the entry the most recently used
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (
+                entry[0] is None or entry[0] > self.clock()
+            ):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:  # Expired
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+
+    def put(self, key, value):
+        '''Cache value for key, evicting the least recently used entries
+        if the cache is full
+        '''
+        expiry = self.clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expiry, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def pop(self, key, default=None):
+        '''Remove the entry for key and return its value, expired or
+        not, or default if there is none
+        '''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[1]
+
+
+    def pop_matching(self, predicate):
+        '''Remove every entry whose key and value satisfy
+        predicate(key, value). Returns the number of entries removed
+        '''
+        with self._lock:
+            keys = [
+                key for key, (_, value) in self._entries.items()
+                if predicate(key, value)
+            ]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+
+    def clear(self):
+        '''Remove every entry. The counters are kept'''
+        with self._lock:
+            self._entries.clear()
+
+
+    def stats(self):
+        '''Return the hit, miss and eviction counters as CacheStats'''
+        with self._lock:
+            return CacheStats(
+                self.hits, self.misses, self.evictions, len(self._entries),
+                self.max_size
+            )
+
+
+# Counters of a BloomFilter. saved is the number of checks it answered
+# without the database
+BloomStats = namedtuple(
+    "BloomStats", 
+    ["checks", "saved", "items", "capacity", "size_bytes", "error_rate"]
+)
+
+
+class BloomFilter:
+    '''A set that can tell for sure that a key was never added, in a 
+    fixed amount of memory. A key that was added is always reported, 
+    and one that wasn't is reported with a probability of about 
+    error_rate while no more than capacity keys are added. If holding 
+    that error rate takes more than max_bytes, the filter is capped at 
+    max_bytes and its error rate is higher. Keys are strings or tuples
+    of strings
+    '''
+    def __init__(self, capacity, error_rate=0.01, max_bytes=None):
+        if capacity < 1:
+            raise ValueError("The filter capacity must be at least 1")
+        if not 0 < error_rate < 1:
+            raise ValueError("The error rate must be between 0 and 1")
+        bits = math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        )
+        if max_bytes:
+            bits = min(bits, max_bytes * 8)
+        self.size = max(bits, 64)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+        self.items = 0
+        self.checks = 0
+        self.saved = 0
+
+
+    def _hashes(self, key):
+        '''Return the two 64 bit halves of a BLAKE2b digest of a key. 
+        The i-th bit position of the key is first + i * second (double 
+        hashing)
+        '''
+        if isinstance(key, tuple):
+            key = "\x1f".join(key)
+        digest = hashlib.blake2b(
+            key.encode("utf-8"), digest_size=16
+        ).digest()
+        return (
+            int.from_bytes(digest[:8], "little"), 
+            int.from_bytes(digest[8:], "little") | 1
+        )
+
+
+    def add(self, key):
+        '''Add a key to the filter'''
+        first, second = self._hashes(key)
+        with self._lock:
+            for i in range(self.hash_count):
+                position = (first + i * second) % self.size
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.items += 1
+
+
+    def __contains__(self, key):
+        first, second = self._hashes(key)
+        bits, size = self._bits, self.size
+        found = True
+        # Bits are only ever set, so they can be read without the lock.
+        # A missing key is usually ruled out by its first bit or two
+        for i in range(self.hash_count):
+            position = (first + i * second) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                found = False
+                break
+        with self._lock:
+            self.checks += 1
+            if not found:
+                self.saved += 1
+        return found
+
+
+    def error_rate(self):
+        '''Return the expected false positive rate for the keys added'''
+        return (
+            1 - math.exp(-self.hash_count * self.items / self.size)
+        ) ** self.hash_count
+
+
+    def stats(self):
+        '''Return the counters and the size of the filter as BloomStats'''
+        with self._lock:
+            return BloomStats(
+                self.checks, self.saved, self.items, self.capacity, 
+                len(self._bits), self.error_rate()
+            )
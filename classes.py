@@ -1,12 +1,23 @@
 # Import the following if they are not already imported:
 try:
+    import os
+    import re
+    import time
     import logging
     import sqlite3
+    import threading
+    import tempfile
+    import unicodedata
+    from contextlib import contextmanager
     from sqlite3 import Error as SQliteError
     import mysql.connector
+    from mysql.connector import errorcode
     from mysql.connector.errors import Error as MySQLError
-    from tabulate import tabulate
-    from abstract_classes import BookStore
+    from table_renderer import TableRenderer
+    from cache import LRUCache
+    from abstract_classes import (
+        BookStore, DeleteResult, InsertResult, QtyDeltaResult
+    )
 except ImportError as e:
     logging.error(f"Import error: {e}")
     raise ImportError("Failed to import necessary modules")
@@ -32,16 +43,116 @@ class Book:
 
 class BookStoreSqlite(BookStore):
     """A BookStore class to manage the book store inventory. It takes
-    the database file and an optional table as arguments
+    the database file, an optional table and an optional search engine
+    as arguments. The search engine is 'like', 'fts5' or 'trigram'
     """
+    # Search engine: (index table suffix, FTS5 tokenizer)
+    SEARCH_INDEXES = {
+        "fts5": ("fts", "unicode61 remove_diacritics 2"),
+        "trigram": ("trigram", "trigram"),
+    }
+    DIALECT = "sqlite"
+    STATEMENTS = {
+        **BookStore.STATEMENTS,
+        "key_filter_batch": 
+            "SELECT id, title, author FROM {table} WHERE id > ? "
+            "ORDER BY id LIMIT ?",
+        "select_book_by_id": 
+            "SELECT id, title, author, qty FROM {table} WHERE id = ?",
+        "select_book_by_key": 
+            "SELECT id, title, author, qty FROM {table} "
+            "WHERE author_key = ? AND title_key = ?",
+        "insert_book": 
+            "INSERT INTO {table} (title, author, qty, title_key, author_key) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT DO NOTHING RETURNING id",
+        "delete_book_by_id": 
+            "DELETE FROM {table} WHERE id = ? "
+            "RETURNING id, title, author, qty",
+        "delete_book_by_key": 
+            "DELETE FROM {table} WHERE author_key = ? AND title_key = ? "
+            "RETURNING id, title, author, qty",
+        "select_versioned_book_by_id": 
+            "SELECT id, title, author, qty, version FROM {table} WHERE id = ?",
+        "select_versioned_book_by_key": 
+            "SELECT id, title, author, qty, version FROM {table} "
+            "WHERE author_key = ? AND title_key = ?",
+        # Updates add one to the version of the book and, given a 
+        # version (the last two parameters), only change a book that 
+        # still has it
+        "set_qty_by_id": 
+            "UPDATE {table} SET qty = ?, version = version + 1 "
+            "WHERE id = ? AND (? IS NULL OR version = ?)",
+        "set_qty_by_key": 
+            "UPDATE {table} SET qty = ?, version = version + 1 "
+            "WHERE author_key = ? AND title_key = ? "
+            "AND (? IS NULL OR version = ?)",
+        "adjust_qty_by_id": 
+            "UPDATE {table} SET qty = qty + ?, version = version + 1 "
+            "WHERE id = ? AND qty + ? >= 0 AND (? IS NULL OR version = ?)",
+        "adjust_qty_by_key": 
+            "UPDATE {table} SET qty = qty + ?, version = version + 1 "
+            "WHERE author_key = ? AND title_key = ? AND qty + ? >= 0 "
+            "AND (? IS NULL OR version = ?)",
+        "set_title_by_id": 
+            "UPDATE {table} SET title = ?, title_key = ?, "
+            "version = version + 1 "
+            "WHERE id = ? AND (? IS NULL OR version = ?)",
+        "set_title_by_key": 
+            "UPDATE {table} SET title = ?, title_key = ?, "
+            "version = version + 1 "
+            "WHERE author_key = ? AND title_key = ? "
+            "AND (? IS NULL OR version = ?)",
+        "set_author_by_id": 
+            "UPDATE {table} SET author = ?, author_key = ?, "
+            "version = version + 1 "
+            "WHERE id = ? AND (? IS NULL OR version = ?)",
+        "set_author_by_key": 
+            "UPDATE {table} SET author = ?, author_key = ?, "
+            "version = version + 1 "
+            "WHERE author_key = ? AND title_key = ? "
+            "AND (? IS NULL OR version = ?)",
+    }
+
     def __init__(
-            self, database_connection, table_name='book', table_records=None
+            self, database_connection, table_name='book', table_records=None,
+            search_engine='like', id_prefix_search=False, 
+            import_chunk_size=None, bulk_load=False, book_cache_size=0,
+            book_cache_ttl=None, search_cache_size=0, search_cache_ttl=None,
+            negative_cache_size=0, negative_cache_ttl=None, 
+            key_filter_max_bytes=0, key_filter_error_rate=0.01
         ):
         try:
             self.table_name = table_name
+            self.book_cache = (
+                LRUCache(book_cache_size, book_cache_ttl) 
+                if book_cache_size else None
+            )
+            self.search_cache = (
+                LRUCache(search_cache_size, search_cache_ttl) 
+                if search_cache_size else None
+            )
+            self.table_generation = 0
+            self.negative_cache = (
+                LRUCache(negative_cache_size, negative_cache_ttl) 
+                if negative_cache_size else None
+            )
+            self.negative_cache_ttl = negative_cache_ttl
+            self.key_filter_max_bytes = key_filter_max_bytes
+            self.key_filter_error_rate = key_filter_error_rate
+            self.key_filter = None
+            self.import_chunk_size = (
+                import_chunk_size or self.IMPORT_CHUNK_SIZE
+            )
+            self.bulk_load_records = bulk_load
+            self._bulk_load_table = None
+            self.search_engine = search_engine
+            self.id_prefix_search = id_prefix_search
+            self._prepare_statements()
             self._connect_to_db(database_connection)
             self._create_table()
+            self._create_search_index()
             self._insert_predefined_records(table_records)
+            self._build_key_filter()
         except (SQliteError, PermissionError, Exception) as e:
             self._handle_db_error(e)
             
@@ -49,12 +160,19 @@ class BookStoreSqlite(BookStore):
     def _connect_to_db(self, database_connection):
         """Connect to the database"""
         self.db = sqlite3.connect(database_connection)
+        self.database_file = database_connection
         
-        # Caseless comparison
+        # Caseless comparison. Kept registered so that databases and
+        # ad hoc queries that still reference it keep working
         self.db.create_collation(  
             "UNICODE_NOCASE", BookStoreSqlite.unicode_nocase_collation
         )
 
+        # Used to fill in the casefolded key columns when migrating
+        self.db.create_function(
+            "casefold", 1, BookStore.casefold_key, deterministic=True
+        )
+
         print(
             f"\nSuccessfully connected to SQLite " 
             f"database: {database_connection}"
@@ -65,32 +183,327 @@ class BookStoreSqlite(BookStore):
         """Create a table in the database"""
         self.cursor = self.db.cursor()
 
+        self.cursor.execute(self._table_definition(self.table_name))
+        self._migrate_casefold_keys()
+        self._migrate_version_column()
+
+        # Uniqueness and equality lookups go through the casefolded keys
+        # with the built-in BINARY collation, so SQLite never has to call
+        # back into Python to compare titles and authors
         self.cursor.execute(
-            f'''CREATE TABLE IF NOT EXISTS {self.table_name}(
+            f'''CREATE UNIQUE INDEX IF NOT EXISTS {self.table_name}_table_key 
+            ON {self.table_name} (title_key, author_key)
+            '''
+        )
+        self.db.commit()  
+
+
+    @staticmethod
+    def _table_definition(table_name):
+        """Return the CREATE TABLE statement for the book table"""
+        return (
+            f'''CREATE TABLE IF NOT EXISTS {table_name}(
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title VARCHAR(255) COLLATE UNICODE_NOCASE NOT NULL,
-                author VARCHAR(255) COLLATE UNICODE_NOCASE NOT NULL,
+                title VARCHAR(255) NOT NULL,
+                author VARCHAR(255) NOT NULL,
                 qty INT NOT NULL,
-                CONSTRAINT {self.table_name}_table_key 
-                UNIQUE (title, author)
+                title_key VARCHAR(255) NOT NULL,
+                author_key VARCHAR(255) NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0
             );
             '''
         )
-        self.db.commit()  
+
+
+    def _migrate_casefold_keys(self):
+        '''Rebuild a table created before the casefolded key columns
+        existed. The old UNIQUE (title, author) constraint uses the
+        UNICODE_NOCASE collation and can't be dropped in place, so the
+        rows are copied into a new table which then takes the old name.
+        Ids and the AUTOINCREMENT counter are preserved
+        '''
+        self.cursor.execute(f"PRAGMA table_info({self.table_name})")
+        columns = [column[1] for column in self.cursor.fetchall()]
+        if "title_key" in columns:
+            return
+
+        new_table = f"{self.table_name}_casefold_keys"
+        self.cursor.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = ?", 
+            (self.table_name, )
+        )
+        sequence = self.cursor.fetchone()
+
+        self.cursor.execute("BEGIN")
+        self.cursor.execute(f"DROP TABLE IF EXISTS {new_table}")
+        self.cursor.execute(self._table_definition(new_table))
+        self.cursor.execute(
+            f'''INSERT INTO {new_table} 
+            (id, title, author, qty, title_key, author_key) 
+            SELECT id, title, author, qty, casefold(title), casefold(author) 
+            FROM {self.table_name}
+            '''
+        )
+        self.cursor.execute(f"DROP TABLE {self.table_name}")
+        self.cursor.execute(
+            f"ALTER TABLE {new_table} RENAME TO {self.table_name}"
+        )
+        if sequence:
+            self.cursor.execute(
+                '''UPDATE sqlite_sequence SET seq = MAX(seq, ?) 
+                WHERE name = ?
+                ''', 
+                (sequence[0], self.table_name)
+            )
+        print(
+            f"\nMigrated table {self.table_name} to casefolded key columns"
+        )
+
+
+    def _migrate_version_column(self):
+        '''Add the version column to a table created before it existed.
+        Every book starts at version 0
+        '''
+        self.cursor.execute(f"PRAGMA table_info({self.table_name})")
+        columns = [column[1] for column in self.cursor.fetchall()]
+        if "version" in columns:
+            return
+        self.cursor.execute(
+            f'''ALTER TABLE {self.table_name} 
+            ADD COLUMN version INTEGER NOT NULL DEFAULT 0
+            '''
+        )
+        print(f"\nAdded a version column to table {self.table_name}")
+
+
+    def _create_search_index(self):
+        '''Create the FTS5 index used by search_books when the fts5 or
+        the trigram search engine is selected. The index is an external
+        content table over the title and author columns, kept in sync
+        with the book table by triggers. The fts5 engine tokenizes words,
+        the trigram engine indexes every three character sequence so
+        that substring searches can use the index too. If SQLite was
+        built without FTS5 (or is too old for the trigram tokenizer),
+        the search engine falls back to 'like'
+        '''
+        if self.search_engine not in self.SEARCH_INDEXES:
+            if self.search_engine != "like":
+                logging.warning(
+                    f"The {self.search_engine} search engine is not "
+                    "available on SQLite. Falling back to LIKE searches"
+                )
+                self.search_engine = "like"
+            return
+
+        suffix, tokenizer = self.SEARCH_INDEXES[self.search_engine]
+        index_table = f"{self.table_name}_{suffix}"
+
+        # The triggers go away with the book table (e.g. when it is
+        # rebuilt by a migration), so their absence means the index has
+        # to be (re)created and repopulated
+        self.cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            "AND name = ?", 
+            (f"{index_table}_au", )
+        )
+        if self.cursor.fetchone():
+            return
+
+        try:
+            self.cursor.execute(
+                f'''CREATE VIRTUAL TABLE IF NOT EXISTS {index_table} 
+                USING fts5(
+                    title, author, 
+                    content='{self.table_name}', content_rowid='id', 
+                    tokenize='{tokenizer}'
+                )
+                '''
+            )
+        except sqlite3.OperationalError as e:
+            logging.warning(
+                f"The {self.search_engine} search engine is not available "
+                f"({e}). Falling back to LIKE searches"
+            )
+            self.search_engine = "like"
+            return
+
+        self.cursor.execute(
+            f'''CREATE TRIGGER IF NOT EXISTS {index_table}_ai 
+            AFTER INSERT ON {self.table_name} BEGIN
+                INSERT INTO {index_table} (rowid, title, author) 
+                VALUES (new.id, new.title, new.author);
+            END
+            '''
+        )
+        self.cursor.execute(
+            f'''CREATE TRIGGER IF NOT EXISTS {index_table}_ad 
+            AFTER DELETE ON {self.table_name} BEGIN
+                INSERT INTO {index_table} ({index_table}, rowid, title, author) 
+                VALUES ('delete', old.id, old.title, old.author);
+            END
+            '''
+        )
+        self.cursor.execute(
+            f'''CREATE TRIGGER IF NOT EXISTS {index_table}_au 
+            AFTER UPDATE OF title, author ON {self.table_name} BEGIN
+                INSERT INTO {index_table} ({index_table}, rowid, title, author) 
+                VALUES ('delete', old.id, old.title, old.author);
+                INSERT INTO {index_table} (rowid, title, author) 
+                VALUES (new.id, new.title, new.author);
+            END
+            '''
+        )
+        self.cursor.execute(
+            f"INSERT INTO {index_table} ({index_table}) VALUES ('rebuild')"
+        )
+        self.db.commit()
 
 
     def _insert_predefined_records(self, table_records):
         # Insert predefined table records into database if provided
         if table_records is not None:
-            # If records exist in the database, don't throw an error
-            self.cursor.executemany(
+            if self.bulk_load_records:
+                with self.bulk_load():
+                    self.import_records(table_records)
+            else:
+                self.import_records(table_records)
+
+
+    def _insert_records_chunk(self, records):
+        '''Insert a chunk of (id, title, author, qty) records with one
+        executemany and return how many were inserted. During a bulk
+        load of an empty table the records go to the staging table'''
+        table_name = self._bulk_load_table or self.table_name
+        # If records exist in the database, don't throw an error
+        self.cursor.executemany(
+            f'''INSERT OR IGNORE INTO {table_name} 
+            (id, title, author, qty, title_key, author_key) 
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', 
+            (
+                (
+                    record[0], record[1], record[2], record[3], 
+                    self.casefold_key(record[1]), 
+                    self.casefold_key(record[2])
+                )
+                for record in records
+            )
+        )
+        return self.cursor.rowcount
+
+
+    @contextmanager
+    def bulk_load(self):
+        '''Context manager for loading many records at once, e.g. 
+        when seeding a fresh store from a large catalog:
+
+            with book_store.bulk_load():
+                book_store.import_records(records)
+
+        If the table is empty, the records are staged in a temporary
+        table without indexes, and on a successful exit they are moved
+        into the table with a single INSERT ... SELECT, after which the
+        unique index and the search index are built once instead of 
+        being updated row by row. It prints how many books were 
+        inserted. As with import_records, the first record of a title 
+        and author wins; a file that also repeats ids across different 
+        books may keep a different one of the conflicting records. On an
+        error or an interrupt the staged records are dropped and the 
+        table is left as it was. A table that already has books is 
+        written to directly
+        '''
+        self.cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {self.table_name})"
+        )
+        staging = (
+            None if self.cursor.fetchone()[0] 
+            else f"{self.table_name}_bulk_load"
+        )
+
+        try:
+            if staging:
+                # seq keeps the order of the records
+                self.cursor.execute(
+                    f'''CREATE TEMP TABLE {staging}(
+                        seq INTEGER PRIMARY KEY,
+                        id INTEGER,
+                        title VARCHAR(255) NOT NULL,
+                        author VARCHAR(255) NOT NULL,
+                        qty INT NOT NULL,
+                        title_key VARCHAR(255) NOT NULL,
+                        author_key VARCHAR(255) NOT NULL
+                    )
+                    '''
+                )
+                self._bulk_load_table = staging
+            else:
+                logging.warning(
+                    f"The table {self.table_name} already has books. "
+                    "Importing the records without bulk load"
+                )
+            yield self
+        except BaseException:
+            self.db.rollback()
+            if staging:
+                self.cursor.execute(f"DROP TABLE IF EXISTS temp.{staging}")
+            raise
+        finally:
+            self._bulk_load_table = None
+            self.db.commit()
+
+        if staging:
+            self._merge_bulk_load(staging)
+
+
+    def _merge_bulk_load(self, staging):
+        '''Move the records staged by bulk_load into the empty table.
+        The unique index and the search index triggers are dropped for
+        the INSERT and built afterwards. Returns the number of books 
+        inserted'''
+        try:
+            if not self.db.in_transaction:
+                self.cursor.execute("BEGIN IMMEDIATE")
+            self.cursor.execute(
+                f"DROP INDEX IF EXISTS {self.table_name}_table_key"
+            )
+            if self.search_engine in self.SEARCH_INDEXES:
+                suffix, _ = self.SEARCH_INDEXES[self.search_engine]
+                for trigger in ("ai", "ad", "au"):
+                    self.cursor.execute(
+                        f"DROP TRIGGER IF EXISTS "
+                        f"{self.table_name}_{suffix}_{trigger}"
+                    )
+            # The first record of every title and author, in load order.
+            # Records whose id is taken are ignored as by import_records
+            self.cursor.execute(
                 f'''INSERT OR IGNORE INTO {self.table_name} 
-                (id, title, author, qty) 
-                VALUES (?, ?, ?, ?)
-                ''', 
-                table_records
+                (id, title, author, qty, title_key, author_key) 
+                SELECT id, title, author, qty, title_key, author_key 
+                FROM {staging} 
+                WHERE seq IN (
+                    SELECT MIN(seq) FROM {staging} 
+                    GROUP BY title_key, author_key
+                ) 
+                ORDER BY seq
+                '''
             )
+            inserted = self.cursor.rowcount
+            self.cursor.execute(
+                f'''CREATE UNIQUE INDEX {self.table_name}_table_key 
+                ON {self.table_name} (title_key, author_key)
+                '''
+            )
+            self.db.commit()
+            self._book_written()
+            # Recreates the triggers and rebuilds the index in one pass
+            self._create_search_index()
+        except SQliteError as e:
+            self._handle_db_error(e)
+        finally:
+            self.cursor.execute(f"DROP TABLE IF EXISTS temp.{staging}")
             self.db.commit()
+        print(f"Bulk load inserted {inserted:,} books")
+        return inserted
 
 
     @staticmethod
@@ -110,30 +523,65 @@ class BookStoreSqlite(BookStore):
         the updated quantity and a dictionary as arguments. The updated
         quantity is the quantity to update. The dictionary contains the
         book id, title, author, and the quantity to update. It updates
-        the quantity of the book in the database
+        the quantity of the book in the database. It returns True if a
+        row was changed
         '''
         if "id" in book_info:
-            self.cursor.execute(
-                f'''UPDATE {self.table_name} SET qty = ? 
-                WHERE id = ? 
-                ''', 
+            cursor = self._execute(
+                "set_qty_by_id", 
                 (
                     qty, 
-                    book_info["id"]
+                    book_info["id"], 
+                    book_info.get("version"), 
+                    book_info.get("version")
                 )
             )
         else:
-            self.cursor.execute(
-                f'''UPDATE {self.table_name} SET qty = ? 
-                WHERE author = ? 
-                AND title = ?
-                ''', 
+            cursor = self._execute(
+                "set_qty_by_key", 
                 (
                     qty, 
-                    book_info["author"], 
-                    book_info["title"]
+                    self.casefold_key(book_info["author"]), 
+                    self.casefold_key(book_info["title"]), 
+                    book_info.get("version"), 
+                    book_info.get("version")
+                )
+            )
+        return cursor.rowcount > 0
+
+
+    def adjust_qty_utility(self, delta, book_info):
+        '''Utility function to add delta (negative to subtract) to the
+        quantity of a book in a single UPDATE. The row is only changed
+        if the resulting quantity isn't negative and, if book_info has
+        a version, the book still has it. It returns True if the 
+        quantity was changed, False if the book wasn't found, doesn't 
+        have enough stock or has another version
+        '''
+        if "id" in book_info:
+            cursor = self._execute(
+                "adjust_qty_by_id", 
+                (
+                    delta, 
+                    book_info["id"], 
+                    delta, 
+                    book_info.get("version"), 
+                    book_info.get("version")
+                )
+            )
+        else:
+            cursor = self._execute(
+                "adjust_qty_by_key", 
+                (
+                    delta, 
+                    self.casefold_key(book_info["author"]), 
+                    self.casefold_key(book_info["title"]), 
+                    delta, 
+                    book_info.get("version"), 
+                    book_info.get("version")
                 )
             )
+        return cursor.rowcount > 0
 
 
     def update_title_utility(self, book_info):
@@ -142,26 +590,34 @@ class BookStoreSqlite(BookStore):
         Args:
              book_info (dict): Contains book id, title, author, and 
              new title.
+
+        Returns:
+             bool: True if a row was changed.
         '''
         if "id" in book_info:
-            self.cursor.execute(
-                f'''UPDATE {self.table_name} SET title = ? 
-                WHERE id = ?
-                ''', 
-                (book_info["new_title"], book_info["id"])
+            cursor = self._execute(
+                "set_title_by_id", 
+                (
+                    book_info["new_title"], 
+                    self.casefold_key(book_info["new_title"]), 
+                    book_info["id"], 
+                    book_info.get("version"), 
+                    book_info.get("version")
+                )
             )
         else:
-            self.cursor.execute(
-                f'''UPDATE {self.table_name} SET title = ? 
-                WHERE author = ? 
-                AND title = ?
-                ''', 
+            cursor = self._execute(
+                "set_title_by_key", 
                 (
                     book_info["new_title"], 
-                    book_info["author"], 
-                    book_info["title"]
+                    self.casefold_key(book_info["new_title"]), 
+                    self.casefold_key(book_info["author"]), 
+                    self.casefold_key(book_info["title"]), 
+                    book_info.get("version"), 
+                    book_info.get("version")
                 )
             )
+        return cursor.rowcount > 0
 
 
     def update_author_utility(self, book_info):
@@ -170,80 +626,91 @@ class BookStoreSqlite(BookStore):
         Args:
              book_info (dict): Contains book id, title, author, and 
              new author.
+
+        Returns:
+             bool: True if a row was changed.
         '''
         if "id" in book_info:
-            self.cursor.execute(
-                f'''UPDATE {self.table_name} SET author = ? 
-                WHERE id = ?
-                ''', 
-                (book_info["new_author"], book_info["id"])
+            cursor = self._execute(
+                "set_author_by_id", 
+                (
+                    book_info["new_author"], 
+                    self.casefold_key(book_info["new_author"]), 
+                    book_info["id"], 
+                    book_info.get("version"), 
+                    book_info.get("version")
+                )
             )
         else:
-            self.cursor.execute(
-                f'''UPDATE {self.table_name} SET author = ? 
-                WHERE author = ? 
-                AND title = ?
-                ''', 
+            cursor = self._execute(
+                "set_author_by_key", 
                 (
                     book_info["new_author"], 
-                    book_info["author"], 
-                    book_info["title"]
+                    self.casefold_key(book_info["new_author"]), 
+                    self.casefold_key(book_info["author"]), 
+                    self.casefold_key(book_info["title"]), 
+                    book_info.get("version"), 
+                    book_info.get("version")
                 )
             )
+        return cursor.rowcount > 0
 
 
-    def find_book(self, book_info):
+    def _fetch_book(self, book_info, versioned=False):
         '''Find a book in the database using a dictionary containing
         the book id, title, and author. Returns the book details if 
-        found, otherwise returns None.
+        found, otherwise returns None. find_book calls it when the book
+        isn't cached. If versioned, the version of the book follows its
+        quantity
         '''
+        statement = "select_versioned_book" if versioned else "select_book"
         if "id" in book_info:
-            self.cursor.execute(
-                f'''SELECT * FROM {self.table_name} 
-                WHERE id = ?
-                ''', 
+            cursor = self._execute(
+                f"{statement}_by_id", 
                 (book_info["id"], )
             )
         elif "author" in book_info and "title" in book_info:
-            self.cursor.execute(
-                f'''SELECT * FROM {self.table_name} 
-                WHERE author = ? 
-                AND title = ?
-                ''', 
-                (book_info["author"], book_info["title"])
+            cursor = self._execute(
+                f"{statement}_by_key", 
+                (
+                    self.casefold_key(book_info["author"]), 
+                    self.casefold_key(book_info["title"])
+                )
             )
         else:
             # Invalid book_info format
             return None
-        return self.cursor.fetchone()
+        return cursor.fetchone()
     
 
     def insert_book(self, book):
         '''Insert a book into the database. If the book already exists, 
-        it prints a message. If there is an error, it raises a 
+        it prints a message. The uniqueness check and the insert are a
+        single statement, so two clerks entering the same book can't
+        both insert it. Returns an InsertResult saying whether the book
+        was inserted and its id. If there is an error, it raises a 
         SQliteError.
         '''
         try:
-            self.cursor.execute(
-                f'''SELECT * FROM {self.table_name} 
-                WHERE title = ? 
-                AND author = ?
-                ''', 
-                (book.title, book.author)
+            cursor = self._execute(
+                "insert_book", 
+                (
+                    book.title, 
+                    book.author, 
+                    book.qty, 
+                    self.casefold_key(book.title), 
+                    self.casefold_key(book.author)
+                )
             )
-            if not self.cursor.fetchone():
-                self.cursor.execute(
-                    f'''
-                    INSERT INTO {self.table_name} 
-                    (title, author, qty) 
-                    VALUES (?, ?, ?)
-                    ''', 
-                    (book.title, book.author, book.qty)
-                )
-                self.db.commit()
-                print(f"\nBook entered with id: {self.cursor.lastrowid}")
-            else:
-                print("\nBook already exists")
+            inserted = cursor.fetchall()
+            self.db.commit()
+            self._book_written({"title": book.title, "author": book.author})
+            if inserted:
+                self._book_added(inserted[0][0], book.title, book.author)
+                print(f"\nBook entered with id: {inserted[0][0]}")
+                return InsertResult(True, inserted[0][0])
+            print("\nBook already exists")
+            return InsertResult(False, None)
         except SQliteError as e:
             self._handle_db_error(e)
 
@@ -251,101 +718,469 @@ class BookStoreSqlite(BookStore):
     def delete_book(self, book_info):
         '''Delete a book from the database using a dictionary with the 
         book id, title, and author. Prints a success message if the book 
-        is deleted, otherwise prints a not found message. Raises a 
-        SQliteError on error.
+        is deleted, otherwise prints a not found message. The delete is
+        a single statement that returns the deleted row. Returns a 
+        DeleteResult with the deleted record. Raises a SQliteError on 
+        error.
         '''
         try:
-            # Inform user if book not found
-            book_found = False
-
             if "id" in book_info:  # If user provides the book id
-                self.cursor.execute(
-                    f'''SELECT * FROM {self.table_name} 
-                    WHERE id = ?
-                    ''', 
+                cursor = self._execute(
+                    "delete_book_by_id", 
                     (book_info["id"], )
                 )
-                if self.cursor.fetchone():  # If book exists 
-                    book_found = True
-                    self.cursor.execute(
-                        f'''DELETE FROM {self.table_name} 
-                        WHERE id = ?
-                        ''', 
-                        (book_info["id"], )
-                    )
             else:  # If user provides the book author and title
-                self.cursor.execute(
-                    f'''SELECT * FROM {self.table_name} 
-                    WHERE author = ? 
-                    AND title = ?
-                    ''', 
-                    (book_info["author"], book_info["title"])
-                )
-                if self.cursor.fetchone():  # If book exists
-                    book_found = True
-                    self.cursor.execute(
-                        f'''DELETE FROM {self.table_name} 
-                        WHERE author = ? 
-                        AND title = ?
-                        ''', 
-                        (book_info["author"], book_info["title"])
+                cursor = self._execute(
+                    "delete_book_by_key", 
+                    (
+                        self.casefold_key(book_info["author"]), 
+                        self.casefold_key(book_info["title"])
                     )
-            if book_found:
-                self.db.commit()
+                )
+            deleted = cursor.fetchall()
+            self.db.commit()
+            self._book_written(book_info)
+            if deleted:
                 print("\nBook deleted successfully")
-            else:
-                print("\nBook not found")
+                return DeleteResult(True, deleted[0])
+            print("\nBook not found")
+            return DeleteResult(False, None)
         except SQliteError as e:
             self._handle_db_error(e)
 
 
-    def search_books(self, search_query):
-        '''Search for books in the database by id, title, or author. 
-        Prints the book details if found, otherwise prints a not found 
-        message. Raises a SQliteError on error.'''
+    def apply_qty_deltas(self, deltas):
+        '''Apply many quantity changes, e.g. a received shipment, in
+        one transaction. deltas is an iterable of (book, delta) pairs
+        where book is an id or a (title, author) pair. The changes are
+        staged with a single executemany and applied with one UPDATE, 
+        summed per book, so a long list costs a handful of statements.
+        A book that is missing or whose quantity would become negative
+        is left unchanged and its items are reported as failures. 
+        Returns a QtyDeltaResult. If there is an error, it raises a
+        SQliteError.
+        '''
+        items, rows, failures = self._qty_delta_rows(deltas)
+        staging = f"{self.table_name}_qty_deltas"
+        totals = f"{self.table_name}_qty_totals"
         try:
+            # Take the write lock up front so that the stock checked
+            # below is the stock the UPDATE changes
+            if not self.db.in_transaction:
+                self.cursor.execute("BEGIN IMMEDIATE")
+            self.cursor.execute(
+                f'''CREATE TEMP TABLE IF NOT EXISTS {staging}(
+                    seq INTEGER PRIMARY KEY,
+                    book_id INTEGER,
+                    title_key VARCHAR,
+                    author_key VARCHAR,
+                    delta INTEGER NOT NULL
+                )
+                '''
+            )
+            self.cursor.executemany(
+                f"INSERT INTO {staging} VALUES (?, ?, ?, ?, ?)", 
+                (
+                    (
+                        seq, 
+                        book_id, 
+                        self.casefold_key(title), 
+                        self.casefold_key(author), 
+                        delta
+                    )
+                    for seq, book_id, title, author, delta in rows
+                )
+            )
+            self.cursor.execute(
+                f'''UPDATE {staging} SET book_id = (
+                    SELECT id FROM {self.table_name} 
+                    WHERE title_key = {staging}.title_key 
+                    AND author_key = {staging}.author_key
+                )
+                WHERE book_id IS NULL
+                '''
+            )
+            self.cursor.execute(
+                f'''CREATE TEMP TABLE {totals} AS 
+                SELECT book_id, SUM(delta) AS delta FROM {staging} 
+                WHERE book_id IS NOT NULL 
+                GROUP BY book_id
+                '''
+            )
             self.cursor.execute(
-                f'''SELECT * FROM {self.table_name} 
-                WHERE id LIKE ? 
-                OR title LIKE ?
-                OR author LIKE ?
+                f'''SELECT staged.seq FROM {staging} AS staged 
+                LEFT JOIN {self.table_name} AS book 
+                ON book.id = staged.book_id 
+                WHERE book.id IS NULL 
+                ORDER BY staged.seq
+                '''
+            )
+            missing = self.cursor.fetchall()
+            self.cursor.execute(
+                f'''SELECT staged.seq, book.qty, total.delta 
+                FROM {staging} AS staged 
+                JOIN {totals} AS total ON total.book_id = staged.book_id 
+                JOIN {self.table_name} AS book ON book.id = staged.book_id 
+                WHERE book.qty + total.delta < 0 
+                ORDER BY staged.seq
+                '''
+            )
+            short = self.cursor.fetchall()
+            self.cursor.execute(
+                f'''UPDATE {self.table_name} SET qty = qty + total.delta, 
+                version = version + 1 
+                FROM {totals} AS total 
+                WHERE {self.table_name}.id = total.book_id 
+                AND {self.table_name}.qty + total.delta >= 0
+                '''
+            )
+            self.cursor.execute(f"DROP TABLE {totals}")
+            self.cursor.execute(f"DROP TABLE {staging}")
+            self.db.commit()
+            self._book_written()
+        except SQliteError as e:
+            self._handle_db_error(e)
+        failures.extend(self._qty_delta_failures(items, missing, short))
+        return QtyDeltaResult(len(items) - len(failures), failures)
+
+
+    def _streaming_cursor(self):
+        '''Return a cursor for iter_books. SQLite steps through the 
+        result as rows are fetched'''
+        return self.db.cursor()
+
+
+    def _external_generation(self):
+        '''Return SQLite's data version, which changes when another 
+        connection, e.g. another clerk's terminal, commits a write to 
+        the database
+        '''
+        self.cursor.execute("PRAGMA data_version")
+        return self.cursor.fetchone()[0]
+
+
+    def _key_filter_connection(self):
+        '''Return a connection to the database file for the key filter
+        to be rebuilt on, or None for an in-memory or temporary database,
+        which no other connection can read'''
+        if self.database_file in (":memory:", ""):
+            return None
+        return sqlite3.connect(self.database_file, check_same_thread=False)
+
+
+    @staticmethod
+    def fts_match_expression(search_query):
+        '''Turn a search query into an FTS5 MATCH expression. Every
+        word of the query has to prefix match a word of the title or the
+        author. Returns an empty string if the query has no words
+        '''
+        words = re.findall(r"[^\W_]+", search_query)
+        return " ".join(f'"{word}"*' for word in words)
+
+
+    def _id_search_statement(self, id_ranges, after_id=None, limit=None):
+        '''Return the SELECT statement and its parameters that look up
+        the books whose id falls in one of the (first, last) ranges. 
+        With a limit, it returns a page of at most limit books whose id
+        is above after_id'''
+        conditions = " OR ".join(["id BETWEEN ? AND ?"] * len(id_ranges))
+        params = tuple(bound for id_range in id_ranges for bound in id_range)
+        if limit is None:
+            return (
+                f'''SELECT id, title, author, qty FROM {self.table_name} 
+                WHERE {conditions} 
+                ORDER BY id
+                ''', 
+                params
+            )
+        return (
+            f'''SELECT id, title, author, qty FROM {self.table_name} 
+            WHERE ({conditions}) AND id > ? 
+            ORDER BY id 
+            LIMIT ?
+            ''', 
+            (*params, after_id or 0, limit)
+        )
+
+
+    def _search_statement(self, search_query, after_id=None, limit=None):
+        '''Return the SELECT statement and its parameters that search
+        the titles and authors with the current search engine. With a 
+        limit, it returns a page of at most limit books that follow the
+        book after_id. The fts5 engine orders the books by relevance
+        (bm25) then id, and a page starts after the relevance and id of
+        the book after_id. The others order them by id, and their pages
+        walk the primary key (or the rowids of the index) from after_id
+        and stop after limit rows, so a page costs the same however many
+        books match'''
+        like_query = '%' + search_query + '%'
+        paged = limit is not None
+        page_params = (after_id or 0, limit) if paged else ()
+
+        match_expression = self.fts_match_expression(search_query)
+        if self.search_engine == "fts5" and match_expression:
+            fts_table = f"{self.table_name}_fts"
+            rank = f"bm25({fts_table})"
+            after, after_params = "", ()
+            if after_id:
+                # The relevance of the last book of the previous page
+                after = (
+                    f'''AND ({rank}, {fts_table}.rowid) > (
+                        (
+                            SELECT {rank} FROM {fts_table} 
+                            WHERE {fts_table} MATCH ? AND rowid = ?
+                        ), 
+                        ?
+                    )'''
+                )
+                after_params = (match_expression, after_id, after_id)
+            return (
+                f'''SELECT book.id, book.title, book.author, book.qty 
+                FROM {fts_table} 
+                JOIN {self.table_name} AS book 
+                ON book.id = {fts_table}.rowid 
+                WHERE {fts_table} MATCH ? 
+                {after}
+                ORDER BY {rank}, {fts_table}.rowid 
+                {"LIMIT ?" if paged else ""}
                 ''', 
                 (
-                    '%' + search_query + '%', 
-                    '%' + search_query + '%', 
-                    '%' + search_query + '%', 
+                    match_expression, 
+                    *after_params, 
+                    *((limit, ) if paged else ())
+                )
+            )
+        # The trigram tokenizer needs at least three characters. The
+        # index narrows the candidates, LIKE verifies them
+        if self.search_engine == "trigram" and len(search_query) >= 3:
+            trigram_table = f"{self.table_name}_trigram"
+            page = (
+                f"AND {trigram_table}.rowid > ? "
+                f"ORDER BY {trigram_table}.rowid LIMIT ?"
+                if paged else "ORDER BY book.id"
+            )
+            return (
+                f'''SELECT book.id, book.title, book.author, book.qty 
+                FROM {trigram_table} 
+                JOIN {self.table_name} AS book 
+                ON book.id = {trigram_table}.rowid 
+                WHERE {trigram_table} MATCH ? 
+                AND (book.title LIKE ? OR book.author LIKE ?)
+                {page}
+                ''', 
+                (
+                    '"' + search_query.replace('"', '""') + '"', 
+                    like_query, 
+                    like_query, 
+                    *page_params
                 )
             )
-            
-            records = self.cursor.fetchall() 
 
-            if not records:  # If book doesn't exist
+        if paged:
+            return (
+                f'''SELECT id, title, author, qty FROM {self.table_name} 
+                WHERE id > ? 
+                AND (title LIKE ? OR author LIKE ?) 
+                ORDER BY id 
+                LIMIT ?
+                ''', 
+                (after_id or 0, like_query, like_query, limit)
+            )
+        return (
+            f'''SELECT id, title, author, qty FROM {self.table_name} 
+            WHERE title LIKE ?
+            OR author LIKE ?
+            ''', 
+            (like_query, like_query)
+        )
+
+
+    def search_books(self, search_query, limit=None, after_id=None):
+        '''Search for books in the database by id, title, or author. 
+        Prints a page of at most limit books that follow the book 
+        after_id if found, otherwise prints a not found message. Returns
+        the SearchPage. With the fts5 search engine, titles and authors
+        are matched by word prefixes through the full-text index, and 
+        the books are ranked by relevance. With the 
+        trigram search engine, substring matches are looked up in the 
+        trigram index. Numeric queries are looked up by id first. Raises
+        a SQliteError on error.'''
+        try:
+            page = self.search_page(search_query, limit, after_id)
+
+            if not page.books:  # If book doesn't exist
                 print("\nBook not found")
             else:  # Print the book details in a tabular format
-                headers = ["ID", "Title", "Author", "Quantity"]
-                print('\n', tabulate(records, headers))
+                TableRenderer(self.SEARCH_HEADERS).render(page.books)
+            return page
         except SQliteError as e:
             self._handle_db_error(e)
 
 
 class BookStoreMySQL(BookStore):
     '''A BookStore class to manage the book store inventory. It takes
-    the database file and an optional table as arguments'''
+    the database file, an optional table and an optional search engine
+    as arguments. The search engine is 'like', 'trigram' or 'fulltext'.
+    MySQL has no counter like SQLite's data version, so the caches can't
+    tell when another process or server writes to the table: its
+    changes only show once book_cache_ttl, search_cache_ttl or
+    negative_cache_ttl expires. Set them when other clients write
+    '''
+    SEARCH_ENGINES = ("like", "trigram", "fulltext")
+    # The errors of a LOAD DATA LOCAL INFILE the client or the server
+    # doesn't allow
+    LOCAL_INFILE_ERRORS = (
+        errorcode.ER_NOT_ALLOWED_COMMAND, 
+        errorcode.ER_CLIENT_LOCAL_FILES_DISABLED, 
+        errorcode.CR_LOAD_DATA_LOCAL_INFILE_REJECTED,
+    )
+    # The errors of a connection the server closed or that broke. A 
+    # read that fails with one is run again on a new connection
+    LOST_CONNECTION_ERRORS = (
+        errorcode.CR_SERVER_GONE_ERROR, 
+        errorcode.CR_SERVER_LOST, 
+        errorcode.CR_SERVER_LOST_EXTENDED, 
+        errorcode.ER_CLIENT_INTERACTION_TIMEOUT,
+    )
+    # How long, in seconds, a thread waits for a free connection of the
+    # pool, and how long a connection can be idle before it is pinged
+    # (and reconnected if the server closed it) on its next use
+    POOL_TIMEOUT = 10
+    PING_INTERVAL = 60
+    # InnoDB's default FULLTEXT stopwords. They aren't indexed, so the
+    # fulltext search engine looks them up with LIKE
+    FULLTEXT_STOPWORDS = frozenset((
+        "a", "about", "an", "are", "as", "at", "be", "by", "com", "de", 
+        "en", "for", "from", "how", "i", "in", "is", "it", "la", "of", 
+        "on", "or", "that", "the", "this", "to", "was", "what", "when", 
+        "where", "who", "will", "with", "und", "www",
+    ))
+    # Letters utf8mb4_unicode_ci compares as other letters but that 
+    # NFKD doesn't decompose
+    COLLATION_FOLDS = str.maketrans({
+        "æ": "ae", "œ": "oe", "ø": "o", "đ": "d", "ł": "l", "ı": "i",
+    })
+    DIALECT = "mysql"
+    STATEMENTS = {
+        **BookStore.STATEMENTS,
+        "key_filter_batch": 
+            "SELECT id, title, author FROM {table} WHERE id > %s "
+            "ORDER BY id LIMIT %s",
+        "select_book_by_id": 
+            "SELECT id, title, author, qty FROM {table} WHERE id = %s",
+        "select_book_by_key": 
+            "SELECT id, title, author, qty FROM {table} "
+            "WHERE author = %s AND title = %s",
+        "insert_book": 
+            "INSERT IGNORE INTO {table} (title, author, qty) "
+            "VALUES (%s, %s, %s)",
+        "delete_book_by_id": "DELETE FROM {table} WHERE id = %s",
+        "delete_book_by_key": 
+            "DELETE FROM {table} WHERE author = %s AND title = %s",
+        "select_versioned_book_by_id": 
+            "SELECT id, title, author, qty, version FROM {table} "
+            "WHERE id = %s",
+        "select_versioned_book_by_key": 
+            "SELECT id, title, author, qty, version FROM {table} "
+            "WHERE author = %s AND title = %s",
+        # Updates add one to the version of the book and, given a 
+        # version (the last two parameters), only change a book that 
+        # still has it. As the version always changes, so does the row,
+        # and rowcount counts it even if the new value is the old one
+        "set_qty_by_id": 
+            "UPDATE {table} SET qty = %s, version = version + 1 "
+            "WHERE id = %s AND (%s IS NULL OR version = %s)",
+        "set_qty_by_key": 
+            "UPDATE {table} SET qty = %s, version = version + 1 "
+            "WHERE author = %s AND title = %s "
+            "AND (%s IS NULL OR version = %s)",
+        "adjust_qty_by_id": 
+            "UPDATE {table} SET qty = qty + %s, version = version + 1 "
+            "WHERE id = %s AND qty + %s >= 0 "
+            "AND (%s IS NULL OR version = %s)",
+        "adjust_qty_by_key": 
+            "UPDATE {table} SET qty = qty + %s, version = version + 1 "
+            "WHERE author = %s AND title = %s AND qty + %s >= 0 "
+            "AND (%s IS NULL OR version = %s)",
+        "set_title_by_id": 
+            "UPDATE {table} SET title = %s, version = version + 1 "
+            "WHERE id = %s AND (%s IS NULL OR version = %s)",
+        "set_title_by_key": 
+            "UPDATE {table} SET title = %s, version = version + 1 "
+            "WHERE author = %s AND title = %s "
+            "AND (%s IS NULL OR version = %s)",
+        "set_author_by_id": 
+            "UPDATE {table} SET author = %s, version = version + 1 "
+            "WHERE id = %s AND (%s IS NULL OR version = %s)",
+        "set_author_by_key": 
+            "UPDATE {table} SET author = %s, version = version + 1 "
+            "WHERE author = %s AND title = %s "
+            "AND (%s IS NULL OR version = %s)",
+    }
+
     def __init__(
-            self, database_connection, table_name='book', table_records=None
+            self, database_connection, table_name='book', table_records=None,
+            search_engine='like', id_prefix_search=False, 
+            import_chunk_size=None, book_cache_size=0, book_cache_ttl=None,
+            search_cache_size=0, search_cache_ttl=None, 
+            negative_cache_size=0, negative_cache_ttl=None, 
+            key_filter_max_bytes=0, key_filter_error_rate=0.01
         ):
         try:
             self.table_name = table_name
+            self.book_cache = (
+                LRUCache(book_cache_size, book_cache_ttl) 
+                if book_cache_size else None
+            )
+            self.search_cache = (
+                LRUCache(search_cache_size, search_cache_ttl) 
+                if search_cache_size else None
+            )
+            self.table_generation = 0
+            self.negative_cache = (
+                LRUCache(negative_cache_size, negative_cache_ttl) 
+                if negative_cache_size else None
+            )
+            self.negative_cache_ttl = negative_cache_ttl
+            self.key_filter_max_bytes = key_filter_max_bytes
+            self.key_filter_error_rate = key_filter_error_rate
+            self.key_filter = None
+            self.import_chunk_size = (
+                import_chunk_size or self.IMPORT_CHUNK_SIZE
+            )
+            self.search_engine = search_engine
+            self.id_prefix_search = id_prefix_search
+            self._prepare_statements()
             self._connect_to_db(database_connection)
             self._create_table()
+            self._create_search_index()
             self._insert_predefined_records(table_records)
+            self._build_key_filter()
         except (MySQLError, PermissionError, Exception) as e:
             self._handle_db_error(e)
 
         
     def _connect_to_db(self, database_connection):
         """Connect to the database"""
-        self.db = mysql.connector.connect(
+        # Imports use LOAD DATA LOCAL INFILE if the connection allows it
+        self.local_infile = bool(
+            database_connection.get("allow_local_infile")
+        )
+        options = {"allow_local_infile": True} if self.local_infile else {}
+        # Each thread that uses the store checks a connection out of a 
+        # pool of pool_size connections and keeps it until it calls 
+        # release_connection. mysql.connector pools more than one
+        self.pool_size = int(database_connection.get("pool_size", 1))
+        self.pool_timeout = float(
+            database_connection.get("pool_timeout", self.POOL_TIMEOUT)
+        )
+        self.ping_interval = float(
+            database_connection.get("ping_interval", self.PING_INTERVAL)
+        )
+        if self.pool_size > 1:
+            options["pool_name"] = f"{self.table_name}-{id(self)}"
+            options["pool_size"] = self.pool_size
+        self._connect_options = dict(
             host=database_connection["host"],
             database=database_connection["database"],
             user=database_connection["user"],
@@ -353,17 +1188,180 @@ class BookStoreMySQL(BookStore):
             port=(
                 database_connection["port"] if "port" in database_connection 
                 else 3306
-            )
+            ),
+            **options
         )
+        self._local = threading.local()
+        self._pool_slots = threading.BoundedSemaphore(self.pool_size)
+        self.db = self._checkout_connection()
         print(
             f"\nSuccessfully connected to MySQL " 
             f"database: {database_connection['database']}"
         )
 
 
+    def _checkout_connection(self):
+        """Take a connection from the pool, waiting up to pool_timeout
+        seconds for one to be released"""
+        if not self._pool_slots.acquire(timeout=self.pool_timeout):
+            raise mysql.connector.errors.PoolError(
+                f"No connection of the pool of {self.pool_size} was "
+                f"released within {self.pool_timeout:g}s"
+            )
+        try:
+            return mysql.connector.connect(**self._connect_options)
+        except BaseException:
+            self._pool_slots.release()
+            raise
+
+
+    @property
+    def db(self):
+        '''The connection of the calling thread, checked out of the pool
+        on first use. A connection idle for ping_interval seconds is 
+        pinged first, and reconnected if the server closed it, e.g. 
+        after wait_timeout
+        '''
+        local = self._local
+        if getattr(local, "db", None) is None:
+            local.db = self._checkout_connection()
+            local.cursor = local.db.cursor()
+            local.prepared_cursors = {}
+        elif time.monotonic() - local.last_used >= self.ping_interval:
+            connection_id = local.db.connection_id
+            local.db.ping(reconnect=True, attempts=2)
+            if local.db.connection_id != connection_id:
+                # The statements were prepared on the lost connection
+                local.prepared_cursors = {}
+        local.last_used = time.monotonic()
+        return local.db
+
+
+    @db.setter
+    def db(self, db):
+        self._local.db = db
+        self._local.prepared_cursors = {}
+        self._local.last_used = time.monotonic()
+
+
+    @property
+    def cursor(self):
+        '''The cursor of the calling thread's connection'''
+        self.db  # Checks the connection out, or pings it
+        return self._local.cursor
+
+
+    @cursor.setter
+    def cursor(self, cursor):
+        self._local.cursor = cursor
+
+
+    def _statement_cursor(self, name):
+        '''Return the prepared cursor of the statement name on the 
+        calling thread's connection. Each statement has a cursor of its
+        own, so the server parses it once per connection and every 
+        later execution only sends the parameters
+        '''
+        self.db  # Checks the connection out, or pings it
+        prepared_cursors = self._local.prepared_cursors
+        cursor = prepared_cursors.get(name)
+        if cursor is None:
+            cursor = self._local.db.cursor(prepared=True)
+            prepared_cursors[name] = cursor
+        return cursor
+
+
+    def release_connection(self):
+        '''Return the connection of the calling thread to the pool, e.g.
+        when a worker thread is done with the store. The thread checks
+        out another one if it uses the store again
+        '''
+        local = self._local
+        db = getattr(local, "db", None)
+        if db is None:
+            return
+        local.db = None
+        # Closing the connection deallocates the prepared statements
+        local.prepared_cursors = {}
+        try:
+            local.cursor.close()
+            db.close()
+        finally:
+            self._pool_slots.release()
+
+
+    def _key_filter_connection(self):
+        '''Return a connection outside the pool for the key filter to be
+        rebuilt on, so that the rebuild takes no connection of the 
+        threads that use the store'''
+        return mysql.connector.connect(**{
+            name: value for name, value in self._connect_options.items() 
+            if not name.startswith("pool_")
+        })
+
+
+    def _retry_read(self, read, *args):
+        '''Run read(*args) and, if the connection was lost, run it once
+        more on a new connection. Only reads made while no write is 
+        pending are run this way, so nothing is lost with the connection
+        '''
+        try:
+            return read(*args)
+        except MySQLError as e:
+            if e.errno not in self.LOST_CONNECTION_ERRORS:
+                raise
+            logging.warning(f"Lost the MySQL connection, reconnecting: {e}")
+            local = self._local
+            local.db.reconnect(attempts=2)
+            local.cursor = local.db.cursor()
+            local.prepared_cursors = {}
+            local.last_used = time.monotonic()
+            return read(*args)
+
+
+    @classmethod
+    def collation_key(cls, value):
+        '''Return a key that is equal for titles or authors that 
+        utf8mb4_unicode_ci takes as equal: it ignores case, accents and
+        trailing spaces. The key may be looser than the collation, 
+        never stricter
+        '''
+        value = unicodedata.normalize(
+            "NFKD", cls.casefold_key(value).translate(cls.COLLATION_FOLDS)
+        )
+        return "".join(
+            char for char in value if not unicodedata.combining(char)
+        ).rstrip(" ")
+
+
+    def kill_query(self, connection_id):
+        '''Stop the statement the connection connection_id is running,
+        e.g. one whose caller stopped waiting for it. KILL QUERY is sent
+        on a connection of its own, outside the pool, so that it goes 
+        through when every connection of the pool is busy
+        '''
+        options = {
+            name: value for name, value in self._connect_options.items()
+            if name not in ("pool_name", "pool_size")
+        }
+        db = mysql.connector.connect(**options)
+        try:
+            cursor = db.cursor()
+            cursor.execute(f"KILL QUERY {int(connection_id)}")
+            cursor.close()
+        finally:
+            db.close()
+
+
     def _create_table(self):
-        """Create a table in the database"""
+        """Create a table in the database. With the fulltext search 
+        engine, it has a FULLTEXT index of the titles and authors"""
         self.cursor = self.db.cursor()
+        fulltext_index = (
+            f",\n                FULLTEXT KEY {self.table_name}_fulltext "
+            "(title, author)"
+            if self.search_engine == "fulltext" else ""
+        )
         self.cursor.execute(
             f'''CREATE TABLE IF NOT EXISTS {self.table_name}(
                 id INT AUTO_INCREMENT PRIMARY KEY,
@@ -375,26 +1373,301 @@ class BookStoreMySQL(BookStore):
                 COLLATE utf8mb4_unicode_ci 
                 NOT NULL,
                 qty INT NOT NULL,
+                version INT NOT NULL DEFAULT 0,
                 CONSTRAINT {self.table_name}_table_key 
-                UNIQUE (title, author)
+                UNIQUE (title, author){fulltext_index}
             );
             '''
         )
+        self._migrate_version_column()
         self.db.commit()  
 
 
+    def _migrate_version_column(self):
+        '''Add the version column to a table created before it existed.
+        Every book starts at version 0
+        '''
+        self.cursor.execute(
+            '''SELECT COLUMN_NAME FROM information_schema.COLUMNS 
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s 
+            AND COLUMN_NAME = 'version'
+            ''', 
+            (self.table_name, )
+        )
+        if self.cursor.fetchone():
+            return
+        self.cursor.execute(
+            f'''ALTER TABLE {self.table_name} 
+            ADD COLUMN version INT NOT NULL DEFAULT 0
+            '''
+        )
+        print(f"\nAdded a version column to table {self.table_name}")
+
+
+    def _create_search_index(self):
+        '''Create the trigram side table used by search_books when the
+        trigram search engine is selected. Every three character
+        sequence of a book's title and author is stored with the book
+        id. Triggers on the book table keep it up to date, so writes
+        from any client are indexed. Creating the triggers needs the
+        TRIGGER and CREATE ROUTINE privileges
+        '''
+        if self.search_engine not in self.SEARCH_ENGINES:
+            logging.warning(
+                f"The {self.search_engine} search engine is not available "
+                "on MySQL. Falling back to LIKE searches"
+            )
+            self.search_engine = "like"
+        if self.search_engine == "fulltext":
+            self._create_fulltext_index()
+        if self.search_engine != "trigram":
+            return
+
+        trigram_table = f"{self.table_name}_trigram"
+        self.cursor.execute(
+            f'''CREATE TABLE IF NOT EXISTS {trigram_table}(
+                trigram CHAR(3) 
+                CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci 
+                NOT NULL,
+                book_id INT NOT NULL,
+                PRIMARY KEY (trigram, book_id),
+                KEY {trigram_table}_book_id (book_id)
+            );
+            '''
+        )
+
+        self.cursor.execute(
+            '''SELECT TRIGGER_NAME FROM information_schema.TRIGGERS 
+            WHERE TRIGGER_SCHEMA = DATABASE() 
+            AND TRIGGER_NAME = %s
+            ''', 
+            (f"{trigram_table}_au", )
+        )
+        if self.cursor.fetchone():
+            return
+
+        self.cursor.execute(f"DROP PROCEDURE IF EXISTS {trigram_table}_add")
+        self.cursor.execute(
+            f'''CREATE PROCEDURE {trigram_table}_add(
+                IN p_book_id INT, 
+                IN p_text VARCHAR(255) CHARACTER SET utf8mb4
+            )
+            BEGIN
+                DECLARE i INT DEFAULT 1;
+                WHILE i <= CHAR_LENGTH(p_text) - 2 DO
+                    INSERT IGNORE INTO {trigram_table} (trigram, book_id) 
+                    VALUES (SUBSTRING(p_text, i, 3), p_book_id);
+                    SET i = i + 1;
+                END WHILE;
+            END
+            '''
+        )
+        self.cursor.execute(
+            f'''CREATE TRIGGER {trigram_table}_ai 
+            AFTER INSERT ON {self.table_name} FOR EACH ROW
+            BEGIN
+                CALL {trigram_table}_add(NEW.id, NEW.title);
+                CALL {trigram_table}_add(NEW.id, NEW.author);
+            END
+            '''
+        )
+        self.cursor.execute(
+            f'''CREATE TRIGGER {trigram_table}_ad 
+            AFTER DELETE ON {self.table_name} FOR EACH ROW
+            DELETE FROM {trigram_table} WHERE book_id = OLD.id
+            '''
+        )
+        self.cursor.execute(
+            f'''CREATE TRIGGER {trigram_table}_au 
+            AFTER UPDATE ON {self.table_name} FOR EACH ROW
+            BEGIN
+                IF NEW.title <> OLD.title OR NEW.author <> OLD.author THEN
+                    DELETE FROM {trigram_table} WHERE book_id = OLD.id;
+                    CALL {trigram_table}_add(NEW.id, NEW.title);
+                    CALL {trigram_table}_add(NEW.id, NEW.author);
+                END IF;
+            END
+            '''
+        )
+
+        # Index the books that were there before the triggers
+        self.cursor.execute(f"DELETE FROM {trigram_table}")
+        self.cursor.execute(f"SELECT id, title, author FROM {self.table_name}")
+        entries = [
+            (trigram, record[0]) 
+            for record in self.cursor.fetchall() 
+            for trigram in set(
+                self.trigrams(record[1]) + self.trigrams(record[2])
+            )
+        ]
+        if entries:
+            self.cursor.executemany(
+                f'''INSERT IGNORE INTO {trigram_table} (trigram, book_id) 
+                VALUES (%s, %s)
+                ''', 
+                entries
+            )
+        self.db.commit()
+
+
+    def _create_fulltext_index(self):
+        '''Add the FULLTEXT index of the titles and authors to a table
+        created without one, and read the shortest word the index holds
+        (innodb_ft_min_token_size). Building the index of a large table
+        takes a while, but only happens once
+        '''
+        self.cursor.execute(
+            '''SELECT INDEX_NAME FROM information_schema.STATISTICS 
+            WHERE TABLE_SCHEMA = DATABASE() 
+            AND TABLE_NAME = %s 
+            AND INDEX_NAME = %s
+            ''', 
+            (self.table_name, f"{self.table_name}_fulltext")
+        )
+        if not self.cursor.fetchall():
+            print(f"\nAdding a FULLTEXT index to table {self.table_name}")
+            self.cursor.execute(
+                f'''ALTER TABLE {self.table_name} 
+                ADD FULLTEXT INDEX {self.table_name}_fulltext (title, author)
+                '''
+            )
+            self.db.commit()
+        self.cursor.execute("SELECT @@innodb_ft_min_token_size")
+        self.fulltext_min_token_size = int(self.cursor.fetchall()[0][0])
+
+
+    @classmethod
+    def fulltext_terms(cls, search_query, min_token_size):
+        '''Split a search query for the FULLTEXT index. Returns an 
+        AGAINST expression in boolean mode in which every indexed word 
+        of the query has to prefix match a word of the title or the 
+        author, and the list of the other words: those shorter than 
+        min_token_size and the stopwords, which the index doesn't hold.
+        The expression is empty if no word is indexed
+        '''
+        indexed, other = [], []
+        for word in re.findall(r"[^\W_]+", search_query):
+            if (
+                len(word) < min_token_size 
+                or word.casefold() in cls.FULLTEXT_STOPWORDS
+            ):
+                other.append(word)
+            else:
+                indexed.append(word)
+        return " ".join(f"+{word}*" for word in indexed), other
+
+
+    @staticmethod
+    def trigrams(text):
+        '''Return the distinct three character sequences of a text, in
+        order of first appearance. Sequences that only differ by case
+        count once
+        '''
+        trigrams = {}
+        for i in range(len(text) - 2):
+            trigrams.setdefault(text[i:i + 3].casefold(), text[i:i + 3])
+        return list(trigrams.values())
+
+
     def _insert_predefined_records(self, table_records):
         # Insert predefined table records into database if provided
         if table_records is not None:
-            # If records exist in the database, don't throw an error
-            self.cursor.executemany(
-                f'''INSERT IGNORE INTO {self.table_name} 
-                (id, title, author, qty) 
-                VALUES (%s, %s, %s, %s)
+            self.import_records(table_records)
+
+
+    def _insert_records_chunk(self, records):
+        '''Insert a chunk of (id, title, author, qty) records and 
+        return how many were inserted. If the connection allows it, the
+        chunk is sent with LOAD DATA LOCAL INFILE, otherwise with one
+        executemany, which the connector turns into a multi-row INSERT.
+        If the server refuses LOAD DATA LOCAL INFILE, the import falls
+        back to executemany
+        '''
+        if self.local_infile:
+            try:
+                return self._load_records_chunk(records)
+            except MySQLError as e:
+                if e.errno not in self.LOCAL_INFILE_ERRORS:
+                    raise
+                logging.warning(
+                    f"LOAD DATA LOCAL INFILE is not available ({e}). "
+                    "Falling back to batched inserts"
+                )
+                self.local_infile = False
+
+        # If records exist in the database, don't throw an error
+        self.cursor.executemany(
+            f'''INSERT IGNORE INTO {self.table_name} 
+            (id, title, author, qty) 
+            VALUES (%s, %s, %s, %s)
+            ''', 
+            records
+        )
+        return self.cursor.rowcount
+
+
+    @staticmethod
+    def load_data_field(value):
+        '''Return a value as a field of a LOAD DATA file, with the 
+        default tab separated format and escapes. None becomes \\N'''
+        if value is None:
+            return "\\N"
+        return (
+            str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r")
+            .replace("\0", "\\0")
+        )
+
+
+    def _load_records_chunk(self, records):
+        '''Send a chunk of records to a staging table with LOAD DATA 
+        LOCAL INFILE and merge it into the book table. The merge is an 
+        INSERT IGNORE ... SELECT in the order of the records, so 
+        duplicates are handled as by INSERT IGNORE: the first record of
+        an id or of a title and author wins. Returns how many books were
+        inserted
+        '''
+        staging = f"{self.table_name}_load"
+        self.cursor.execute(
+            f'''CREATE TEMPORARY TABLE IF NOT EXISTS {staging}(
+                seq INT AUTO_INCREMENT PRIMARY KEY,
+                id INT NULL,
+                title VARCHAR(255) 
+                CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
+                author VARCHAR(255) 
+                CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
+                qty INT NOT NULL
+            )
+            '''
+        )
+        self.cursor.execute(f"DELETE FROM {staging}")
+
+        with tempfile.NamedTemporaryFile(
+            'w', encoding='utf-8', newline='\n', suffix='.tsv', delete=False
+        ) as chunk_file:
+            for record in records:
+                chunk_file.write(
+                    "\t".join(map(self.load_data_field, record)) + "\n"
+                )
+        try:
+            self.cursor.execute(
+                f'''LOAD DATA LOCAL INFILE %s INTO TABLE {staging} 
+                CHARACTER SET utf8mb4 
+                (id, title, author, qty)
                 ''', 
-                table_records
+                (chunk_file.name, )
             )
-            self.db.commit()
+        finally:
+            os.unlink(chunk_file.name)
+
+        self.cursor.execute(
+            f'''INSERT IGNORE INTO {self.table_name} 
+            (id, title, author, qty) 
+            SELECT id, title, author, qty FROM {staging} 
+            ORDER BY seq
+            '''
+        )
+        return self.cursor.rowcount
 
 
     def update_qty_utility(self, qty, book_info):
@@ -402,112 +1675,160 @@ class BookStoreMySQL(BookStore):
         the updated quantity and a dictionary as arguments. The updated
         quantity is the quantity to update. The dictionary contains the
         book id, title, author, and the quantity to update. It updates
-        the quantity of the book in the database
+        the quantity of the book in the database. It returns True if a
+        row was changed
         '''
         if "id" in book_info:
-            self.cursor.execute(
-                f'''UPDATE {self.table_name} SET qty = %s 
-                WHERE id = %s 
-                ''', 
+            cursor = self._execute(
+                "set_qty_by_id", 
                 (
                     qty, 
-                    book_info["id"]
+                    book_info["id"], 
+                    book_info.get("version"), 
+                    book_info.get("version")
                 )
             )
         else:
-            self.cursor.execute(
-                f'''UPDATE {self.table_name} SET qty = %s 
-                WHERE author = %s 
-                AND title = %s
-                ''', 
+            cursor = self._execute(
+                "set_qty_by_key", 
                 (
                     qty, 
                     book_info["author"], 
-                    book_info["title"]
+                    book_info["title"], 
+                    book_info.get("version"), 
+                    book_info.get("version")
                 )
             )
+        return cursor.rowcount > 0
+
+
+    def adjust_qty_utility(self, delta, book_info):
+        '''Utility function to add delta (negative to subtract) to the
+        quantity of a book in a single UPDATE. The row is only changed
+        if the resulting quantity isn't negative and, if book_info has
+        a version, the book still has it. It returns True if the 
+        quantity was changed, False if the book wasn't found, doesn't 
+        have enough stock or has another version
+        '''
+        if "id" in book_info:
+            cursor = self._execute(
+                "adjust_qty_by_id", 
+                (
+                    delta, 
+                    book_info["id"], 
+                    delta, 
+                    book_info.get("version"), 
+                    book_info.get("version")
+                )
+            )
+        else:
+            cursor = self._execute(
+                "adjust_qty_by_key", 
+                (
+                    delta, 
+                    book_info["author"], 
+                    book_info["title"], 
+                    delta, 
+                    book_info.get("version"), 
+                    book_info.get("version")
+                )
+            )
+        return cursor.rowcount > 0
 
 
     def update_title_utility(self, book_info):
         '''Utility function to update the title of a book. It takes a
         dictionary as an argument. The dictionary contains the book id,
         title, author, and the new title. It updates the title of the
-        book in the database
+        book in the database. It returns True if a row was changed
         '''
         if "id" in book_info:
-            self.cursor.execute(
-                f'''UPDATE {self.table_name} SET title = %s 
-                WHERE id = %s
-                ''', 
-                (book_info["new_title"], book_info["id"])
+            cursor = self._execute(
+                "set_title_by_id", 
+                (
+                    book_info["new_title"], 
+                    book_info["id"], 
+                    book_info.get("version"), 
+                    book_info.get("version")
+                )
             )
         else:
-            self.cursor.execute(
-                f'''UPDATE {self.table_name} SET title = %s 
-                WHERE author = %s 
-                AND title = %s
-                ''', 
+            cursor = self._execute(
+                "set_title_by_key", 
                 (
                     book_info["new_title"], 
                     book_info["author"], 
-                    book_info["title"]
+                    book_info["title"], 
+                    book_info.get("version"), 
+                    book_info.get("version")
                 )
             )
+        return cursor.rowcount > 0
 
 
     def update_author_utility(self, book_info):
         '''Utility function to update the author of a book. It takes a
         dictionary as an argument. The dictionary contains the book id,
         title, author, and the new author. It updates the author of the
-        book in the database
+        book in the database. It returns True if a row was changed
         '''
         if "id" in book_info:
-            self.cursor.execute(
-                f'''UPDATE {self.table_name} SET author = %s 
-                WHERE id = %s
-                ''', 
-                (book_info["new_author"], book_info["id"])
+            cursor = self._execute(
+                "set_author_by_id", 
+                (
+                    book_info["new_author"], 
+                    book_info["id"], 
+                    book_info.get("version"), 
+                    book_info.get("version")
+                )
             )
         else:
-            self.cursor.execute(
-                f'''UPDATE {self.table_name} SET author = %s 
-                WHERE author = %s 
-                AND title = %s
-                ''', 
+            cursor = self._execute(
+                "set_author_by_key", 
                 (
                     book_info["new_author"], 
                     book_info["author"], 
-                    book_info["title"]
+                    book_info["title"], 
+                    book_info.get("version"), 
+                    book_info.get("version")
                 )
             )
+        return cursor.rowcount > 0
 
 
-    def find_book(self, book_info):
+    def _fetch_book(self, book_info, versioned=False):
+        '''Find a book in the database, reconnecting once if the 
+        connection was lost. find_book calls it when the book isn't 
+        cached
+        '''
+        return self._retry_read(self._select_book, book_info, versioned)
+
+
+    def _select_book(self, book_info, versioned=False):
         '''Find a book in the database. It takes a dictionary as an
         argument. The dictionary contains the book id, title, and
         author. If the book is found, it returns the book details. If
         the book is not found, it returns None. Book has to exist in
-        order to be updated
+        order to be updated. If versioned, the version of the book 
+        follows its quantity
         '''
+        statement = "select_versioned_book" if versioned else "select_book"
         if "id" in book_info:
-            self.cursor.execute(
-                f'''SELECT * FROM {self.table_name} 
-                WHERE id = %s
-                ''', 
+            cursor = self._execute(
+                f"{statement}_by_id", 
                 (book_info["id"], )
             )
         elif "author" in book_info and "title" in book_info:
-            self.cursor.execute(
-                f'''SELECT * FROM {self.table_name} 
-                WHERE author = %s 
-                AND title = %s
-                ''', 
+            cursor = self._execute(
+                f"{statement}_by_key", 
                 (book_info["author"], book_info["title"])
             )
         else:
             # Invalid book_info format
             return None
-        return self.cursor.fetchone()
+        # A prepared cursor can't skip the rest of a result
+        rows = cursor.fetchall()
+        return rows[0] if rows else None
 
     
     def insert_book(self, book):
@@ -515,27 +1836,26 @@ class BookStoreMySQL(BookStore):
         Book object as an argument. The Book object contains the book
         title, author, and quantity in stock. It prints out id of the
         book inserted. If the book already exists, it prints a message
-        that the book already exists. If there is an error, it raises a
-        MySQLError'''
+        that the book already exists. INSERT IGNORE lets the unique key
+        decide, so the check and the insert are a single statement.
+        Returns an InsertResult saying whether the book was inserted and
+        its id. If there is an error, it raises a MySQLError'''
         try:
-            self.cursor.execute( 
-                f'''SELECT * FROM {self.table_name} 
-                WHERE title = %s 
-                AND author = %s 
-                ''', 
-                (book.title, book.author) 
+            cursor = self._execute(
+                "insert_book", 
+                (book.title, book.author, book.qty)
             ) 
-            if not self.cursor.fetchone(): 
-                self.cursor.execute( 
-                    f'''INSERT INTO {self.table_name} (title, author, qty) 
-                    VALUES (%s, %s, %s) 
-                    ''', 
-                    (book.title, book.author, book.qty) 
-                ) 
-                self.db.commit() 
-                print(f"\nBook entered with id: {self.cursor.lastrowid}") 
-            else: 
-                print("\nBook already exists")
+            inserted = cursor.rowcount == 1
+            self.db.commit() 
+            self._book_written({"title": book.title, "author": book.author})
+            if inserted:
+                self._book_added(
+                    cursor.lastrowid, book.title, book.author
+                )
+                print(f"\nBook entered with id: {cursor.lastrowid}") 
+                return InsertResult(True, cursor.lastrowid)
+            print("\nBook already exists")
+            return InsertResult(False, None)
         except MySQLError as e:
             self._handle_db_error(e) 
 
@@ -545,82 +1865,309 @@ class BookStoreMySQL(BookStore):
         an argument. The dictionary contains the book id, title, and
         author. If the book is found, it deletes the book and prints a
         message that the book was deleted successfully. If the book is
-        not found, it prints a message that the book was not found. If
-        there is an error, it raises a MySQLError.
+        not found, it prints a message that the book was not found. The
+        delete is a single statement and its affected row count tells
+        whether the book was found. MySQL can't return deleted rows, so
+        the DeleteResult it returns has no record. If there is an 
+        error, it raises a MySQLError.
         '''
         try:
-            # Inform user if book not found 
-            book_found = False 
-            
             if "id" in book_info: # If user provides the book id 
-                self.cursor.execute( 
-                    f'''SELECT * FROM {self.table_name} 
-                    WHERE id = %s 
-                    ''', 
-                    (book_info["id"], ) 
+                cursor = self._execute(
+                    "delete_book_by_id", 
+                    (book_info["id"], )
                 ) 
-                if self.cursor.fetchone(): # If book exists 
-                    book_found = True 
-                    self.cursor.execute( 
-                        f'''DELETE FROM {self.table_name} 
-                        WHERE id = %s 
-                        ''', 
-                        (book_info["id"], ) 
-                    ) 
             else: # If user provides the book author and title 
-                self.cursor.execute( 
-                    f'''SELECT * FROM {self.table_name}
-                    WHERE author = %s 
-                    AND title = %s 
-                    ''', 
-                    (book_info["author"], book_info["title"]) 
+                cursor = self._execute(
+                    "delete_book_by_key", 
+                    (book_info["author"], book_info["title"])
                 ) 
-                if self.cursor.fetchone(): # If book exists 
-                    book_found = True 
-                    self.cursor.execute( 
-                        f'''DELETE FROM {self.table_name}
-                        WHERE author = %s 
-                        AND title = %s 
-                        ''', 
-                        (book_info["author"], book_info["title"]) 
-                    ) 
-            
-            if book_found: 
-                self.db.commit() 
+            deleted = cursor.rowcount > 0
+            self.db.commit() 
+            self._book_written(book_info)
+            if deleted: 
                 print("\nBook deleted successfully") 
-            else: 
-                print("\nBook not found")
+                return DeleteResult(True, None)
+            print("\nBook not found")
+            return DeleteResult(False, None)
         except MySQLError as e:
             self._handle_db_error(e)  
 
 
-    def search_books(self, search_query):
-        '''Search the database against the user-provided input. If the 
-        book is found, it prints the book details and optionally that of 
-        other books that have a close match. If the book is not found, 
-        it prints a message that the book was not found. If there is an 
-        error, it raises a MySQLError'''
-
+    def apply_qty_deltas(self, deltas):
+        '''Apply many quantity changes, e.g. a received shipment, in
+        one transaction. deltas is an iterable of (book, delta) pairs
+        where book is an id or a (title, author) pair. The changes are
+        staged with a single executemany and applied with one UPDATE, 
+        summed per book. A book that is missing or whose quantity would
+        become negative is left unchanged and its items are reported as
+        failures. Returns a QtyDeltaResult. If there is an error, it 
+        raises a MySQLError.
+        '''
+        items, rows, failures = self._qty_delta_rows(deltas)
+        staging = f"{self.table_name}_qty_deltas"
+        totals = f"{self.table_name}_qty_totals"
         try:
+            # Temporary tables outlive a rollback, so drop any left over
+            # from a failed call
             self.cursor.execute(
-                f'''SELECT * FROM {self.table_name}
-                WHERE id LIKE %s 
-                OR title LIKE %s
-                OR author LIKE %s
+                f"DROP TEMPORARY TABLE IF EXISTS {totals}, {staging}"
+            )
+            self.cursor.execute(
+                f'''CREATE TEMPORARY TABLE {staging}(
+                    seq INT PRIMARY KEY,
+                    book_id INT NULL,
+                    title VARCHAR(255) 
+                    CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL,
+                    author VARCHAR(255) 
+                    CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL,
+                    delta INT NOT NULL
+                )
+                '''
+            )
+            self.cursor.executemany(
+                f'''INSERT INTO {staging} 
+                (seq, book_id, title, author, delta) 
+                VALUES (%s, %s, %s, %s, %s)
+                ''', 
+                rows
+            )
+            self.cursor.execute(
+                f'''UPDATE {staging} AS staged 
+                JOIN {self.table_name} AS book 
+                ON book.title = staged.title AND book.author = staged.author 
+                SET staged.book_id = book.id 
+                WHERE staged.book_id IS NULL
+                '''
+            )
+            # A temporary table can only be named once per query, so the
+            # per book totals get a table of their own
+            self.cursor.execute(
+                f'''CREATE TEMPORARY TABLE {totals}(PRIMARY KEY (book_id)) 
+                SELECT book_id, SUM(delta) AS delta FROM {staging} 
+                WHERE book_id IS NOT NULL 
+                GROUP BY book_id
+                '''
+            )
+            self.cursor.execute(
+                f'''SELECT staged.seq FROM {staging} AS staged 
+                LEFT JOIN {self.table_name} AS book 
+                ON book.id = staged.book_id 
+                WHERE book.id IS NULL 
+                ORDER BY staged.seq
+                '''
+            )
+            missing = self.cursor.fetchall()
+            # Lock the books so that the stock checked here is the stock
+            # the UPDATE changes
+            self.cursor.execute(
+                f'''SELECT book.id FROM {self.table_name} AS book 
+                JOIN {totals} AS total ON total.book_id = book.id 
+                FOR UPDATE
+                '''
+            )
+            self.cursor.fetchall()
+            self.cursor.execute(
+                f'''SELECT staged.seq, book.qty, total.delta 
+                FROM {staging} AS staged 
+                JOIN {totals} AS total ON total.book_id = staged.book_id 
+                JOIN {self.table_name} AS book ON book.id = staged.book_id 
+                WHERE book.qty + total.delta < 0 
+                ORDER BY staged.seq
+                '''
+            )
+            short = self.cursor.fetchall()
+            self.cursor.execute(
+                f'''UPDATE {self.table_name} AS book 
+                JOIN {totals} AS total ON total.book_id = book.id 
+                SET book.qty = book.qty + total.delta,
+                book.version = book.version + 1
+                WHERE book.qty + total.delta >= 0
+                '''
+            )
+            self.cursor.execute(f"DROP TEMPORARY TABLE {totals}, {staging}")
+            self.db.commit()
+            self._book_written()
+        except MySQLError as e:
+            self._handle_db_error(e)
+        failures.extend(self._qty_delta_failures(items, missing, short))
+        return QtyDeltaResult(len(items) - len(failures), failures)
+
+
+    def _streaming_cursor(self):
+        '''Return a cursor for iter_books. The cursor is unbuffered, so
+        the rows are read from the server as they are fetched'''
+        return self.db.cursor(buffered=False)
+
+
+    def _close_streaming_cursor(self, cursor):
+        '''Close a cursor of iter_books. The rows a caller stopped 
+        short of are read and dropped first, as the connection can't run
+        another statement before'''
+        self.db.consume_results()
+        cursor.close()
+
+
+    def _search_records(self, search_query, limit=None, after_id=None):
+        '''Return the books that match a search query (see 
+        BookStore._search_records), reconnecting once if the connection
+        was lost
+        '''
+        return self._retry_read(
+            super()._search_records, search_query, limit, after_id
+        )
+
+
+    def _id_search_statement(self, id_ranges, after_id=None, limit=None):
+        '''Return the SELECT statement and its parameters that look up
+        the books whose id falls in one of the (first, last) ranges. 
+        With a limit, it returns a page of at most limit books whose id
+        is above after_id'''
+        conditions = " OR ".join(["id BETWEEN %s AND %s"] * len(id_ranges))
+        params = tuple(bound for id_range in id_ranges for bound in id_range)
+        if limit is None:
+            return (
+                f'''SELECT id, title, author, qty FROM {self.table_name} 
+                WHERE {conditions} 
+                ORDER BY id
+                ''', 
+                params
+            )
+        return (
+            f'''SELECT id, title, author, qty FROM {self.table_name} 
+            WHERE ({conditions}) AND id > %s 
+            ORDER BY id 
+            LIMIT %s
+            ''', 
+            (*params, after_id or 0, limit)
+        )
+
+
+    def _search_statement(self, search_query, after_id=None, limit=None):
+        '''Return the SELECT statement and its parameters that search
+        the titles and authors with the current search engine. With a 
+        limit, it returns a page of at most limit books that follow the
+        book after_id: in order of relevance then id with the fulltext
+        engine, in id order otherwise'''
+        like_query = '%' + search_query + '%'
+        trigrams = self.trigrams(search_query)
+        paged = limit is not None
+
+        # Only books that have every trigram of the query can match.
+        # The trigram index narrows the candidates, LIKE verifies them
+        if self.search_engine == "trigram" and trigrams:
+            trigram_table = f"{self.table_name}_trigram"
+            placeholders = ", ".join(["%s"] * len(trigrams))
+            after = "AND book_id > %s" if paged else ""
+            page = "LIMIT %s" if paged else ""
+            return (
+                f'''SELECT book.id, book.title, book.author, book.qty 
+                FROM {self.table_name} AS book 
+                JOIN (
+                    SELECT book_id FROM {trigram_table} 
+                    WHERE trigram IN ({placeholders}) {after}
+                    GROUP BY book_id 
+                    HAVING COUNT(DISTINCT trigram) = %s
+                ) AS candidate 
+                ON candidate.book_id = book.id 
+                WHERE book.title LIKE %s 
+                OR book.author LIKE %s 
+                ORDER BY book.id
+                {page}
+                ''', 
+                (
+                    *trigrams, 
+                    *((after_id or 0, ) if paged else ()), 
+                    len(trigrams), 
+                    like_query, 
+                    like_query, 
+                    *((limit, ) if paged else ())
+                )
+            )
+
+        # The index narrows the candidates to the books with every 
+        # indexed word, LIKE checks the other words. Queries with no 
+        # indexed word are answered with LIKE alone
+        against, other_words = (
+            self.fulltext_terms(search_query, self.fulltext_min_token_size)
+            if self.search_engine == "fulltext" else ("", [])
+        )
+        if against:
+            match = "MATCH (title, author) AGAINST (%s IN BOOLEAN MODE)"
+            conditions = "".join(
+                " AND (title LIKE %s OR author LIKE %s)" for _ in other_words
+            )
+            like_params = tuple(
+                f"%{word}%" for word in other_words for _ in range(2)
+            )
+            # The books are ranked by relevance, then id. A page starts
+            # after the relevance and id of the book after_id
+            after, after_params = "", ()
+            if after_id:
+                after_relevance = (
+                    f"(SELECT {match} FROM {self.table_name} WHERE id = %s)"
+                )
+                after = (
+                    f'''AND (
+                        {match} < {after_relevance} 
+                        OR ({match} = {after_relevance} AND id > %s)
+                    )'''
+                )
+                after_params = (
+                    against, against, after_id, 
+                    against, against, after_id, after_id
+                )
+            return (
+                f'''SELECT id, title, author, qty FROM {self.table_name}
+                WHERE {match}{conditions} 
+                {after}
+                ORDER BY {match} DESC, id 
+                {"LIMIT %s" if paged else ""}
                 ''', 
                 (
-                    '%' + search_query + '%', 
-                    '%' + search_query + '%', 
-                    '%' + search_query + '%', 
+                    against, *like_params, *after_params, against, 
+                    *((limit, ) if paged else ())
                 )
             )
 
-            records = self.cursor.fetchall()
+        if paged:
+            return (
+                f'''SELECT id, title, author, qty FROM {self.table_name}
+                WHERE id > %s 
+                AND (title LIKE %s OR author LIKE %s) 
+                ORDER BY id 
+                LIMIT %s
+                ''', 
+                (after_id or 0, like_query, like_query, limit)
+            )
+        return (
+            f'''SELECT id, title, author, qty FROM {self.table_name}
+            WHERE title LIKE %s
+            OR author LIKE %s
+            ''', 
+            (like_query, like_query)
+        )
+
+
+    def search_books(self, search_query, limit=None, after_id=None):
+        '''Search the database against the user-provided input. If the 
+        book is found, it prints a page of at most limit books that 
+        follow the book after_id: the book details and optionally that 
+        of other books that have a close match. With the trigram search
+        engine, substring matches are looked up in the trigram index, and
+        with the fulltext engine, words in the FULLTEXT index, ranked by
+        relevance. 
+        Numeric queries are looked up by id first. If the book is not 
+        found, it prints a message that the book was not found. Returns
+        the SearchPage. If there is an error, it raises a MySQLError'''
+
+        try:
+            page = self.search_page(search_query, limit, after_id)
 
-            if not records:  # If book doesn't exist
+            if not page.books:  # If book doesn't exist
                 print("\nBook not found")
             else:  # Print the book details in a tabular format
-                headers = ["ID", "Title", "Author", "Quantity"]
-                print('\n', tabulate(records, headers))
+                TableRenderer(self.SEARCH_HEADERS).render(page.books)
+            return page
         except MySQLError as e:
             self._handle_db_error(e)
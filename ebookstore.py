@@ -20,25 +20,45 @@ from classes import BookStoreMySQL, BookStoreSqlite
 from functions import(
     get_book, get_book_info, get_book_update_info,
     get_book_search_query, return_to_menu, exit_utility, 
-    get_database_connection, get_table_records, parse_cli_args,
+    get_database_connection, iter_table_records, parse_cli_args,
+    apply_qty_deltas_utility, export_books_utility, search_books_utility,
+    print_search_results_utility,
 )
+from server import serve
 
 
 def main(): 
     args = parse_cli_args()  # Parse the command line arguments
 
-    table_records = []
+    table_records = None
 
-    if args.table_records:  # Read the table records from file provided 
-        get_table_records(table_records, args.table_records)
+    if args.table_records:  # Stream the table records from file provided 
+        table_records = iter_table_records(
+            args.table_records, args.rejects_file, 
+            workers=args.import_workers or os.cpu_count()
+        )
 
     # Get database connection parameters from various possible sources.
     database_connection_params, database_file = get_database_connection(args)
 
     if database_connection_params:  # Connect to MySQL database
+        if args.command == 'serve':
+            # A connection of the pool for every worker
+            database_connection_params.setdefault("pool_size", args.workers)
         try:
             book_store = BookStoreMySQL(
-                database_connection_params, args.table_name, table_records
+                database_connection_params, args.table_name, table_records, 
+                search_engine=args.search_engine, 
+                id_prefix_search=args.id_prefix_search, 
+                import_chunk_size=args.import_chunk_size, 
+                book_cache_size=args.book_cache_size, 
+                book_cache_ttl=args.book_cache_ttl, 
+                search_cache_size=args.search_cache_size, 
+                search_cache_ttl=args.search_cache_ttl, 
+                negative_cache_size=args.negative_cache_size, 
+                negative_cache_ttl=args.negative_cache_ttl, 
+                key_filter_max_bytes=args.key_filter_max_bytes, 
+                key_filter_error_rate=args.key_filter_error_rate
             )
         except Exception as e:
             logging.error(e)
@@ -49,7 +69,19 @@ def main():
             if os.path.dirname(database_file): 
                 os.makedirs(os.path.dirname(database_file), exist_ok=True)
             book_store = BookStoreSqlite(
-                database_file, args.table_name, table_records
+                database_file, args.table_name, table_records, 
+                search_engine=args.search_engine, 
+                id_prefix_search=args.id_prefix_search, 
+                import_chunk_size=args.import_chunk_size, 
+                bulk_load=args.bulk_load, 
+                book_cache_size=args.book_cache_size, 
+                book_cache_ttl=args.book_cache_ttl, 
+                search_cache_size=args.search_cache_size, 
+                search_cache_ttl=args.search_cache_ttl, 
+                negative_cache_size=args.negative_cache_size, 
+                negative_cache_ttl=args.negative_cache_ttl, 
+                key_filter_max_bytes=args.key_filter_max_bytes, 
+                key_filter_error_rate=args.key_filter_error_rate
             )
         except PermissionError:
             logging.error(
@@ -61,6 +93,45 @@ def main():
             logging.error(e) 
             sys.exit(1)
 
+    if args.command == 'apply-deltas':
+        try:
+            apply_qty_deltas_utility(book_store, args.qty_deltas_file)
+        except Exception as e:
+            logging.error(e)
+            sys.exit(1)
+        exit_utility(book_store, args.statement_stats)
+    elif args.command == 'export':
+        try:
+            export_books_utility(
+                book_store, args.export_file, args.export_format
+            )
+        except Exception as e:
+            logging.error(e)
+            sys.exit(1)
+        exit_utility(book_store, args.statement_stats)
+    elif args.command == 'search':
+        try:
+            print_search_results_utility(book_store, args.search_query)
+        except BrokenPipeError:
+            # The pager was closed before the end of the results. Point
+            # the standard output at devnull so it isn't flushed again
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+        except Exception as e:
+            logging.error(e)
+            sys.exit(1)
+        exit_utility(book_store, args.statement_stats)
+    elif args.command == 'serve':
+        try:
+            serve(
+                book_store, args.host, args.port, args.workers, 
+                args.keep_alive_timeout
+            )
+        except Exception as e:
+            logging.error(e)
+            sys.exit(1)
+        exit_utility(book_store, args.statement_stats)
+
     while True:
         try:
             menu_1 = input(
@@ -91,9 +162,14 @@ def main():
                 try:
                     # Get the book details from the user
                     book_info = get_book_info()
-                    
+
+                    # The update is refused if someone else changes the
+                    # book while the clerk types it
+                    version = book_store.book_version(book_info)
+
                     # Get the book details for update from the user
                     book_update_info = get_book_update_info(book_info)
+                    book_update_info["version"] = version
                     
                     # Update the book details in the database
                     book_store.update_book(book_update_info)
@@ -123,18 +199,17 @@ def main():
                     # Get the book details from the user
                     search_query = get_book_search_query()  
 
-                    # Search for the book details in the database
-                    book_store.search_books(search_query)
-                    
-                    # Return to main menu
-                    return_to_menu()
+                    # Show the matching books a page at a time
+                    search_books_utility(
+                        book_store, search_query, args.page_size
+                    )
                 except ValueError as e:
                     raise e
                 except Exception as e:
                     raise e
             elif menu_1 == '0':
                 # Exit the application
-                exit_utility(book_store) 
+                exit_utility(book_store, args.statement_stats) 
             else:
                 print("\nInvalid option. Please try again.")
         except ValueError as e:
@@ -0,0 +1,440 @@
+# Import the following if they are not already imported:
+try:
+    import json
+    import time
+    import queue
+    import logging
+    import threading
+    from concurrent.futures import Future, ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qsl, urlsplit
+    from cache import LRUCache, BloomFilter
+    from classes import Book, BookStoreSqlite
+    from abstract_classes import StockError, VersionConflictError
+except ImportError as e:
+    logging.error(f"Import error: {e}")
+    raise ImportError("Failed to import necessary modules")
+
+
+class HTTPError(Exception):
+    '''An error answered with an HTTP status and a JSON message'''
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def book_json(record):
+    '''Return an (id, title, author, qty) record as a JSON object'''
+    book_id, title, author, qty = record[:4]
+    return {"id": book_id, "title": title, "author": author, "qty": qty}
+
+
+class BookStoreRequestHandler(BaseHTTPRequestHandler):
+    '''Answer the JSON requests of BookStoreServer. A book is named by
+    /books/<id>, or by /books?title=...&author=...
+
+    GET    /books/<id>          Find a book
+    GET    /books/<id>/version  The version of a book, for PATCH
+    POST   /books               Insert {"title", "author", "qty"}
+    PATCH  /books/<id>          Update, with the fields of update_book:
+                                {"field": "quantity", "action": "add",
+                                "qty": 2}, {"field": "title",
+                                "new_title": ...} or {"field": "author",
+                                "new_author": ...}, each with an
+                                optional "version": the update is then
+                                refused with 409 if the book changed
+    DELETE /books/<id>          Delete a book
+    GET    /search?q=...        A page of search results, with limit
+                                and after_id, the id of the last
+                                book of the previous page
+    POST   /books/import        Insert {"books": [[id or null, title,
+                                author, qty], ...]}
+    POST   /qty-deltas          Apply {"deltas": [[id or [title,
+                                author], delta], ...]} in one
+                                transaction
+    GET    /stats               The cache and statement counters
+
+    Connections are kept alive between requests (HTTP/1.1) until they
+    are idle for the server's keep_alive_timeout. Every response has a
+    Server-Timing header with the time spent in the database (db) and
+    in total (total), in milliseconds
+    '''
+    protocol_version = "HTTP/1.1"
+    server_version = "ebookstore"
+    # The largest request body accepted, in bytes
+    MAX_BODY_SIZE = 16 * 1024 * 1024
+
+    def setup(self):
+        # Closes idle keep-alive connections, which hold a worker
+        self.timeout = self.server.keep_alive_timeout
+        super().setup()
+
+
+    def do_GET(self):
+        self._respond(self._get)
+
+
+    def do_POST(self):
+        self._respond(self._post)
+
+
+    def do_PATCH(self):
+        self._respond(self._patch)
+
+
+    def do_DELETE(self):
+        self._respond(self._delete)
+
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+
+    def _respond(self, route):
+        '''Answer a request with the (status, body) of route as JSON'''
+        start = time.perf_counter()
+        self.db_seconds = 0.0
+        try:
+            url = urlsplit(self.path)
+            self.query = dict(parse_qsl(url.query))
+            status, body = route(url.path.rstrip("/").split("/")[1:])
+        except HTTPError as e:
+            status, body = e.status, {"error": str(e)}
+        except (StockError, VersionConflictError) as e:
+            status, body = 409, {"error": str(e)}
+        except ValueError as e:
+            status, body = 400, {"error": str(e)}
+        except Exception as e:
+            logging.error(e)
+            status, body = 500, {"error": str(e)}
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header(
+            "Server-Timing",
+            f"db;dur={self.db_seconds * 1000:.3f}, "
+            f"total;dur={(time.perf_counter() - start) * 1000:.3f}"
+        )
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+    def _call(self, method, *args):
+        '''Run a BookStore method and add the time it took to the db
+        time of the request'''
+        start = time.perf_counter()
+        try:
+            return self.server.call(method, *args)
+        finally:
+            self.db_seconds += time.perf_counter() - start
+
+
+    def _json_body(self):
+        '''Return the JSON object of the request body'''
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.MAX_BODY_SIZE:
+            self.close_connection = True  # The body is left unread
+            raise HTTPError(413, "The request body is too large")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise HTTPError(400, "The request body isn't valid JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "The request body must be a JSON object")
+        return body
+
+
+    def _book_info(self, path):
+        '''Return the book_info of /books/<id> or of
+        /books?title=...&author=...'''
+        if len(path) == 2 and path[1].isdigit():
+            return {"id": int(path[1])}
+        if len(path) == 1 and "title" in self.query and (
+            "author" in self.query
+        ):
+            return {
+                "title": self.query["title"], "author": self.query["author"]
+            }
+        raise HTTPError(
+            400, "Name a book by /books/<id> or /books?title=...&author=..."
+        )
+
+
+    def _get(self, path):
+        if path[:1] == ["books"] and path[-1:] == ["version"]:
+            version = self._call("book_version", self._book_info(path[:-1]))
+            if version is None:
+                raise HTTPError(404, "Book not found")
+            return 200, {"version": version}
+        if path[:1] == ["books"]:
+            record = self._call("find_book", self._book_info(path))
+            if not record:
+                raise HTTPError(404, "Book not found")
+            return 200, book_json(record)
+        if path == ["search"]:
+            limit = int(self.query.get("limit") or 0) or None
+            after_id = int(self.query.get("after_id") or 0) or None
+            page = self._call(
+                "search_page", self.query.get("q", ""), limit, after_id
+            )
+            return 200, {
+                "books": [book_json(record) for record in page.books],
+                "has_more": page.has_more
+            }
+        if path == ["stats"]:
+            return 200, self.server.stats()
+        raise HTTPError(404, f"No such resource: {self.path}")
+
+
+    def _post(self, path):
+        body = self._json_body()
+        if path == ["books"]:
+            try:
+                book = Book(body["title"], body["author"], body["qty"])
+            except (KeyError, AttributeError):
+                raise HTTPError(
+                    400, "A book needs a title, an author and a qty"
+                )
+            result = self._call("insert_book", book)
+            if not result.inserted:
+                raise HTTPError(409, "Book already exists")
+            return 201, {"id": result.id}
+        if path == ["books", "import"]:
+            books = body.get("books", [])
+            if not isinstance(books, list):
+                raise HTTPError(
+                    400, "Expected books as [[id or null, title, author, qty]]"
+                )
+            records = []
+            for record in books:
+                try:
+                    book_id, title, author, qty = record
+                    Book(title, author, qty)
+                    # JSON true and false would pass as integers
+                    if isinstance(qty, bool) or book_id is not None and (
+                        type(book_id) is not int or book_id <= 0
+                    ):
+                        raise ValueError
+                except (TypeError, ValueError, AttributeError):
+                    raise HTTPError(
+                        400,
+                        f"Invalid book {record!r}: expected [id or null, "
+                        "title, author, qty], with a positive integer id "
+                        "and an integer qty of 0 or more"
+                    )
+                records.append((book_id, title, author, qty))
+            return 200, {"inserted": self._call("import_records", records)}
+        if path == ["qty-deltas"]:
+            try:
+                deltas = [
+                    (tuple(book) if isinstance(book, list) else book, delta)
+                    for book, delta in body.get("deltas", [])
+                ]
+            except (TypeError, ValueError):
+                raise HTTPError(
+                    400, "Expected deltas as [[id or [title, author], delta]]"
+                )
+            result = self._call("apply_qty_deltas", deltas)
+            return 200, {
+                "applied": result.applied, "failures": result.failures
+            }
+        raise HTTPError(404, f"No such resource: {self.path}")
+
+
+    def _patch(self, path):
+        body = self._json_body()
+        if path[:1] != ["books"]:
+            raise HTTPError(404, f"No such resource: {self.path}")
+        book_info = self._book_info(path)
+        field = body.get("field")
+        if field == "quantity":
+            if body.get("action") not in ("add", "sub", "set") or (
+                not isinstance(body.get("qty"), int) or body["qty"] < 0
+            ):
+                raise HTTPError(
+                    400,
+                    'A quantity update needs an action ("add", "sub" or '
+                    '"set") and a qty of 0 or more'
+                )
+            book_info.update(
+                field="quantity", action=body["action"], qty=body["qty"]
+            )
+        elif field in ("title", "author"):
+            value = body.get(f"new_{field}")
+            if not isinstance(value, str) or not value.strip():
+                raise HTTPError(400, f"The new {field} cannot be empty")
+            book_info.update({"field": field, f"new_{field}": value.strip()})
+        else:
+            raise HTTPError(
+                400, 'field must be "quantity", "title" or "author"'
+            )
+        if "version" in body:
+            if not isinstance(body["version"], int):
+                raise HTTPError(400, "version must be an integer")
+            book_info["version"] = body["version"]
+        if not self._call("update_book", book_info):
+            raise HTTPError(404, "Book not found")
+        return 200, {"updated": True}
+
+
+    def _delete(self, path):
+        if path[:1] != ["books"]:
+            raise HTTPError(404, f"No such resource: {self.path}")
+        result = self._call("delete_book", self._book_info(path))
+        if not result.deleted:
+            raise HTTPError(404, "Book not found")
+        return 200, {
+            "deleted": True,
+            "book": book_json(result.record) if result.record else None
+        }
+
+
+class BookStoreServer(HTTPServer):
+    '''An HTTP server answering JSON requests with a BookStore, so that
+    many terminals share one process, its connections and its caches.
+    Connections are handled by a pool of workers threads. When all are
+    busy, new connections wait in the listen backlog. An SQLite
+    connection belongs to the thread that opened it, so with
+    BookStoreSqlite every BookStore call is made by the thread that
+    runs serve, one at a time as SQLite writes are anyway.
+    BookStoreMySQL is called from the workers, each with a connection
+    of the pool, which it releases when its client disconnects
+    '''
+    # How many connections are handled at a time, and how long, in
+    # seconds, a kept-alive connection can be idle before it is closed
+    WORKERS = 8
+    KEEP_ALIVE_TIMEOUT = 5
+
+    def __init__(
+            self, address, book_store, workers=None, keep_alive_timeout=None
+        ):
+        self.book_store = book_store
+        self.workers = workers or self.WORKERS
+        self.keep_alive_timeout = (
+            keep_alive_timeout if keep_alive_timeout is not None
+            else self.KEEP_ALIVE_TIMEOUT
+        )
+        self.serialized = isinstance(book_store, BookStoreSqlite)
+        self._calls = queue.SimpleQueue()
+        self._calls_lock = threading.Lock()
+        self._stopped = False
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="BookStoreServer"
+        )
+        super().__init__(address, BookStoreRequestHandler)
+
+
+    def process_request(self, request, client_address):
+        '''Hand a connection to a worker, waiting for a free one'''
+        self._slots.acquire()
+        self._executor.submit(
+            self._process_request_thread, request, client_address
+        )
+
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            if not self.serialized:
+                self.book_store.release_connection()
+            self._slots.release()
+
+
+    def call(self, method, *args):
+        '''Run a BookStore method for a request handler and return its
+        result'''
+        if not self.serialized:
+            return getattr(self.book_store, method)(*args)
+        future = Future()
+        with self._calls_lock:
+            if self._stopped:
+                raise HTTPError(503, "The server is stopping")
+            self._calls.put((future, method, args))
+        return future.result()
+
+
+    def stats(self):
+        '''Return the counters of the caches and of the statements'''
+        stats = {}
+        for name in ("book_cache", "search_cache", "negative_cache"):
+            cache = getattr(self.book_store, name, None)
+            if isinstance(cache, LRUCache):
+                stats[name] = cache.stats()._asdict()
+        key_filter = getattr(self.book_store, "key_filter", None)
+        if isinstance(key_filter, BloomFilter):
+            stats["key_filter"] = key_filter.stats()._asdict()
+        stats["statements"] = {
+            name: statement._asdict()
+            for name, statement in self.call("statement_stats").items()
+        }
+        return stats
+
+
+    def serve(self):
+        '''Serve until shutdown is called or the process is interrupted.
+        With BookStoreSqlite, the calling thread, which must be the one
+        that opened the store, makes the BookStore calls of the workers
+        '''
+        if not self.serialized:
+            # The connection of the caller goes back to the pool
+            self.book_store.release_connection()
+            try:
+                self.serve_forever()
+            finally:
+                self.server_close()
+            return
+
+        listener = threading.Thread(target=self.serve_forever, daemon=True)
+        listener.start()
+        try:
+            while (item := self._calls.get()) is not None:
+                future, method, args = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(getattr(self.book_store, method)(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            super().shutdown()  # Returns at once if already shut down
+            # Calls still waiting are answered as the server stops
+            with self._calls_lock:
+                self._stopped = True
+                while not self._calls.empty():
+                    item = self._calls.get()
+                    if item is not None:
+                        item[0].set_exception(
+                            HTTPError(503, "The server is stopping")
+                        )
+            self.server_close()
+
+
+    def shutdown(self):
+        '''Stop serving, and stop serve once the listener has stopped'''
+        super().shutdown()
+        self._calls.put(None)
+
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False)
+
+
+def serve(book_store, host="127.0.0.1", port=8080, workers=None,
+          keep_alive_timeout=None):
+    '''Answer JSON requests with book_store on host:port until the
+    process is interrupted'''
+    server = BookStoreServer(
+        (host, port), book_store, workers, keep_alive_timeout
+    )
+    print(f"\nServing on http://{host}:{server.server_port}")
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        print("\nStopped serving")
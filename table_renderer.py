@@ -0,0 +1,222 @@
+# Import the following if they are not already imported:
+try:
+    import sys
+    import math
+    import logging
+    from itertools import islice
+except ImportError as e:
+    logging.error(f"Import error: {e}")
+    raise ImportError("Failed to import necessary modules")
+
+# Wide characters (e.g. CJK) take two columns when wcwidth is installed,
+# as they do in tabulate
+try:
+    from wcwidth import wcswidth
+except ImportError:
+    wcswidth = None
+
+
+class TableRenderer:
+    '''Write rows as a table, a row at a time, in the layout of
+    tabulate's "simple" format that search_books has always printed.
+    The column widths come from the headers and the first sample_size
+    rows, or from widths if given, so the table starts printing before
+    the rest of the rows are fetched. Text longer than max_width, or
+    than its column once the widths are set, is cut short with an
+    ellipsis. When every row fits in the sample and no text is longer
+    than max_width, the output is byte for byte what
+    print('\\n', tabulate(rows, headers)) prints. The table is written
+    to file, by default the standard output, so it can be piped to a
+    pager
+    '''
+    # Each column is at least this much wider than its header
+    MIN_PADDING = 2
+    ELLIPSIS = "…"
+    # The value_type of integer and float columns, which are right
+    # aligned on their decimal points
+    INT_TYPE = 2
+    FLOAT_TYPE = 3
+
+    def __init__(
+            self, headers, file=None, sample_size=100, max_width=60,
+            widths=None
+        ):
+        self.headers = [str(header) for header in headers]
+        self.file = file
+        self.sample_size = sample_size
+        self.max_width = max_width
+        self.widths = widths
+
+
+    @staticmethod
+    def text_width(text):
+        '''Return the number of terminal columns text takes, as 
+        tabulate counts them: with wcwidth installed, text with a 
+        control character such as a tab counts as -1'''
+        if wcswidth is not None:
+            return wcswidth(text)
+        return len(text)
+
+
+    @staticmethod
+    def value_type(value):
+        '''Return the type tabulate gives a value, as a number that 
+        grows with the generality of the type: 0 for None, 1 for a bool
+        (or the text True or False), 2 for an integer (or text that 
+        reads as one), 3 for a float (or text that reads as one, such as
+        1.5, 1e5 or inf) and 4 for anything else. A column takes the 
+        most general type of its values'''
+        if value is None:
+            return 0
+        if hasattr(value, "isoformat"):  # Dates and times
+            return 4
+        if isinstance(value, bool) or value in ("True", "False"):
+            return 1
+        if type(value) is int:
+            return 2
+        if isinstance(value, str):
+            try:
+                int(value)
+                return 2
+            except ValueError:
+                pass
+        try:
+            number = float(value)
+        except (TypeError, ValueError, OverflowError):
+            return 4
+        if isinstance(value, str) and not math.isfinite(number):
+            # Text such as 1e999 stays text
+            return 3 if value.lower() in ("inf", "-inf", "nan") else 4
+        return 3
+
+
+    @classmethod
+    def after_point(cls, text):
+        '''Return the number of characters after the decimal point, or
+        else the exponent, of text that reads as a float, or -1'''
+        if cls.value_type(text) != cls.FLOAT_TYPE:
+            return -1
+        point = text.rfind(".")
+        if point < 0:
+            point = text.lower().rfind("e")
+        return len(text) - point - 1 if point >= 0 else -1
+
+
+    def cell_text(self, value, column_type, decimals):
+        '''Return the text of a value in a column of column_type. Text
+        is stripped; numbers are padded on the right so that their 
+        decimal points line up with the decimals of the column, and 
+        floats are written in the general format'''
+        text = "" if value is None else str(value)
+        if column_type == self.FLOAT_TYPE and value is not None:
+            try:
+                text = format(float(value), "g")
+            except (TypeError, ValueError, OverflowError):
+                # A row past the sample that is not a float after all
+                pass
+        if column_type in (self.INT_TYPE, self.FLOAT_TYPE):
+            return text + " " * (decimals - self.after_point(text))
+        return text.strip()
+
+
+    def truncate(self, text, width):
+        '''Cut text that is wider than width short with an ellipsis'''
+        if self.text_width(text) <= width:
+            return text
+        cut, used = [], self.text_width(self.ELLIPSIS)
+        for char in text:
+            used += self.text_width(char)
+            if used > width:
+                break
+            cut.append(char)
+        return "".join(cut) + self.ELLIPSIS
+
+
+    def pad(self, text, width, numeric):
+        '''Align text in a column of width'''
+        padding = " " * max(width - self.text_width(text), 0)
+        return padding + text if numeric else text + padding
+
+
+    def format_row(self, row, widths, types, decimals):
+        '''Return a row of the table as a line of text'''
+        cells = []
+        for value, width, column_type, column_decimals in zip(
+            row, widths, types, decimals
+        ):
+            text = self.cell_text(value, column_type, column_decimals)
+            numeric = column_type in (self.INT_TYPE, self.FLOAT_TYPE)
+            if not numeric:
+                text = self.truncate(text, width)
+            cells.append(self.pad(text, width, numeric))
+        # tabulate drops the trailing spaces of each line
+        return "  ".join(cells).rstrip()
+
+
+    def render(self, rows):
+        '''Write the rows, any iterable of tuples such as a cursor or a
+        generator, as a table. Returns the number of rows written'''
+        file = self.file or sys.stdout
+        rows = iter(rows)
+        sample = list(islice(rows, self.sample_size))
+        columns = list(zip(*sample)) or [()] * len(self.headers)
+
+        # The type of a column is that of its values as far as the 
+        # sample shows, and so are the decimals its numbers line up on
+        types = [
+            max(map(self.value_type, column), default=1) 
+            for column in columns
+        ]
+        decimals = [
+            max(
+                (
+                    self.after_point(self.cell_text(value, column_type, -1))
+                    for value in column
+                ), 
+                default=-1
+            )
+            if column_type == self.FLOAT_TYPE else -1
+            for column, column_type in zip(columns, types)
+        ]
+        numeric = [
+            column_type in (self.INT_TYPE, self.FLOAT_TYPE) 
+            for column_type in types
+        ]
+        widths = self.widths
+        if widths is None:
+            widths = []
+            for header, column, column_type, column_decimals in zip(
+                self.headers, columns, types, decimals
+            ):
+                cells = [
+                    self.cell_text(value, column_type, column_decimals)
+                    for value in column
+                ]
+                text_width = max(map(self.text_width, cells), default=0)
+                if column_type not in (self.INT_TYPE, self.FLOAT_TYPE):
+                    if self.max_width:
+                        text_width = min(text_width, self.max_width)
+                widths.append(
+                    max(self.text_width(header) + self.MIN_PADDING, text_width)
+                )
+
+        lines = [
+            "  ".join(
+                self.pad(header, width, is_numeric)
+                for header, width, is_numeric in
+                zip(self.headers, widths, numeric)
+            ).rstrip(),
+            "  ".join("-" * width for width in widths),
+        ]
+        lines.extend(
+            self.format_row(row, widths, types, decimals) for row in sample
+        )
+        # The leading newline and space of print('\n', table)
+        file.write("\n " + "\n".join(lines) + "\n")
+
+        written = len(sample)
+        for row in rows:
+            file.write(self.format_row(row, widths, types, decimals) + "\n")
+            written += 1
+        file.flush()
+        return written
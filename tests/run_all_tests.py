@@ -18,6 +18,10 @@ import test_functions
 import test_classes
 import test_integration
 import test_abstract_classes
+import test_table_renderer
+import test_cache
+import test_async_bookstore
+import test_server
 
 
 def create_test_suite():
@@ -31,7 +35,11 @@ def create_test_suite():
         test_functions,
         test_classes,
         test_integration,
-        test_abstract_classes
+        test_abstract_classes,
+        test_table_renderer,
+        test_cache,
+        test_async_bookstore,
+        test_server
     ]
     
     for module in test_modules:
@@ -2,6 +2,7 @@
 Tests for abstract classes and error handling functionality.
 """
 
+import io
 import unittest
 from unittest.mock import patch
 import tempfile
@@ -83,6 +84,15 @@ class TestAbstractBookStore(unittest.TestCase):
         result = BookStore.get_update_qty_utility(book_info, record)
         self.assertEqual(result, 1999999)
 
+    def test_id_prefix_ranges(self):
+        """Test id prefixes are turned into primary key ranges."""
+        self.assertEqual(
+            BookStore.id_prefix_ranges("30", 3050),
+            [(30, 30), (300, 309), (3000, 3050)]
+        )
+        self.assertEqual(BookStore.id_prefix_ranges("7", 5), [])
+        self.assertEqual(BookStore.id_prefix_ranges("0", 100), [])
+
     def test_update_books_utility_quantity_field(self):
         """Test update_books_utility for quantity field."""
         temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
@@ -444,11 +454,11 @@ class TestEdgeCases(unittest.TestCase):
             bookstore.insert_book(test_book)
             
             # Search with empty string
-            with patch('builtins.print') as mock_print:
+            with patch('sys.stdout', new_callable=io.StringIO) as stdout:
                 bookstore.search_books("")
                 # Should find the book since empty string matches 
                 # everything with LIKE
-                self.assertTrue(mock_print.called)
+                self.assertIn("Test Book", stdout.getvalue())
             
             bookstore.db.close()
 
@@ -0,0 +1,181 @@
+"""
+Unit tests for the AsyncBookStore classes.
+Tests calls run on the worker threads, time out and are cancelled.
+"""
+
+import asyncio
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+import tempfile
+import os
+import sys
+
+# Add parent directory to path to import application modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_bookstore import AsyncBookStoreSqlite, AsyncBookStoreMySQL
+from classes import Book, BookStoreSqlite, BookStoreMySQL
+from abstract_classes import DeleteResult
+
+
+def slow_search(store, search_query, limit=None, after_id=None):
+    """Run a statement that takes minutes unless it is interrupted."""
+    store.cursor.execute(
+        '''WITH RECURSIVE counter(n) AS (
+            SELECT 1 UNION ALL SELECT n + 1 FROM counter
+        )
+        SELECT COUNT(*) FROM counter WHERE n < 1000000000000
+        '''
+    )
+    return store.cursor.fetchall()
+
+
+class TestAsyncBookStoreSqlite(unittest.IsolatedAsyncioTestCase):
+    """Test cases for AsyncBookStoreSqlite class."""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.temp_db.close()
+        self.db_path = self.temp_db.name
+        self.records = [(i, f"Book {i}", "Author", i) for i in range(1, 51)]
+        patcher = patch('builtins.print')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Clean up after each test."""
+        if os.path.exists(self.db_path):
+            os.unlink(self.db_path)
+
+    async def test_book_round_trip(self):
+        """Test every call reaches the database."""
+        async with AsyncBookStoreSqlite(self.db_path, workers=2) as store:
+            result = await store.insert_book(Book("Title", "Author", 5))
+            self.assertTrue(result.inserted)
+            self.assertEqual(
+                await store.find_book({"id": result.id}),
+                (result.id, "Title", "Author", 5)
+            )
+            self.assertEqual(await store.book_version({"id": result.id}), 0)
+            self.assertTrue(await store.update_book({
+                "id": result.id, "field": "quantity", "action": "sub",
+                "qty": 2, "version": 0
+            }))
+            page = await store.search_books("title")
+            self.assertEqual(page.books, [(result.id, "Title", "Author", 3)])
+            self.assertFalse(page.has_more)
+            self.assertEqual(
+                await store.delete_book({"id": result.id}),
+                DeleteResult(True, (result.id, "Title", "Author", 3))
+            )
+            self.assertIsNone(await store.find_book({"id": result.id}))
+        self.assertEqual(store._stores, [])
+
+    async def test_concurrent_clients(self):
+        """Test many coroutines share the worker connections."""
+        store = AsyncBookStoreSqlite(
+            self.db_path, table_records=self.records, workers=3
+        )
+        results = await asyncio.gather(*(
+            store.find_book({"id": book_id}) for book_id in range(1, 51)
+        ))
+        self.assertEqual(results, self.records)
+        self.assertLessEqual(len(store._stores), 3)
+        await store.close()
+
+    async def test_timeout_interrupts_the_statement(self):
+        """Test a call that times out stops its statement."""
+        store = AsyncBookStoreSqlite(
+            self.db_path, table_records=self.records, workers=1, timeout=0.2
+        )
+        with patch.object(BookStoreSqlite, '_search_records', slow_search):
+            started = time.monotonic()
+            with self.assertRaises(asyncio.TimeoutError):
+                await store.search_books("book")
+            # The worker is free again once the statement is interrupted
+            self.assertEqual(
+                await store.find_book({"id": 1}), (1, "Book 1", "Author", 1)
+            )
+            self.assertLess(time.monotonic() - started, 10)
+        await store.close()
+
+    async def test_cancelled_call_never_runs(self):
+        """Test a call cancelled while waiting for a worker is dropped."""
+        store = AsyncBookStoreSqlite(self.db_path, workers=1)
+        with patch.object(BookStoreSqlite, '_search_records', slow_search):
+            search = asyncio.create_task(store.search_books("book"))
+            insert = asyncio.create_task(
+                store.insert_book(Book("Title", "Author", 5))
+            )
+            await asyncio.sleep(0.1)
+            insert.cancel()
+            search.cancel()
+            for task in (insert, search):
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+        self.assertIsNone(
+            await store.find_book({"title": "Title", "author": "Author"})
+        )
+        await store.close()
+
+
+class TestAsyncBookStoreMySQL(unittest.IsolatedAsyncioTestCase):
+    """Test cases for AsyncBookStoreMySQL class."""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_params = {
+            "host": "localhost",
+            "database": "test_db",
+            "user": "test_user",
+            "password": "test_password"
+        }
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    async def test_workers_share_the_pool(self, mock_print, mock_connect):
+        """Test the pool has a connection per worker."""
+        mock_db = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value.fetchall.return_value = [
+            (1, "Title", "Author", 2)
+        ]
+
+        store = AsyncBookStoreMySQL(self.db_params, workers=3)
+        self.assertEqual(mock_connect.call_args.kwargs['pool_size'], 3)
+        # The connection of the constructor went back to the pool
+        mock_db.close.assert_called_once()
+        self.assertEqual(
+            await store.find_book({"id": 1}), (1, "Title", "Author", 2)
+        )
+        await store.close()
+        self.assertEqual(mock_db.close.call_count, 2)
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    async def test_timeout_kills_the_query(self, mock_print, mock_connect):
+        """Test a call that times out has its query killed."""
+        mock_db = MagicMock()
+        mock_db.connection_id = 42
+        mock_connect.return_value = mock_db
+
+        store = AsyncBookStoreMySQL(self.db_params, workers=1, timeout=0.1)
+        killed = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        store.store.kill_query = MagicMock(
+            side_effect=lambda _: loop.call_soon_threadsafe(killed.set)
+        )
+        with patch.object(
+            BookStoreMySQL, 'search_page', lambda *args: time.sleep(0.5)
+        ):
+            with self.assertRaises(asyncio.TimeoutError):
+                await store.search_books("book")
+            await asyncio.wait_for(killed.wait(), 5)
+        store.store.kill_query.assert_called_once_with(42)
+        await store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+Unit tests for the LRUCache class.
+Tests eviction, expiry and the counters.
+"""
+
+import unittest
+import os
+import sys
+
+# Add parent directory to path to import application modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import LRUCache, CacheStats, BloomFilter
+
+
+class FakeClock:
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+    """Test cases for LRUCache class."""
+
+    def test_get_and_put(self):
+        """Test cached values are returned and counted."""
+        cache = LRUCache(2)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("b", "missing"), "missing")
+        self.assertEqual(cache.stats(), CacheStats(1, 2, 0, 1, 2))
+
+    def test_least_recently_used_is_evicted(self):
+        """Test a full cache evicts the entry used longest ago."""
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats().evictions, 1)
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire(self):
+        """Test entries older than the time to live are missing."""
+        clock = FakeClock()
+        cache = LRUCache(2, ttl=10, clock=clock)
+        cache.put("a", 1)
+        clock.now = 9.9
+        self.assertEqual(cache.get("a"), 1)
+        clock.now = 10
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_pop_and_pop_matching(self):
+        """Test entries can be removed by key or by a predicate."""
+        cache = LRUCache(4)
+        for key in range(4):
+            cache.put(key, key * 10)
+        self.assertEqual(cache.pop(0), 0)
+        self.assertIsNone(cache.pop(0))
+        self.assertEqual(cache.pop_matching(lambda _, value: value > 10), 2)
+        self.assertEqual(cache.get(1), 10)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_invalid_size(self):
+        """Test a cache must hold at least one entry."""
+        with self.assertRaises(ValueError):
+            LRUCache(0)
+
+
+class TestBloomFilter(unittest.TestCase):
+    """Test cases for BloomFilter class."""
+
+    def test_added_keys_are_found(self):
+        """Test a key that was added is always reported."""
+        bloom = BloomFilter(1000)
+        keys = [(f"title {i}", "author") for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        self.assertEqual(bloom.stats().saved, 0)
+
+    def test_error_rate(self):
+        """Test missing keys are ruled out at about the error rate."""
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"book {i}")
+        false_positives = sum(f"other {i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+        stats = bloom.stats()
+        self.assertEqual(stats.checks, 10000)
+        self.assertEqual(stats.saved, 10000 - false_positives)
+        self.assertAlmostEqual(stats.error_rate, 0.01, delta=0.005)
+
+    def test_memory_cap(self):
+        """Test max_bytes caps the size of the filter."""
+        self.assertGreater(BloomFilter(100000).stats().size_bytes, 100000)
+        self.assertEqual(
+            BloomFilter(100000, max_bytes=4096).stats().size_bytes, 4096
+        )
+        with self.assertRaises(ValueError):
+            BloomFilter(100, error_rate=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,17 +3,23 @@ Unit and integration tests for BookStore classes (SQLite and MySQL).
 Tests database operations, error handling, and data validation.
 """
 
+import io
 import unittest
 from unittest.mock import patch, MagicMock
 import tempfile
 import os
 import sys
+import sqlite3
+import threading
+import mysql.connector
 
 # Add parent directory to path to import application modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from classes import Book, BookStoreSqlite, BookStoreMySQL
-from abstract_classes import BookStore
+from abstract_classes import (
+    BookStore, DeleteResult, InsertResult, VersionConflictError
+)
 
 
 class TestBookStoreSqlite(unittest.TestCase):
@@ -153,6 +159,26 @@ class TestBookStoreSqlite(unittest.TestCase):
             
             bookstore.db.close()
 
+    def test_insert_book_returns_result(self):
+        """Test insert_book reports inserted vs duplicate."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path)
+
+            result = bookstore.insert_book(self.test_book)
+            self.assertTrue(result.inserted)
+            self.assertEqual(
+                bookstore.find_book({"id": result.id})[1], 
+                self.test_book.title
+            )
+
+            # Duplicates differing only by case are rejected too
+            result = bookstore.insert_book(
+                Book("TEST TITLE", "test author", 3)
+            )
+            self.assertEqual(result, InsertResult(False, None))
+
+            bookstore.db.close()
+
     def test_find_book_by_id(self):
         """Test finding book by ID."""
         with patch('builtins.print'):
@@ -253,6 +279,34 @@ class TestBookStoreSqlite(unittest.TestCase):
             
             bookstore.db.close()
 
+    def test_delete_book_returns_deleted_row(self):
+        """Test delete_book is one DELETE returning the deleted row."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path)
+            book_id = bookstore.insert_book(self.test_book).id
+
+            statements = []
+            bookstore.db.set_trace_callback(statements.append)
+            result = bookstore.delete_book(
+                {"title": "TEST TITLE", "author": "test author"}
+            )
+            bookstore.db.set_trace_callback(None)
+
+            self.assertEqual(
+                result, 
+                DeleteResult(True, (book_id, "Test Title", "Test Author", 10))
+            )
+            self.assertEqual(
+                [s for s in statements if s.lstrip().startswith("SELECT")], 
+                []
+            )
+            self.assertEqual(
+                bookstore.delete_book({"id": book_id}), 
+                DeleteResult(False, None)
+            )
+
+            bookstore.db.close()
+
     def test_delete_book_not_found(self):
         """Test deleting non-existent book."""
         with patch('builtins.print') as mock_print:
@@ -404,6 +458,408 @@ class TestBookStoreSqlite(unittest.TestCase):
             
             bookstore.db.close()
 
+    def test_update_book_quantity_single_statement(self):
+        """Test quantity updates are one UPDATE without a prior SELECT."""
+        with patch('builtins.print') as mock_print:
+            bookstore = BookStoreSqlite(self.db_path)
+            book_id = bookstore.insert_book(self.test_book).id
+
+            statements = []
+            bookstore.db.set_trace_callback(statements.append)
+            updated = bookstore.update_book({
+                "id": book_id, "field": "quantity", "action": "sub", "qty": 4
+            })
+            bookstore.db.set_trace_callback(None)
+
+            self.assertTrue(updated)
+            self.assertEqual(
+                [s for s in statements if s.lstrip().startswith("SELECT")], 
+                []
+            )
+            self.assertEqual(bookstore.find_book({"id": book_id})[3], 6)
+            mock_print.assert_any_call("\nBook updated successfully")
+
+            bookstore.db.close()
+
+    def test_update_book_insufficient_stock(self):
+        """Test a subtraction beyond the stock is rejected unchanged."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path)
+            bookstore.insert_book(self.test_book)
+            book_info = {
+                "title": "test title", "author": "TEST AUTHOR",
+                "field": "quantity", "action": "sub", "qty": 11
+            }
+
+            with self.assertRaises(Exception) as context:
+                bookstore.update_book(book_info)
+            self.assertIn(
+                "You only have 10 of this book in stock, but you want to "
+                "reduce the stock by 11", 
+                str(context.exception)
+            )
+            self.assertEqual(bookstore.find_book(book_info)[3], 10)
+
+            bookstore.db.close()
+
+    def test_update_book_concurrent_sales(self):
+        """Test two terminals selling the same book lose no updates."""
+        with patch('builtins.print'):
+            terminal_1 = BookStoreSqlite(self.db_path)
+            book_id = terminal_1.insert_book(self.test_book).id
+            terminal_2 = BookStoreSqlite(self.db_path)
+
+            # Both terminals saw a stock of 10 before selling
+            self.assertEqual(terminal_1.find_book({"id": book_id})[3], 10)
+            self.assertEqual(terminal_2.find_book({"id": book_id})[3], 10)
+            sale = {"id": book_id, "field": "quantity", "action": "sub", "qty": 3}
+            terminal_1.update_book(dict(sale))
+            terminal_2.update_book(dict(sale))
+
+            self.assertEqual(terminal_1.find_book({"id": book_id})[3], 4)
+
+            terminal_1.db.close()
+            terminal_2.db.close()
+
+    def test_update_book_version_conflict(self):
+        """Test an edit made with a stale version is refused."""
+        with patch('builtins.print'):
+            clerk_1 = BookStoreSqlite(self.db_path)
+            book_id = clerk_1.insert_book(self.test_book).id
+            clerk_2 = BookStoreSqlite(self.db_path)
+
+            # Both clerks chose the book before either changed it
+            version = clerk_1.book_version({"id": book_id})
+            self.assertEqual(version, 0)
+            self.assertEqual(clerk_2.book_version({"id": book_id}), 0)
+            self.assertTrue(clerk_2.update_book({
+                "id": book_id, "field": "title", "new_title": "Title 2",
+                "version": version
+            }))
+            with self.assertRaises(VersionConflictError):
+                clerk_1.update_book({
+                    "id": book_id, "field": "title", "new_title": "Title 1",
+                    "version": version
+                })
+            self.assertEqual(clerk_1.find_book({"id": book_id})[1], "Title 2")
+
+            # A sale doesn't depend on the stock read, so it is retried
+            self.assertTrue(clerk_1.update_book({
+                "title": "title 2", "author": "test author",
+                "field": "quantity", "action": "sub", "qty": 3,
+                "version": version
+            }))
+            self.assertEqual(clerk_1.find_book({"id": book_id})[3], 7)
+            self.assertEqual(clerk_1.book_version({"id": book_id}), 2)
+            self.assertIsNone(clerk_1.book_version({"id": book_id + 1}))
+
+            clerk_1.db.close()
+            clerk_2.db.close()
+
+    def test_update_book_optimistic_concurrency(self):
+        """Test clerks updating one book at once lose no updates."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path)
+            book_id = bookstore.insert_book(self.test_book).id
+            bookstore.db.close()
+
+            applied = []
+            conflicts = []
+
+            def clerk():
+                store = BookStoreSqlite(self.db_path)
+                for _ in range(25):
+                    version = store.book_version({"id": book_id})
+                    try:
+                        store.update_book({
+                            "id": book_id, "field": "quantity",
+                            "action": "add", "qty": 1, "version": version
+                        })
+                        applied.append(1)
+                    except VersionConflictError:
+                        conflicts.append(1)
+                store.db.close()
+
+            clerks = [threading.Thread(target=clerk) for _ in range(4)]
+            for thread in clerks:
+                thread.start()
+            for thread in clerks:
+                thread.join()
+
+            bookstore = BookStoreSqlite(self.db_path)
+            self.assertEqual(len(applied) + len(conflicts), 100)
+            # Every update applied is counted once in the stock and in
+            # the version
+            self.assertEqual(
+                bookstore.find_book({"id": book_id})[3], 10 + len(applied)
+            )
+            self.assertEqual(
+                bookstore.book_version({"id": book_id}), len(applied)
+            )
+            bookstore.db.close()
+
+    def test_find_book_cache(self):
+        """Test the book cache serves books found by id or by key."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path, book_cache_size=10)
+            book_id = bookstore.insert_book(self.test_book).id
+
+        with patch.object(
+            bookstore, '_fetch_book', wraps=bookstore._fetch_book
+        ) as mock_fetch:
+            record = bookstore.find_book({"id": book_id})
+            # Cached under both keys, whatever the case of the key
+            self.assertEqual(bookstore.find_book({"id": book_id}), record)
+            self.assertEqual(
+                bookstore.find_book(
+                    {"title": "TEST TITLE", "author": "test author"}
+                ), 
+                record
+            )
+            # Missing books aren't cached
+            bookstore.find_book({"id": book_id + 1})
+            bookstore.find_book({"id": book_id + 1})
+        self.assertEqual(mock_fetch.call_count, 3)
+        stats = bookstore.book_cache.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.size), (2, 3, 2))
+
+        bookstore.db.close()
+
+    def test_book_cache_invalidated_by_writes(self):
+        """Test writes through the BookStore invalidate cached books."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path, book_cache_size=10)
+            book_id = bookstore.insert_book(self.test_book).id
+            by_key = {"title": "Test Title", "author": "Test Author"}
+
+            # Changed by id, cached by key
+            bookstore.find_book(dict(by_key))
+            bookstore.update_book(
+                {"id": book_id, "field": "quantity", "action": "add", "qty": 5}
+            )
+            self.assertEqual(bookstore.find_book(dict(by_key))[3], 15)
+
+            # Changed by key, cached by id and key
+            bookstore.find_book({"id": book_id})
+            bookstore.update_book(
+                dict(by_key, field="title", new_title="New Title")
+            )
+            self.assertEqual(bookstore.find_book({"id": book_id})[1], "New Title")
+            self.assertIsNone(bookstore.find_book(dict(by_key)))
+
+            bookstore.apply_qty_deltas([(book_id, -5)])
+            self.assertEqual(bookstore.find_book({"id": book_id})[3], 10)
+
+            bookstore.delete_book({"id": book_id})
+            self.assertIsNone(bookstore.find_book({"id": book_id}))
+            self.assertEqual(len(bookstore.book_cache), 0)
+
+            bookstore.db.close()
+
+    def test_search_cache(self):
+        """Test repeated searches are served from the search cache."""
+        records = [
+            (1, "Great Expectations", "Charles Dickens", 3),
+            (2, "Bleak House", "Charles Dickens", 5),
+        ]
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=records, search_cache_size=10
+            )
+
+        with patch.object(
+            bookstore, '_search_records', wraps=bookstore._search_records
+        ) as mock_search:
+            first = bookstore.search("charles  DICKENS")
+            self.assertEqual(first, records)
+            # Spaces and the case of ASCII letters don't matter
+            self.assertEqual(bookstore.search(" Charles Dickens "), records)
+            self.assertEqual(mock_search.call_count, 1)
+            # Other pages are cached on their own
+            self.assertEqual(
+                bookstore.search("charles dickens", after_id=1), records[1:]
+            )
+            self.assertEqual(mock_search.call_count, 2)
+        self.assertEqual(bookstore.search_cache.stats().hits, 1)
+
+        bookstore.db.close()
+
+    def test_search_cache_follows_writes(self):
+        """Test cached searches aren't used once the books change."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path, search_cache_size=10)
+            bookstore.insert_book(self.test_book)
+            self.assertEqual(len(bookstore.search("test")), 1)
+
+            # A write through the BookStore
+            bookstore.insert_book(Book("Test Two", "Test Author", 2))
+            self.assertEqual(len(bookstore.search("test")), 2)
+
+            # A write by another connection
+            other = BookStoreSqlite(self.db_path)
+            other.delete_book({"title": "Test Two", "author": "Test Author"})
+            other.db.close()
+            self.assertEqual(len(bookstore.search("test")), 1)
+
+            self.assertEqual(len(bookstore.search("test title")), 1)
+            bookstore.update_book(
+                {"id": 1, "field": "title", "new_title": "Renamed"}
+            )
+            self.assertEqual(bookstore.search("test title"), [])
+            bookstore.import_records([(None, "Test Three", "Author", 1)])
+            self.assertEqual(len(bookstore.search("test")), 2)
+            bookstore.apply_qty_deltas([(1, 4)])
+            self.assertEqual(bookstore.search("renamed")[0][3], 14)
+
+            bookstore.db.close()
+
+    def test_normalize_search_query(self):
+        """Test the search cache form of queries."""
+        self.assertEqual(
+            BookStore.normalize_search_query("  Great   Gatsby "), 
+            "Great Gatsby"
+        )
+        self.assertEqual(
+            BookStore.search_cache_query("Great Gatsby"), "great gatsby"
+        )
+        # SQLite's LIKE matches the case of letters that aren't ASCII
+        self.assertEqual(BookStore.search_cache_query("Émile"), "Émile")
+
+    def test_negative_lookups(self):
+        """Test missing books are ruled out without a query."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=self.test_records, 
+                negative_cache_size=10, key_filter_max_bytes=4096
+            )
+        missing = {"title": "Missing Book", "author": "Nobody"}
+        with patch.object(
+            bookstore, '_fetch_book', wraps=bookstore._fetch_book
+        ) as mock_fetch:
+            self.assertIsNone(bookstore.find_book(dict(missing)))
+            self.assertIsNone(bookstore.find_book({"id": 99}))
+            self.assertIsNone(bookstore.find_book({"id": 99}))
+            # Books that exist are still found, whatever their case
+            self.assertIsNotNone(
+                bookstore.find_book({"title": "BOOK 1", "author": "author 1"})
+            )
+        self.assertEqual(mock_fetch.call_count, 2)
+        self.assertGreaterEqual(bookstore.key_filter.stats().saved, 1)
+        self.assertEqual(bookstore.negative_cache.stats().hits, 1)
+
+        with patch('builtins.print'):
+            # Added through the BookStore
+            book_id = bookstore.insert_book(
+                Book("Missing Book", "Nobody", 1)
+            ).id
+            self.assertIsNotNone(bookstore.find_book(dict(missing)))
+            bookstore.update_book(
+                {"id": book_id, "field": "title", "new_title": "Found Book"}
+            )
+            self.assertIsNotNone(
+                bookstore.find_book(
+                    {"title": "found book", "author": "NOBODY"}
+                )
+            )
+            bookstore.import_records([(99, "Imported", "Author", 1)])
+            self.assertIsNotNone(bookstore.find_book({"id": 99}))
+            self.assertIsNotNone(
+                bookstore.find_book({"title": "Imported", "author": "Author"})
+            )
+
+        bookstore.db.close()
+
+    def test_negative_lookups_follow_other_connections(self):
+        """Test books added by another connection are found."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, negative_cache_size=10, 
+                key_filter_max_bytes=4096
+            )
+            self.assertIsNone(bookstore.find_book({"id": 1}))
+            by_key = {"title": "Test Title", "author": "Test Author"}
+            self.assertIsNone(bookstore.find_book(dict(by_key)))
+            other = BookStoreSqlite(self.db_path)
+            other.insert_book(self.test_book)
+            other.db.close()
+
+            self.assertIsNotNone(bookstore.find_book({"id": 1}))
+            # The stale filter was rebuilt recently, so the database is 
+            # asked until it can be rebuilt again
+            self.assertIsNotNone(bookstore.find_book(dict(by_key)))
+            # Then it is rebuilt in the background, on a connection of
+            # its own
+            bookstore.KEY_FILTER_REBUILD_INTERVAL = 0
+            other = {"title": "Other", "author": "Author"}
+            self.assertIsNone(bookstore.find_book(dict(other)))
+            bookstore._key_filter_thread.join()
+            self.assertFalse(bookstore.key_filter_stale)
+            self.assertIn(("test title", "test author"), bookstore.key_filter)
+
+            # The data version is only read when the filter rules a 
+            # book out
+            with patch.object(
+                bookstore, '_external_generation', 
+                wraps=bookstore._external_generation
+            ) as mock_generation, patch.object(
+                bookstore, '_fetch_book', wraps=bookstore._fetch_book
+            ) as mock_fetch:
+                self.assertIsNotNone(bookstore.find_book(dict(by_key)))
+                mock_generation.assert_not_called()
+                self.assertIsNone(bookstore.find_book(dict(other)))
+                mock_generation.assert_called_once()
+                self.assertEqual(mock_fetch.call_count, 1)
+
+            bookstore.db.close()
+
+    def test_statement_registry(self):
+        """Test statements are compiled once per table and counted."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path)
+            other = BookStoreSqlite(self.db_path)
+            custom = BookStoreSqlite(self.db_path, table_name='custom')
+            self.assertIs(
+                bookstore.statements["select_book_by_id"], 
+                other.statements["select_book_by_id"]
+            )
+            self.assertIn(
+                "FROM custom ", custom.statements["select_book_by_id"]
+            )
+
+            book_id = bookstore.insert_book(self.test_book).id
+            for _ in range(3):
+                bookstore.find_book({"id": book_id})
+            bookstore.search("Test")
+            stats = bookstore.statement_stats()
+            self.assertEqual(stats["insert_book"].executions, 1)
+            self.assertEqual(stats["select_book_by_id"].executions, 3)
+            self.assertEqual(stats["search"].executions, 1)
+            self.assertGreater(stats["select_book_by_id"].seconds, 0)
+            self.assertEqual(other.statement_stats(), {})
+
+            for store in (bookstore, other, custom):
+                store.db.close()
+
+    def test_book_cache_stale_stock(self):
+        """Test a sale checks the stock in the database, not the cache."""
+        with patch('builtins.print'):
+            terminal_1 = BookStoreSqlite(self.db_path, book_cache_size=10)
+            book_id = terminal_1.insert_book(self.test_book).id
+            terminal_2 = BookStoreSqlite(self.db_path)
+
+            self.assertEqual(terminal_1.find_book({"id": book_id})[3], 10)
+            terminal_2.update_book(
+                {"id": book_id, "field": "quantity", "action": "sub", "qty": 8}
+            )
+            sale = {"id": book_id, "field": "quantity", "action": "sub", "qty": 5}
+            with self.assertRaises(Exception) as context:
+                terminal_1.update_book(sale)
+            self.assertIn("only have 2 of this book", str(context.exception))
+            self.assertEqual(terminal_1.find_book({"id": book_id})[3], 2)
+
+            terminal_1.db.close()
+            terminal_2.db.close()
+
     def test_database_error_handling(self):
         """Test database error handling."""
         with patch('builtins.print'):
@@ -433,134 +889,878 @@ class TestBookStoreSqlite(unittest.TestCase):
             
             bookstore.db.close()
 
+    def test_casefold_key_columns(self):
+        """Test title and author are stored with casefolded keys."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path)
+            bookstore.insert_book(Book("Straße", "Ünïcode Author", 3))
+
+            bookstore.cursor.execute(
+                "SELECT title_key, author_key FROM book"
+            )
+            self.assertEqual(
+                bookstore.cursor.fetchone(), ("strasse", "ünïcode author")
+            )
 
-class TestBookStoreMySQL(unittest.TestCase):
-    """Test cases for BookStoreMySQL class."""
+            # Caseless lookups match through the keys
+            result = bookstore.find_book(
+                {"title": "STRASSE", "author": "ÜNÏCODE AUTHOR"}
+            )
+            self.assertIsNotNone(result)
+            self.assertEqual(len(result), 4)
 
-    def setUp(self):
-        """Set up test fixtures before each test method."""
-        self.db_params = {
-            'host': 'localhost',
-            'database': 'test_db',
-            'user': 'test_user',
-            'password': 'test_pass',
-            'port': '3306'
-        }
-        self.test_book = Book("Test Title", "Test Author", 10)
+            bookstore.db.close()
 
-    @patch('mysql.connector.connect')
-    @patch('builtins.print')
-    def test_bookstore_mysql_initialization(self, mock_print, mock_connect):
-        """Test successful BookStoreMySQL initialization."""
-        mock_db = MagicMock()
-        mock_cursor = MagicMock()
-        mock_connect.return_value = mock_db
-        mock_db.cursor.return_value = mock_cursor
-        
-        bookstore = BookStoreMySQL(self.db_params)
-        
-        self.assertEqual(bookstore.table_name, 'book')
-        mock_connect.assert_called_once_with(
-            host='localhost',
-            database='test_db',
-            user='test_user',
-            password='test_pass',
-            port='3306'
+    def test_unique_index_uses_binary_collation(self):
+        """Test the uniqueness constraint no longer needs the Python
+        collation."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path)
+            bookstore.db.close()
+
+        # A plain connection, without UNICODE_NOCASE registered, can use
+        # the table and its indexes
+        db = sqlite3.connect(self.db_path)
+        db.execute(
+            "INSERT INTO book (title, author, qty, title_key, author_key) "
+            "VALUES ('A', 'B', 1, 'a', 'b')"
         )
-        mock_cursor.execute.assert_called()
-        mock_db.commit.assert_called()
+        with self.assertRaises(sqlite3.IntegrityError):
+            db.execute(
+                "INSERT INTO book (title, author, qty, title_key, author_key) "
+                "VALUES ('a', 'b', 1, 'a', 'b')"
+            )
+        db.close()
 
-    @patch('mysql.connector.connect')
-    @patch('builtins.print')
-    def test_bookstore_mysql_custom_table(self, mock_print, mock_connect):
-        """Test BookStoreMySQL initialization with custom table name."""
-        mock_db = MagicMock()
-        mock_cursor = MagicMock()
-        mock_connect.return_value = mock_db
-        mock_db.cursor.return_value = mock_cursor
-        
-        custom_table = "custom_books"
-        bookstore = BookStoreMySQL(self.db_params, custom_table)
-        
-        self.assertEqual(bookstore.table_name, custom_table)
+    def test_migrate_table_without_casefold_keys(self):
+        """Test tables created before the key columns are migrated."""
+        db = sqlite3.connect(self.db_path)
+        db.create_collation(
+            "UNICODE_NOCASE", BookStoreSqlite.unicode_nocase_collation
+        )
+        db.execute(
+            '''CREATE TABLE book(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title VARCHAR(255) COLLATE UNICODE_NOCASE NOT NULL,
+                author VARCHAR(255) COLLATE UNICODE_NOCASE NOT NULL,
+                qty INT NOT NULL,
+                CONSTRAINT book_table_key
+                UNIQUE (title, author)
+            )'''
+        )
+        db.executemany(
+            "INSERT INTO book (id, title, author, qty) VALUES (?, ?, ?, ?)",
+            [(1, "Book 1", "Author 1", 5), (7, "Book 2", "Author 2", 15)]
+        )
+        db.execute("DELETE FROM book WHERE id = 7")
+        db.commit()
+        db.close()
 
-    @patch('mysql.connector.connect')
-    @patch('builtins.print')
-    def test_insert_book_mysql_success(self, mock_print, mock_connect):
-        """Test successful book insertion in MySQL."""
-        mock_db = MagicMock()
-        mock_cursor = MagicMock()
-        mock_connect.return_value = mock_db
-        mock_db.cursor.return_value = mock_cursor
-        mock_cursor.fetchone.return_value = None  # Book doesn't exist
-        mock_cursor.lastrowid = 123
-        
-        bookstore = BookStoreMySQL(self.db_params)
-        bookstore.insert_book(self.test_book)
-        
-        # Verify insert was called
-        insert_calls = [
-            arg for arg in mock_cursor.execute.call_args_list 
-            if 'INSERT INTO' in str(arg)
-        ]
-        self.assertTrue(len(insert_calls) > 0)
-        mock_print.assert_any_call("\nBook entered with id: 123")
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path)
 
-    @patch('mysql.connector.connect')
-    @patch('builtins.print')
-    def test_insert_book_mysql_duplicate(self, mock_print, mock_connect):
-        """Test inserting duplicate book in MySQL."""
-        mock_db = MagicMock()
-        mock_cursor = MagicMock()
-        mock_connect.return_value = mock_db
-        mock_db.cursor.return_value = mock_cursor
-        # Book exists
-        mock_cursor.fetchone.return_value = (1, "Test Title", "Test Author", 10)  
-        
-        bookstore = BookStoreMySQL(self.db_params)
-        bookstore.insert_book(self.test_book)
-        
-        mock_print.assert_any_call("\nBook already exists")
+            result = bookstore.find_book(
+                {"title": "book 1", "author": "AUTHOR 1"}
+            )
+            self.assertEqual(result, (1, "Book 1", "Author 1", 5))
 
-    @patch('mysql.connector.connect')
-    @patch('builtins.print')
-    def test_find_book_mysql_by_id(self, mock_print, mock_connect):
-        """Test finding book by ID in MySQL."""
-        mock_db = MagicMock()
-        mock_cursor = MagicMock()
-        mock_connect.return_value = mock_db
-        mock_db.cursor.return_value = mock_cursor
-        mock_cursor.fetchone.return_value = (1, "Test Title", "Test Author", 10)
-        
-        bookstore = BookStoreMySQL(self.db_params)
-        book_info = {"id": 1}
-        result = bookstore.find_book(book_info)
-        
-        self.assertEqual(result, (1, "Test Title", "Test Author", 10))
+            # The AUTOINCREMENT counter survives the rebuild
+            bookstore.insert_book(self.test_book)
+            self.assertEqual(bookstore.cursor.lastrowid, 8)
 
-    @patch('mysql.connector.connect')
-    @patch('builtins.print')
-    def test_delete_book_mysql_success(self, mock_print, mock_connect):
-        """Test successful book deletion in MySQL."""
-        mock_db = MagicMock()
-        mock_cursor = MagicMock()
-        mock_connect.return_value = mock_db
-        mock_db.cursor.return_value = mock_cursor
-        mock_cursor.fetchone.return_value = (1, "Test Title", "Test Author", 10)
-        
-        bookstore = BookStoreMySQL(self.db_params)
-        book_info = {"id": 1}
-        bookstore.delete_book(book_info)
-        
-        mock_print.assert_any_call("\nBook deleted successfully")
+            bookstore.db.close()
 
-    @patch('mysql.connector.connect')
-    @patch('builtins.print')
-    def test_search_books_mysql_found(self, mock_print, mock_connect):
-        """Test searching books with results in MySQL."""
-        mock_db = MagicMock()
-        mock_cursor = MagicMock()
-        mock_connect.return_value = mock_db
+    def test_migrate_table_without_version(self):
+        """Test tables created before the version column are migrated."""
+        db = sqlite3.connect(self.db_path)
+        db.execute(
+            '''CREATE TABLE book(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title VARCHAR(255) NOT NULL,
+                author VARCHAR(255) NOT NULL,
+                qty INT NOT NULL,
+                title_key VARCHAR(255) NOT NULL,
+                author_key VARCHAR(255) NOT NULL
+            )'''
+        )
+        db.execute(
+            '''INSERT INTO book (title, author, qty, title_key, author_key)
+            VALUES ('Book 1', 'Author 1', 5, 'book 1', 'author 1')'''
+        )
+        db.commit()
+        db.close()
+
+        with patch('builtins.print') as mock_print:
+            bookstore = BookStoreSqlite(self.db_path)
+            mock_print.assert_any_call(
+                "\nAdded a version column to table book"
+            )
+
+            self.assertEqual(bookstore.book_version({"id": 1}), 0)
+            bookstore.update_book({
+                "id": 1, "field": "quantity", "action": "add", "qty": 1,
+                "version": 0
+            })
+            self.assertEqual(bookstore.book_version({"id": 1}), 1)
+
+            bookstore.db.close()
+
+
+    def test_search_books_numeric_query_uses_primary_key(self):
+        """Test numeric queries are answered by a primary key lookup."""
+        records = [
+            (3001, "A Tale of Two Cities", "Charles Dickens", 30),
+            (3002, "Room 3001", "Some Author", 4),
+        ]
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path, table_records=records)
+
+        statement, params = bookstore._id_search_statement([(3001, 3001)])
+        bookstore.cursor.execute("EXPLAIN QUERY PLAN " + statement, params)
+        plan = " ".join(str(row[-1]) for row in bookstore.cursor.fetchall())
+        self.assertIn("INTEGER PRIMARY KEY", plan)
+
+        # The book with that id wins over titles containing the digits
+        self.assertEqual(
+            bookstore._search_records("3001"), [records[0]]
+        )
+
+        # Without a book of that id, titles and authors are searched
+        self.assertEqual(bookstore._search_records("3003"), [])
+        self.assertEqual(bookstore._search_records("Room 30"), [records[1]])
+
+        bookstore.db.close()
+
+    def test_search_books_text_query_skips_id(self):
+        """Test text queries don't match ids."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=[(12, "Book", "Author", 1)]
+            )
+            self.assertEqual(bookstore._search_records("12 "), [])
+
+            with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+                bookstore.search_books("12")
+            self.assertIn("Book", stdout.getvalue())
+
+            bookstore.db.close()
+
+    def test_search_books_id_prefix_search(self):
+        """Test the opt-in id prefix search."""
+        records = [
+            (3, "Book 3", "Author", 1),
+            (30, "Book 30", "Author", 1),
+            (305, "Book 305", "Author", 1),
+            (3050, "Book 3050", "Author", 1),
+            (4000, "Book 4000", "Author", 1),
+        ]
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=records, id_prefix_search=True
+            )
+
+        ids = [record[0] for record in bookstore._search_records("30")]
+        self.assertEqual(ids, [30, 305, 3050])
+
+        # Leading zeros are only looked up exactly
+        self.assertEqual(bookstore._search_records("03"), [records[0]])
+
+        bookstore.db.close()
+
+    def test_search_keyset_pagination(self):
+        """Test search returns pages of books in id order."""
+        records = [(i, f"The Book {i}", "Author", i) for i in range(1, 8)]
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=records, id_prefix_search=True
+            )
+
+        first = bookstore.search("the", limit=3)
+        self.assertEqual([book[0] for book in first], [1, 2, 3])
+        second = bookstore.search("the", limit=3, after_id=first[-1][0])
+        self.assertEqual([book[0] for book in second], [4, 5, 6])
+        self.assertEqual(
+            bookstore.search("the", limit=3, after_id=6), [records[6]]
+        )
+
+        # Paging through id matches doesn't fall back to a title search
+        self.assertEqual(bookstore.search("1", limit=1), [records[0]])
+        self.assertEqual(bookstore.search("1", limit=1, after_id=1), [])
+
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            page = bookstore.search_books("book", limit=5)
+        self.assertTrue(page.has_more)
+        self.assertEqual(len(page.books), 5)
+        self.assertIn("The Book 5", stdout.getvalue())
+        self.assertNotIn("The Book 6", stdout.getvalue())
+
+        bookstore.db.close()
+
+    def test_import_records_in_chunks(self):
+        """Test import_records commits each chunk and skips duplicates."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=self.test_records
+            )
+
+            records = (
+                (None, f"Book {i}", f"Author {i}", i) for i in range(1, 6)
+            )
+            with patch.object(
+                bookstore, '_insert_records_chunk', 
+                wraps=bookstore._insert_records_chunk
+            ) as mock_chunk:
+                inserted = bookstore.import_records(records, chunk_size=2)
+
+        # Book 1 and Book 2 are already in the store
+        self.assertEqual(inserted, 3)
+        self.assertEqual(mock_chunk.call_count, 3)
+        self.assertFalse(bookstore.db.in_transaction)
+        bookstore.cursor.execute("SELECT COUNT(*) FROM book")
+        self.assertEqual(bookstore.cursor.fetchone()[0], 5)
+
+        bookstore.db.close()
+
+    def test_iter_books(self):
+        """Test iter_books streams every book in id order in batches."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=[
+                    (i, f"Book {i}", "Author", i) for i in range(5, 0, -1)
+                ]
+            )
+
+        books = bookstore.iter_books(batch_size=2)
+        self.assertEqual(next(books), (1, "Book 1", "Author", 1))
+        self.assertEqual([book[0] for book in books], [2, 3, 4, 5])
+
+        # A caller can stop early and keep using the store
+        next(bookstore.iter_books())
+        self.assertIsNotNone(bookstore.find_book({"id": 1}))
+
+        bookstore.db.close()
+
+    def test_apply_qty_deltas(self):
+        """Test bulk quantity changes by id and by title and author."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=self.test_records
+            )
+
+        result = bookstore.apply_qty_deltas([
+            (1, 3), 
+            (("book 2", "AUTHOR 2"), -10), 
+            (2, 2), 
+            (99, 1), 
+            ((" Book 3", "Author 3"), 1), 
+            (1, "many"),
+        ])
+
+        self.assertEqual(result.applied, 3)
+        self.assertEqual(result.failures, [
+            ((1, "many"), "Quantity change must be an integer"),
+            ((99, 1), "Book not found"),
+            (((" Book 3", "Author 3"), 1), "Book not found"),
+        ])
+        bookstore.cursor.execute("SELECT id, qty FROM book ORDER BY id")
+        self.assertEqual(bookstore.cursor.fetchall(), [(1, 8), (2, 7)])
+
+        bookstore.db.close()
+
+    def test_apply_qty_deltas_negative_result(self):
+        """Test a book whose net change would go negative is skipped."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=self.test_records
+            )
+
+        result = bookstore.apply_qty_deltas([(1, -4), (1, -4), (2, -15)])
+
+        self.assertEqual(result.applied, 1)
+        self.assertEqual(result.failures, [
+            ((1, -4), "Quantity can't become negative: 5 in stock, "
+             "net change -8"),
+            ((1, -4), "Quantity can't become negative: 5 in stock, "
+             "net change -8"),
+        ])
+        bookstore.cursor.execute("SELECT id, qty FROM book ORDER BY id")
+        self.assertEqual(bookstore.cursor.fetchall(), [(1, 5), (2, 0)])
+
+        # The staging tables don't outlive the call
+        self.assertEqual(
+            bookstore.apply_qty_deltas([(2, 1)]).applied, 1
+        )
+
+        bookstore.db.close()
+
+class TestBookStoreSqliteFullTextSearch(unittest.TestCase):
+    """Test cases for the FTS5 search engine of BookStoreSqlite."""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.temp_db.close()
+        self.db_path = self.temp_db.name
+        self.test_records = [
+            (1, "The Great Gatsby", "F. Scott Fitzgerald", 5),
+            (2, "Great Expectations", "Charles Dickens", 15),
+            (3, "A Tale of Two Cities", "Charles Dickens", 30)
+        ]
+
+    def tearDown(self):
+        """Clean up after each test."""
+        if os.path.exists(self.db_path):
+            os.unlink(self.db_path)
+
+    def get_printed_table(self, stdout):
+        """Return the text of the table search_books wrote to stdout."""
+        return stdout.getvalue()
+
+    def test_fts_search_pages(self):
+        """Test full-text search pages walk the books by relevance."""
+        records = [
+            (1, "Bleak House and Other Stories", "Charles Dickens", 1),
+            (2, "Dickens", "Charles Dickens", 2),
+            (3, "Hard Times", "Charles Dickens", 3),
+            (4, "Emma", "Jane Austen", 4),
+        ]
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=records, search_engine='fts5'
+            )
+
+        ranked = [records[1], records[2], records[0]]
+        self.assertEqual(bookstore.search("dickens"), ranked)
+        self.assertEqual(bookstore.search("dickens", limit=1), ranked[:1])
+        self.assertEqual(
+            bookstore.search("dickens", limit=1, after_id=2), ranked[1:2]
+        )
+        self.assertEqual(
+            bookstore.search("dickens", limit=5, after_id=3), ranked[2:]
+        )
+        self.assertEqual(bookstore.search("dickens", after_id=1), [])
+        self.assertEqual(list(bookstore.iter_search("dickens", 1)), ranked)
+
+        bookstore.db.close()
+
+    def test_bulk_load_fresh_store(self):
+        """Test a bulk load builds the indexes once and counts books."""
+        records = self.test_records + [
+            (4, "the great gatsby", "F. SCOTT FITZGERALD", 1),
+            (None, "Bleak House", "Charles Dickens", 7),
+        ]
+        with patch('builtins.print') as mock_print:
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=records, search_engine='fts5', 
+                bulk_load=True
+            )
+            # The books are counted once, after they are merged
+            printed = [str(call.args[0]) for call in mock_print.call_args_list]
+            self.assertIn("Bulk load inserted 4 books", printed)
+            self.assertFalse(any(" new" in line for line in printed))
+            # The first record of a title and author wins
+            bookstore.cursor.execute("SELECT id, qty FROM book ORDER BY id")
+            self.assertEqual(
+                bookstore.cursor.fetchall(), [(1, 5), (2, 15), (3, 30), (4, 7)]
+            )
+
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            bookstore.search_books("gats")
+        self.assertIn("The Great Gatsby", self.get_printed_table(stdout))
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            bookstore.search_books("bleak")
+        self.assertIn("Bleak House", self.get_printed_table(stdout))
+
+        bookstore.cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN "
+            "('book_table_key', 'book_fts_au')"
+        )
+        self.assertEqual(len(bookstore.cursor.fetchall()), 2)
+        bookstore.cursor.execute(
+            "SELECT name FROM sqlite_temp_master WHERE name = 'book_bulk_load'"
+        )
+        self.assertIsNone(bookstore.cursor.fetchone())
+
+        bookstore.db.close()
+
+    def test_bulk_load_error_leaves_table(self):
+        """Test a failed bulk load leaves the table as it was."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(self.db_path, search_engine='fts5')
+
+            with self.assertRaises(KeyboardInterrupt):
+                with bookstore.bulk_load():
+                    bookstore.import_records(self.test_records)
+                    raise KeyboardInterrupt
+
+        bookstore.cursor.execute("SELECT COUNT(*) FROM book")
+        self.assertEqual(bookstore.cursor.fetchone()[0], 0)
+        self.assertIsNone(bookstore._bulk_load_table)
+        bookstore.cursor.execute(
+            "SELECT name FROM sqlite_temp_master WHERE name = 'book_bulk_load'"
+        )
+        self.assertIsNone(bookstore.cursor.fetchone())
+
+        # Bulk loading into a table with books inserts directly
+        with patch('builtins.print'), patch('logging.warning') as warning:
+            bookstore.import_records([(10, "Hard Times", "Charles Dickens", 2)])
+            with bookstore.bulk_load():
+                self.assertIsNone(bookstore._bulk_load_table)
+                bookstore.import_records(self.test_records)
+            warning.assert_called_once()
+            bookstore.cursor.execute("SELECT COUNT(*) FROM book_fts")
+            self.assertEqual(bookstore.cursor.fetchone()[0], 4)
+
+        bookstore.db.close()
+
+    def test_fts_index_populated_from_existing_rows(self):
+        """Test the index is built over rows that already exist."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=self.test_records
+            )
+            bookstore.db.close()
+
+            bookstore = BookStoreSqlite(self.db_path, search_engine='fts5')
+            self.assertEqual(bookstore.search_engine, 'fts5')
+
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            bookstore.search_books("dickens")
+            table = self.get_printed_table(stdout)
+            self.assertIn("Great Expectations", table)
+            self.assertIn("A Tale of Two Cities", table)
+            self.assertNotIn("The Great Gatsby", table)
+
+        bookstore.db.close()
+
+    def test_fts_prefix_and_token_queries(self):
+        """Test every query word prefix matches the title or author."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=self.test_records,
+                search_engine='fts5'
+            )
+
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            bookstore.search_books("gats fitz")
+            table = self.get_printed_table(stdout)
+            self.assertIn("The Great Gatsby", table)
+            self.assertNotIn("Great Expectations", table)
+
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            bookstore.search_books("great dickens")
+            table = self.get_printed_table(stdout)
+            self.assertIn("Great Expectations", table)
+            self.assertNotIn("The Great Gatsby", table)
+
+        with patch('builtins.print') as mock_print:
+            bookstore.search_books("Nonexistent")
+            mock_print.assert_any_call("\nBook not found")
+
+        bookstore.db.close()
+
+    def test_fts_index_follows_writes(self):
+        """Test the triggers keep the index in sync with the table."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=self.test_records,
+                search_engine='fts5'
+            )
+            bookstore.insert_book(Book("Hard Times", "Charles Dickens", 2))
+            bookstore.update_title_utility(
+                {"id": 2, "new_title": "Bleak House"}
+            )
+            bookstore.delete_book({"id": 3})
+            bookstore.db.commit()
+
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            bookstore.search_books("dickens")
+            table = self.get_printed_table(stdout)
+            self.assertIn("Hard Times", table)
+            self.assertIn("Bleak House", table)
+            self.assertNotIn("Great Expectations", table)
+            self.assertNotIn("A Tale of Two Cities", table)
+
+        bookstore.db.close()
+
+    def test_fts_numeric_query_matches_id(self):
+        """Test numeric queries still match book ids."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=self.test_records,
+                search_engine='fts5'
+            )
+
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            bookstore.search_books("3")
+            table = self.get_printed_table(stdout)
+            self.assertIn("A Tale of Two Cities", table)
+
+        bookstore.db.close()
+
+    def test_fts_match_expression(self):
+        """Test queries are turned into prefix MATCH expressions."""
+        self.assertEqual(
+            BookStoreSqlite.fts_match_expression('lord "of" rings!'),
+            '"lord"* "of"* "rings"*'
+        )
+        self.assertEqual(BookStoreSqlite.fts_match_expression("!!"), "")
+
+    def test_fts_unavailable_falls_back_to_like(self):
+        """Test search falls back to LIKE when FTS5 is unavailable."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=self.test_records
+            )
+
+        cursor = bookstore.cursor
+        failing_cursor = MagicMock(wraps=cursor)
+
+        def execute(sql, *args):
+            if "CREATE VIRTUAL TABLE" in sql:
+                raise sqlite3.OperationalError("no such module: fts5")
+            return cursor.execute(sql, *args)
+
+        failing_cursor.execute.side_effect = execute
+        bookstore.cursor = failing_cursor
+        bookstore.search_engine = 'fts5'
+
+        with patch('logging.warning'):
+            bookstore._create_search_index()
+        self.assertEqual(bookstore.search_engine, 'like')
+
+        bookstore.cursor = cursor
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            bookstore.search_books("ickens")
+            table = self.get_printed_table(stdout)
+            self.assertIn("Great Expectations", table)
+
+        bookstore.db.close()
+
+
+    def test_trigram_substring_search(self):
+        """Test the trigram engine finds fragments inside words."""
+        records = self.test_records + [
+            (4, "Harry Potter and the Philosopher's Stone", "J. K. Rowling", 40),
+            (5, "The Lion, the Witch and the Wardrobe", "C. S. Lewis", 25)
+        ]
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=records, search_engine='trigram'
+            )
+            self.assertEqual(bookstore.search_engine, 'trigram')
+
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            bookstore.search_books("otter")
+            table = self.get_printed_table(stdout)
+            self.assertIn("Harry Potter", table)
+            self.assertNotIn("Wardrobe", table)
+
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            bookstore.search_books("WARDR")
+            table = self.get_printed_table(stdout)
+            self.assertIn("Wardrobe", table)
+            self.assertNotIn("Harry Potter", table)
+
+        # The index only narrows the candidates, LIKE still verifies
+        # that the fragment appears in one column
+        with patch('builtins.print') as mock_print:
+            bookstore.search_books("Stone J. K.")
+            mock_print.assert_any_call("\nBook not found")
+
+        bookstore.db.close()
+
+    def test_trigram_short_query_falls_back_to_like(self):
+        """Test queries shorter than a trigram still find books."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=self.test_records,
+                search_engine='trigram'
+            )
+
+        statement, params = bookstore._search_statement("Ta")
+        self.assertNotIn("book_trigram", statement)
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            bookstore.search_books("Ta")
+            table = self.get_printed_table(stdout)
+            self.assertIn("A Tale of Two Cities", table)
+
+        bookstore.db.close()
+
+    def test_trigram_index_follows_writes(self):
+        """Test the trigram index is kept in sync with the table."""
+        with patch('builtins.print'):
+            bookstore = BookStoreSqlite(
+                self.db_path, table_records=self.test_records,
+                search_engine='trigram'
+            )
+            bookstore.update_author_utility(
+                {"id": 1, "new_author": "Francis Scott Fitzgerald"}
+            )
+            bookstore.delete_book({"id": 2})
+            bookstore.db.commit()
+
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            bookstore.search_books("ancis sco")
+            table = self.get_printed_table(stdout)
+            self.assertIn("The Great Gatsby", table)
+
+        with patch('builtins.print') as mock_print:
+            bookstore.search_books("xpectation")
+            mock_print.assert_any_call("\nBook not found")
+
+        bookstore.db.close()
+
+class TestBookStoreMySQL(unittest.TestCase):
+    """Test cases for BookStoreMySQL class."""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_params = {
+            'host': 'localhost',
+            'database': 'test_db',
+            'user': 'test_user',
+            'password': 'test_pass',
+            'port': '3306'
+        }
+        self.test_book = Book("Test Title", "Test Author", 10)
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_bookstore_mysql_initialization(self, mock_print, mock_connect):
+        """Test successful BookStoreMySQL initialization."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        
+        bookstore = BookStoreMySQL(self.db_params)
+        
+        self.assertEqual(bookstore.table_name, 'book')
+        mock_connect.assert_called_once_with(
+            host='localhost',
+            database='test_db',
+            user='test_user',
+            password='test_pass',
+            port='3306'
+        )
+        mock_cursor.execute.assert_called()
+        mock_db.commit.assert_called()
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_bookstore_mysql_custom_table(self, mock_print, mock_connect):
+        """Test BookStoreMySQL initialization with custom table name."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        
+        custom_table = "custom_books"
+        bookstore = BookStoreMySQL(self.db_params, custom_table)
+        
+        self.assertEqual(bookstore.table_name, custom_table)
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_insert_book_mysql_success(self, mock_print, mock_connect):
+        """Test successful book insertion in MySQL."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.rowcount = 1  # Book doesn't exist, one row inserted
+        mock_cursor.lastrowid = 123
+        
+        bookstore = BookStoreMySQL(self.db_params)
+        result = bookstore.insert_book(self.test_book)
+        
+        # Verify a single INSERT IGNORE was issued, without a SELECT
+        insert_calls = [
+            arg for arg in mock_cursor.execute.call_args_list 
+            if 'INSERT IGNORE INTO' in str(arg)
+        ]
+        self.assertEqual(len(insert_calls), 1)
+        self.assertNotIn('SELECT', str(mock_cursor.execute.call_args))
+        mock_print.assert_any_call("\nBook entered with id: 123")
+        self.assertEqual(result, InsertResult(True, 123))
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_insert_book_mysql_duplicate(self, mock_print, mock_connect):
+        """Test inserting duplicate book in MySQL."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        # Book exists, INSERT IGNORE skips it
+        mock_cursor.rowcount = 0
+        mock_cursor.lastrowid = 0
+        
+        bookstore = BookStoreMySQL(self.db_params)
+        result = bookstore.insert_book(self.test_book)
+        
+        mock_print.assert_any_call("\nBook already exists")
+        self.assertEqual(result, InsertResult(False, None))
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_find_book_mysql_by_id(self, mock_print, mock_connect):
+        """Test finding book by ID in MySQL."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.fetchall.return_value = [
+            (1, "Test Title", "Test Author", 10)
+        ]
+        
+        bookstore = BookStoreMySQL(self.db_params)
+        book_info = {"id": 1}
+        result = bookstore.find_book(book_info)
+        
+        self.assertEqual(result, (1, "Test Title", "Test Author", 10))
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_delete_book_mysql_success(self, mock_print, mock_connect):
+        """Test successful book deletion in MySQL."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.rowcount = 1  # One row deleted
+        
+        bookstore = BookStoreMySQL(self.db_params)
+        mock_cursor.execute.reset_mock()
+        book_info = {"id": 1}
+        result = bookstore.delete_book(book_info)
+        
+        # Only the DELETE is issued
+        mock_cursor.execute.assert_called_once()
+        self.assertIn('DELETE FROM', mock_cursor.execute.call_args[0][0])
+        mock_print.assert_any_call("\nBook deleted successfully")
+        self.assertEqual(result, DeleteResult(True, None))
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_delete_book_mysql_not_found(self, mock_print, mock_connect):
+        """Test deleting a missing book in MySQL."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.rowcount = 0  # Nothing deleted
+        
+        bookstore = BookStoreMySQL(self.db_params)
+        result = bookstore.delete_book({"title": "Title", "author": "Author"})
+        
+        mock_print.assert_any_call("\nBook not found")
+        self.assertFalse(result.deleted)
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_update_book_mysql_atomic_quantity(self, mock_print, mock_connect):
+        """Test quantity updates are a conditional in-database UPDATE."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.rowcount = 1
+
+        bookstore = BookStoreMySQL(self.db_params)
+        mock_cursor.execute.reset_mock()
+        bookstore.update_book(
+            {"id": 1, "field": "quantity", "action": "sub", "qty": 3}
+        )
+
+        mock_cursor.execute.assert_called_once()
+        statement, params = mock_cursor.execute.call_args[0]
+        self.assertIn('SET qty = qty + %s', statement)
+        self.assertIn('AND qty + %s >= 0', statement)
+        self.assertEqual(params, (-3, 1, -3, None, None))
+        mock_print.assert_any_call("\nBook updated successfully")
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_version_column_mysql(self, mock_print, mock_connect):
+        """Test the version column is added and updates check it."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = None  # No version column
+        mock_cursor.rowcount = 0
+        mock_cursor.fetchall.return_value = [
+            (1, "Test Title", "Test Author", 2, 8)
+        ]
+
+        bookstore = BookStoreMySQL(self.db_params)
+        statements = [
+            call.args[0] for call in mock_cursor.execute.call_args_list
+        ]
+        self.assertTrue(any(
+            "ADD COLUMN version INT NOT NULL DEFAULT 0" in statement
+            for statement in statements
+        ))
+
+        self.assertEqual(bookstore.book_version({"id": 1}), 8)
+        with self.assertRaises(VersionConflictError):
+            bookstore.update_book({
+                "id": 1, "field": "author", "new_author": "Author",
+                "version": 7
+            })
+        statement, params = mock_cursor.execute.call_args_list[-2].args
+        self.assertIn("version = version + 1", statement)
+        self.assertIn("(%s IS NULL OR version = %s)", statement)
+        self.assertEqual(params, ("Author", 1, 7, 7))
+        mock_db.rollback.assert_called()
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_update_book_mysql_insufficient_stock(
+        self, mock_print, mock_connect
+    ):
+        """Test no affected row plus an existing book means no stock."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.rowcount = 0
+        mock_cursor.fetchall.return_value = [
+            (1, "Test Title", "Test Author", 2)
+        ]
+
+        bookstore = BookStoreMySQL(self.db_params)
+        with self.assertRaises(Exception) as context:
+            bookstore.update_book(
+                {"id": 1, "field": "quantity", "action": "sub", "qty": 3}
+            )
+        self.assertIn("You only have 2 of this book", str(context.exception))
+        mock_db.rollback.assert_called()
+
+        # No affected row and no book means not found
+        mock_cursor.fetchall.return_value = []
+        self.assertFalse(bookstore.update_book(
+            {"id": 1, "field": "quantity", "action": "sub", "qty": 3}
+        ))
+        mock_print.assert_any_call("\nBook not found")
+
+        # MySQL reports no affected row when the value doesn't change
+        mock_cursor.fetchall.return_value = [
+            (1, "Test Title", "Test Author", 2)
+        ]
+        self.assertTrue(bookstore.update_book(
+            {"id": 1, "field": "quantity", "action": "set", "qty": 2}
+        ))
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_search_books_mysql_found(self, mock_print, mock_connect):
+        """Test searching books with results in MySQL."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
         mock_db.cursor.return_value = mock_cursor
         mock_cursor.fetchall.return_value = [
             (1, "Test Title", "Test Author", 10)
@@ -572,7 +1772,8 @@ class TestBookStoreMySQL(unittest.TestCase):
         # Verify search was executed
         search_calls = [
             arg for arg in mock_cursor.execute.call_args_list 
-            if 'SELECT * FROM' in str(arg) and 'LIKE' in str(arg)
+            if 'SELECT id, title, author, qty FROM' in str(arg)
+            and 'LIKE' in str(arg)
         ]
         self.assertTrue(len(search_calls) > 0)
 
@@ -591,6 +1792,542 @@ class TestBookStoreMySQL(unittest.TestCase):
         
         mock_print.assert_any_call("\nBook not found")
 
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_trigram_search_engine_mysql(self, mock_print, mock_connect):
+        """Test the trigram side table, triggers and initial index."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = None  # No triggers yet
+        mock_cursor.fetchall.return_value = [(1, "Abcd", "Xyz")]
+
+        bookstore = BookStoreMySQL(self.db_params, search_engine='trigram')
+
+        statements = [
+            str(call[0][0]) for call in mock_cursor.execute.call_args_list
+        ]
+        self.assertTrue(
+            any('CREATE TABLE IF NOT EXISTS book_trigram' in statement
+                for statement in statements)
+        )
+        for trigger in ('book_trigram_ai', 'book_trigram_ad', 'book_trigram_au'):
+            self.assertTrue(
+                any(f'CREATE TRIGGER {trigger}' in statement
+                    for statement in statements)
+            )
+
+        # Existing books are indexed
+        entries = mock_cursor.executemany.call_args[0][1]
+        self.assertCountEqual(entries, [("Abc", 1), ("bcd", 1), ("Xyz", 1)])
+        self.assertEqual(bookstore.search_engine, 'trigram')
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_trigram_search_books_mysql(self, mock_print, mock_connect):
+        """Test substring searches go through the trigram table."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        # Triggers already exist
+        mock_cursor.fetchone.return_value = ("book_trigram_au", )
+
+        bookstore = BookStoreMySQL(self.db_params, search_engine='trigram')
+        mock_cursor.fetchall.return_value = [
+            (1, "Harry Potter", "J. K. Rowling", 40)
+        ]
+        bookstore.search_books("otter")
+
+        statement, params = mock_cursor.execute.call_args[0]
+        self.assertIn('FROM book_trigram', statement)
+        # The first page, with one extra row to tell if more follow
+        self.assertEqual(
+            params, ("ott", "tte", "ter", 0, 3, "%otter%", "%otter%", 21)
+        )
+
+        # Numeric and short queries keep using LIKE
+        bookstore.search_books("ot")
+        statement, params = mock_cursor.execute.call_args[0]
+        self.assertNotIn('book_trigram', statement)
+        self.assertIn('LIKE', statement)
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_fulltext_search_engine_mysql(self, mock_print, mock_connect):
+        """Test tables get a FULLTEXT index, new or existing."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        # No index yet, then the minimum token size
+        mock_cursor.fetchall.side_effect = [[], [(3, )]]
+
+        bookstore = BookStoreMySQL(self.db_params, search_engine='fulltext')
+
+        statements = [
+            str(call[0][0]) for call in mock_cursor.execute.call_args_list
+        ]
+        self.assertIn(
+            'FULLTEXT KEY book_fulltext (title, author)', statements[0]
+        )
+        self.assertTrue(
+            any('ADD FULLTEXT INDEX book_fulltext (title, author)' in statement
+                for statement in statements)
+        )
+        self.assertEqual(bookstore.fulltext_min_token_size, 3)
+
+        # An existing index isn't added again
+        mock_cursor.execute.reset_mock()
+        mock_cursor.fetchall.side_effect = [[("book_fulltext", )], [(4, )]]
+        bookstore = BookStoreMySQL(self.db_params, search_engine='fulltext')
+        statements = [
+            str(call[0][0]) for call in mock_cursor.execute.call_args_list
+        ]
+        self.assertFalse(
+            any('ALTER TABLE' in statement for statement in statements)
+        )
+        self.assertEqual(bookstore.fulltext_min_token_size, 4)
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_fulltext_search_books_mysql(self, mock_print, mock_connect):
+        """Test word searches go through MATCH ... AGAINST."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.fetchall.side_effect = [[("book_fulltext", )], [(3, )]]
+
+        bookstore = BookStoreMySQL(self.db_params, search_engine='fulltext')
+        mock_cursor.fetchall.side_effect = None
+        mock_cursor.fetchall.return_value = [
+            (1, "A Tale of Two Cities", "Charles Dickens", 30)
+        ]
+        bookstore.search_books("dickens tale")
+
+        statement, params = mock_cursor.execute.call_args[0]
+        self.assertIn('AGAINST (%s IN BOOLEAN MODE)', statement)
+        self.assertIn('AGAINST (%s IN BOOLEAN MODE) DESC, id', statement)
+        self.assertNotIn('LIKE', statement)
+        self.assertEqual(
+            params, ("+dickens* +tale*", "+dickens* +tale*", 21)
+        )
+
+        # Short words and stopwords aren't indexed, LIKE checks them
+        bookstore.search_books("the two cities")
+        statement, params = mock_cursor.execute.call_args[0]
+        self.assertIn('AGAINST', statement)
+        self.assertEqual(
+            params, 
+            ("+two* +cities*", "%the%", "%the%", "+two* +cities*", 21)
+        )
+
+        # The next page starts after the relevance and id of a book
+        bookstore.search_books("dickens", 20, 7)
+        statement, params = mock_cursor.execute.call_args[0]
+        self.assertIn('WHERE id = %s', statement)
+        self.assertEqual(
+            params, ("+dickens*", ) * 3 + (7, ) + ("+dickens*", ) * 2 
+            + (7, 7, "+dickens*", 21)
+        )
+
+        # Unpaged results are ranked too
+        statement, params = bookstore._search_statement("dickens")
+        self.assertIn('DESC, id', statement)
+        self.assertNotIn('LIMIT', statement)
+        self.assertEqual(params, ("+dickens*", "+dickens*"))
+
+        # Queries with no indexed word keep using LIKE
+        bookstore.search_books("of")
+        statement, params = mock_cursor.execute.call_args[0]
+        self.assertNotIn('AGAINST', statement)
+        self.assertEqual(params, (0, "%of%", "%of%", 21))
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_key_filter_collation_mysql(self, mock_print, mock_connect):
+        """Test accent-insensitive MySQL keys are never ruled out."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+
+        bookstore = BookStoreMySQL(self.db_params)
+        bookstore.key_filter_max_bytes = 4096
+        mock_cursor.fetchall.side_effect = [
+            [(1, )], [(1, "Café", "Author")]
+        ]
+        bookstore._build_key_filter()
+        mock_cursor.fetchall.side_effect = None
+        mock_cursor.fetchall.return_value = [(1, "Café", "Author", 2)]
+
+        # utf8mb4_unicode_ci finds "Café" when asked for "Cafe"
+        self.assertEqual(
+            bookstore.find_book({"title": "CAFE ", "author": "Author"}),
+            (1, "Café", "Author", 2)
+        )
+        mock_cursor.execute.reset_mock()
+        self.assertIsNone(
+            bookstore.find_book({"title": "Tea", "author": "Author"})
+        )
+        mock_cursor.execute.assert_not_called()
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_book_cache_accent_invalidation_mysql(
+        self, mock_print, mock_connect
+    ):
+        """Test writes by another spelling drop the cached book."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.rowcount = 1
+
+        bookstore = BookStoreMySQL(self.db_params, book_cache_size=10)
+
+        def cache_books():
+            mock_cursor.fetchall.return_value = [(1, "Café", "Author", 2)]
+            bookstore.find_book({"id": 1})
+            mock_cursor.fetchall.return_value = [(2, "Tea", "Author", 3)]
+            bookstore.find_book({"id": 2})
+            self.assertEqual(bookstore.book_cache.stats().size, 4)
+
+        # The database matches "Cafe" to the book cached as "Café"
+        cache_books()
+        bookstore.update_book({
+            "title": "Cafe ", "author": "AUTHOR", "field": "quantity",
+            "action": "add", "qty": 1
+        })
+        self.assertIsNone(bookstore.book_cache.get(("id", 1)))
+        self.assertEqual(bookstore.book_cache.stats().size, 2)
+
+        cache_books()
+        bookstore.delete_book({"title": "CAFÉ", "author": "author"})
+        self.assertIsNone(bookstore.book_cache.get(("id", 1)))
+        self.assertEqual(bookstore.book_cache.stats().size, 2)
+        self.assertEqual(
+            BookStoreMySQL.collation_key("Ærø Œuvre"), "aero oeuvre"
+        )
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_search_statements_mysql_columns(self, mock_print, mock_connect):
+        """Test every search selects the four book columns by name."""
+        mock_connect.return_value = MagicMock()
+
+        bookstore = BookStoreMySQL(self.db_params)
+        bookstore.fulltext_min_token_size = 3
+        statements = [bookstore._id_search_statement([(1, 9)])[0]]
+        statements.append(
+            bookstore._id_search_statement([(1, 9)], limit=20)[0]
+        )
+        for engine in ("like", "trigram", "fulltext"):
+            bookstore.search_engine = engine
+            for limit in (None, 20):
+                statements.append(
+                    bookstore._search_statement("dickens", limit=limit)[0]
+                )
+        for statement in statements:
+            self.assertNotIn("*", statement.split("FROM")[0])
+            self.assertRegex(
+                statement, r"^SELECT (book\.)?id, (book\.)?title, "
+                r"(book\.)?author, (book\.)?qty\s"
+            )
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_search_books_mysql_numeric_query(self, mock_print, mock_connect):
+        """Test numeric queries are looked up by id first in MySQL."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.fetchall.return_value = [
+            (3001, "Test Title", "Test Author", 10)
+        ]
+
+        bookstore = BookStoreMySQL(self.db_params)
+        bookstore.search_books("3001")
+
+        statement, params = mock_cursor.execute.call_args[0]
+        self.assertIn('id BETWEEN %s AND %s', statement)
+        self.assertNotIn('LIKE', statement)
+        self.assertEqual(params, (3001, 3001, 0, 21))
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    @patch('logging.warning')
+    def test_unsupported_search_engine_mysql(
+        self, mock_warning, mock_print, mock_connect
+    ):
+        """Test engines MySQL can't provide fall back to LIKE."""
+        mock_connect.return_value = MagicMock()
+
+        bookstore = BookStoreMySQL(self.db_params, search_engine='fts5')
+
+        self.assertEqual(bookstore.search_engine, 'like')
+        mock_warning.assert_called_once()
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_import_records_load_data_mysql(self, mock_print, mock_connect):
+        """Test imports go through LOAD DATA LOCAL INFILE if allowed."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.rowcount = 1
+        loaded = []
+
+        def execute(statement, params=None):
+            # Read the chunk file before it is removed
+            if statement.startswith('LOAD DATA'):
+                with open(params[0], encoding='utf-8') as chunk_file:
+                    loaded.append(chunk_file.read())
+        mock_cursor.execute.side_effect = execute
+
+        bookstore = BookStoreMySQL(
+            dict(self.db_params, allow_local_infile=True)
+        )
+        self.assertTrue(mock_connect.call_args.kwargs['allow_local_infile'])
+
+        inserted = bookstore.import_records(
+            [(None, "Tab\tTitle", "Author", 2), (7, "Title", "Author", 1)]
+        )
+
+        self.assertEqual(inserted, 1)
+        self.assertEqual(
+            loaded, ["\\N\tTab\\tTitle\tAuthor\t2\n7\tTitle\tAuthor\t1\n"]
+        )
+        statement = mock_cursor.execute.call_args[0][0]
+        self.assertIn('INSERT IGNORE INTO book', statement)
+        self.assertIn('FROM book_load', statement)
+        self.assertIn('ORDER BY seq', statement)
+        mock_cursor.executemany.assert_not_called()
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    @patch('logging.warning')
+    def test_import_records_load_data_disabled_mysql(
+        self, mock_warning, mock_print, mock_connect
+    ):
+        """Test imports fall back to executemany without local_infile."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.rowcount = 2
+
+        def execute(statement, params=None):
+            if statement.startswith('LOAD DATA'):
+                raise mysql.connector.errors.DatabaseError(
+                    msg="Loading local data is disabled", errno=3948
+                )
+        mock_cursor.execute.side_effect = execute
+
+        bookstore = BookStoreMySQL(
+            dict(self.db_params, allow_local_infile=True)
+        )
+        records = [(1, "Title", "Author", 2), (2, "Title 2", "Author", 1)]
+        self.assertEqual(bookstore.import_records(records), 2)
+
+        mock_warning.assert_called_once()
+        self.assertFalse(bookstore.local_infile)
+        statement, params = mock_cursor.executemany.call_args[0]
+        self.assertIn('INSERT IGNORE INTO book', statement)
+        self.assertEqual(params, records)
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_connection_pool_mysql(self, mock_print, mock_connect):
+        """Test threads share a pool of connections."""
+        connections = [MagicMock(), MagicMock()]
+        mock_connect.side_effect = connections
+
+        bookstore = BookStoreMySQL(
+            dict(self.db_params, pool_size=2, pool_timeout=0.01)
+        )
+        self.assertEqual(mock_connect.call_args.kwargs['pool_size'], 2)
+        self.assertIn('pool_name', mock_connect.call_args.kwargs)
+        self.assertIs(bookstore.db, connections[0])
+
+        used = []
+
+        def use_store():
+            try:
+                used.append(bookstore.db)
+            except mysql.connector.errors.PoolError as e:
+                used.append(e)
+
+        # A thread checks out a connection of its own and keeps it
+        worker = threading.Thread(target=use_store)
+        worker.start()
+        worker.join()
+        self.assertIs(used[0], connections[1])
+
+        # Until one is released, the pool has none left
+        worker = threading.Thread(target=use_store)
+        worker.start()
+        worker.join()
+        self.assertIsInstance(used[1], mysql.connector.errors.PoolError)
+
+        bookstore.release_connection()
+        connections[0].close.assert_called_once()
+        mock_connect.side_effect = None
+        mock_connect.return_value = connections[0]
+        worker = threading.Thread(target=use_store)
+        worker.start()
+        worker.join()
+        self.assertIs(used[2], connections[0])
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_idle_connection_pinged_mysql(self, mock_print, mock_connect):
+        """Test a connection idle for ping_interval is pinged."""
+        mock_db = MagicMock()
+        mock_connect.return_value = mock_db
+
+        bookstore = BookStoreMySQL(dict(self.db_params, ping_interval=60))
+        bookstore.find_book({"id": 1})
+        mock_db.ping.assert_not_called()
+
+        bookstore.ping_interval = 0
+        bookstore.find_book({"id": 1})
+        mock_db.ping.assert_called_with(reconnect=True, attempts=2)
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    @patch('logging.warning')
+    def test_read_retried_on_lost_connection_mysql(
+        self, mock_warning, mock_print, mock_connect
+    ):
+        """Test a read is run again once the connection is lost."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.fetchall.return_value = [(1, "Title", "Author", 2)]
+        lost = mysql.connector.errors.OperationalError(
+            msg="Lost connection to MySQL server during query", errno=2013
+        )
+
+        bookstore = BookStoreMySQL(self.db_params)
+        mock_cursor.execute.side_effect = [lost, None]
+        self.assertEqual(
+            bookstore.find_book({"id": 1}), (1, "Title", "Author", 2)
+        )
+        mock_db.reconnect.assert_called_once()
+        mock_warning.assert_called_once()
+
+        # Other errors aren't retried
+        syntax_error = mysql.connector.errors.ProgrammingError(
+            msg="Syntax error", errno=1064
+        )
+        mock_cursor.execute.side_effect = syntax_error
+        with self.assertRaises(mysql.connector.errors.ProgrammingError):
+            bookstore.find_book({"id": 1})
+        mock_db.reconnect.assert_called_once()
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_prepared_statements_mysql(self, mock_print, mock_connect):
+        """Test each statement is prepared once per connection."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.fetchall.return_value = [(1, "Title", "Author", 2)]
+
+        bookstore = BookStoreMySQL(self.db_params)
+        mock_cursor.execute.reset_mock()
+        for book_id in (1, 2):
+            bookstore.find_book({"id": book_id})
+        prepared = [
+            call for call in mock_db.cursor.call_args_list 
+            if call.kwargs.get('prepared')
+        ]
+        self.assertEqual(len(prepared), 1)
+        # The very same statement is executed, so it isn't prepared again
+        first, second = mock_cursor.execute.call_args_list
+        self.assertIs(first.args[0], second.args[0])
+        self.assertEqual(second.args[1], (2, ))
+        self.assertEqual(
+            bookstore.statement_stats()["select_book_by_id"].executions, 2
+        )
+
+        # A new connection prepares its statements again
+        bookstore.release_connection()
+        bookstore.find_book({"id": 3})
+        prepared = [
+            call for call in mock_db.cursor.call_args_list 
+            if call.kwargs.get('prepared')
+        ]
+        self.assertEqual(len(prepared), 2)
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_iter_books_mysql(self, mock_print, mock_connect):
+        """Test iter_books reads from an unbuffered cursor in batches."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        mock_cursor.fetchmany.side_effect = [
+            [(1, "Title", "Author", 2), (2, "Title 2", "Author", 1)], []
+        ]
+
+        bookstore = BookStoreMySQL(self.db_params)
+        books = list(bookstore.iter_books(batch_size=2))
+
+        self.assertEqual(len(books), 2)
+        mock_db.cursor.assert_called_with(buffered=False)
+        mock_cursor.fetchmany.assert_called_with(2)
+        mock_db.consume_results.assert_called_once()
+        mock_cursor.close.assert_called_once()
+
+    @patch('mysql.connector.connect')
+    @patch('builtins.print')
+    def test_apply_qty_deltas_mysql(self, mock_print, mock_connect):
+        """Test bulk quantity changes are staged with one executemany."""
+        mock_db = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect.return_value = mock_db
+        mock_db.cursor.return_value = mock_cursor
+        # No missing books, one book short of stock
+        mock_cursor.fetchall.side_effect = [[], [], [(1, 2, -3)]]
+
+        bookstore = BookStoreMySQL(self.db_params)
+        result = bookstore.apply_qty_deltas(
+            [(1, 5), (("Title", "Author"), -3)]
+        )
+
+        statement, rows = mock_cursor.executemany.call_args[0]
+        self.assertIn('INSERT INTO book_qty_deltas', statement)
+        self.assertEqual(
+            rows, [(0, 1, None, None, 5), (1, None, "Title", "Author", -3)]
+        )
+        updates = [
+            call[0][0] for call in mock_cursor.execute.call_args_list 
+            if call[0][0].startswith('UPDATE book AS')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(result.applied, 1)
+        self.assertEqual(
+            result.failures[0][0], (("Title", "Author"), -3)
+        )
+        mock_db.commit.assert_called()
+
+    def test_trigrams(self):
+        """Test trigram extraction is caseless and deduplicated."""
+        self.assertEqual(
+            BookStoreMySQL.trigrams("Otter otter"),
+            ["Ott", "tte", "ter", "er ", "r o", " ot"]
+        )
+        self.assertEqual(BookStoreMySQL.trigrams("ab"), [])
+
     @patch('mysql.connector.connect')
     @patch('builtins.print')
     def test_mysql_connection_with_default_port(self, mock_print, mock_connect):
@@ -156,7 +156,7 @@ class TestEbookstoreIntegration(unittest.TestCase):
             
             # Verify that search_books was called
             mock_bookstore.search_books.assert_called_once_with(
-                'test search query'
+                'test search query', None, None
             )
 
     @patch('sys.argv', ['ebookstore.py', '--database-file', 'test.db'])
@@ -266,7 +266,7 @@ class TestEbookstoreIntegration(unittest.TestCase):
         """Test main function with table records file."""
         mock_input.side_effect = ['0']  # Exit immediately
         
-        with patch('ebookstore.get_table_records') as mock_get_records:
+        with patch('ebookstore.iter_table_records') as mock_get_records:
             with patch('ebookstore.BookStoreSqlite') as mock_bookstore_class:
                 mock_bookstore = MagicMock()
                 mock_bookstore_class.return_value = mock_bookstore
@@ -276,7 +276,7 @@ class TestEbookstoreIntegration(unittest.TestCase):
                 except SystemExit:
                     pass  # Expected when exiting
                 
-                # Verify get_table_records was called
+                # Verify iter_table_records was called
                 mock_get_records.assert_called_once()
 
     @patch('sys.argv', ['ebookstore.py'])
@@ -492,14 +492,13 @@ class TestFileOperations(unittest.TestCase):
             temp_file_path = temp_file.name
         
         try:
-            from functions import get_table_records
-            table_records = []
-            get_table_records(table_records, temp_file_path)
+            from functions import iter_table_records
+            table_records = list(iter_table_records(temp_file_path))
             
             expected = [
-                ('1', 'Test Book 1', 'Author 1', '10'),
-                ('2', 'Test Book 2', 'Author 2', '20'),
-                ('3', 'Book with, comma', 'Author, Name', '30')
+                (1, 'Test Book 1', 'Author 1', 10),
+                (2, 'Test Book 2', 'Author 2', 20),
+                (3, 'Book with, comma', 'Author, Name', 30)
             ]
             self.assertEqual(table_records, expected)
         finally:
@@ -0,0 +1,283 @@
+"""
+Unit tests for the BookStoreServer class.
+Tests the JSON endpoints, keep-alive and the worker pool.
+"""
+
+import json
+import time
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+import http.client
+import tempfile
+import os
+import sys
+
+# Add parent directory to path to import application modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import BookStoreServer
+from classes import BookStoreSqlite, BookStoreMySQL
+
+
+class TestBookStoreServer(unittest.TestCase):
+    """Test cases for BookStoreServer class."""
+
+    def setUp(self):
+        """Start a server over an SQLite store on a free port."""
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.temp_db.close()
+        self.db_path = self.temp_db.name
+        patcher = patch('builtins.print')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Clean up after each test."""
+        if os.path.exists(self.db_path):
+            os.unlink(self.db_path)
+
+    def start_server(self, **kwargs):
+        """Serve from a thread of its own, which opens the store."""
+        started = threading.Event()
+
+        def run():
+            store = BookStoreSqlite(self.db_path, book_cache_size=10)
+            self.server = BookStoreServer(
+                ("127.0.0.1", 0), store, **kwargs
+            )
+            started.set()
+            self.server.serve()
+            store.db.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        started.wait(5)
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(self.server.shutdown)
+        return self.server.server_port
+
+    def request(self, connection, method, path, body=None):
+        """Make a request and return its status, JSON body and headers."""
+        connection.request(
+            method, path, body=None if body is None else json.dumps(body)
+        )
+        response = connection.getresponse()
+        return response.status, json.loads(response.read()), response
+
+    def test_book_round_trip(self):
+        """Test the endpoints on one kept-alive connection."""
+        port = self.start_server()
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        book = {"title": "Dune", "author": "Frank Herbert", "qty": 5}
+
+        status, body, response = self.request(
+            connection, "POST", "/books", book
+        )
+        self.assertEqual((status, body), (201, {"id": 1}))
+        self.assertRegex(
+            response.getheader("Server-Timing"),
+            r"^db;dur=[\d.]+, total;dur=[\d.]+$"
+        )
+        self.assertEqual(
+            self.request(connection, "POST", "/books", book)[:2],
+            (409, {"error": "Book already exists"})
+        )
+        self.assertEqual(
+            self.request(connection, "GET", "/books/1")[:2],
+            (200, dict(book, id=1))
+        )
+        self.assertEqual(
+            self.request(
+                connection, "GET", "/books?title=dune&author=frank%20herbert"
+            )[:2],
+            (200, dict(book, id=1))
+        )
+        self.assertEqual(
+            self.request(
+                connection, "PATCH", "/books/1",
+                {"field": "quantity", "action": "sub", "qty": 2}
+            )[:2],
+            (200, {"updated": True})
+        )
+        status, body, _ = self.request(connection, "GET", "/search?q=dune")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["books"], [dict(book, id=1, qty=3)])
+        self.assertFalse(body["has_more"])
+        self.assertEqual(
+            self.request(connection, "DELETE", "/books/1")[:2],
+            (200, {"deleted": True, "book": dict(book, id=1, qty=3)})
+        )
+        self.assertEqual(
+            self.request(connection, "GET", "/books/1")[:2],
+            (404, {"error": "Book not found"})
+        )
+        status, body, _ = self.request(connection, "GET", "/stats")
+        self.assertEqual(body["book_cache"]["max_size"], 10)
+        self.assertEqual(body["statements"]["insert_book"]["executions"], 2)
+        connection.close()
+
+    def test_errors(self):
+        """Test bad requests get a status and a JSON message."""
+        port = self.start_server()
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        self.request(
+            connection, "POST", "/books",
+            {"title": "Dune", "author": "Frank Herbert", "qty": 1}
+        )
+
+        status, body, _ = self.request(
+            connection, "PATCH", "/books/1",
+            {"field": "quantity", "action": "sub", "qty": 2}
+        )
+        self.assertEqual(status, 409)
+        self.assertIn("You only have 1 of this book", body["error"])
+        self.assertEqual(
+            self.request(connection, "POST", "/books", {"title": "Dune"})[0],
+            400
+        )
+        self.assertEqual(
+            self.request(
+                connection, "POST", "/books",
+                {"title": " ", "author": "Author", "qty": 1}
+            )[:2],
+            (400, {"error": "Title cannot be empty"})
+        )
+        self.assertEqual(
+            self.request(connection, "PATCH", "/books/1", {"field": "x"})[0],
+            400
+        )
+        connection.request("POST", "/books", body="{not json")
+        response = connection.getresponse()
+        response.read()
+        self.assertEqual(response.status, 400)
+        self.assertEqual(self.request(connection, "GET", "/nowhere")[0], 404)
+        # The connection is still usable after every error
+        self.assertEqual(self.request(connection, "GET", "/books/1")[0], 200)
+        connection.close()
+
+    def test_versioned_update(self):
+        """Test an update with a stale version gets a 409."""
+        port = self.start_server()
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        self.request(
+            connection, "POST", "/books",
+            {"title": "Dune", "author": "Frank Herbert", "qty": 1}
+        )
+        self.assertEqual(
+            self.request(connection, "GET", "/books/1/version")[:2],
+            (200, {"version": 0})
+        )
+        rename = {"field": "title", "new_title": "Dune 2", "version": 0}
+        self.assertEqual(
+            self.request(connection, "PATCH", "/books/1", rename)[0], 200
+        )
+        status, body, _ = self.request(connection, "PATCH", "/books/1", rename)
+        self.assertEqual(status, 409)
+        self.assertIn("changed by someone else", body["error"])
+        self.assertEqual(
+            self.request(
+                connection, "GET",
+                "/books/version?title=dune%202&author=frank%20herbert"
+            )[:2],
+            (200, {"version": 1})
+        )
+        self.assertEqual(
+            self.request(connection, "GET", "/books/2/version")[0], 404
+        )
+        connection.close()
+
+    def test_bulk_operations(self):
+        """Test imports and quantity changes of many books."""
+        port = self.start_server()
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        self.assertEqual(
+            self.request(
+                connection, "POST", "/books/import",
+                {"books": [[None, "A", "B", 1], [7, "C", "D", 2]]}
+            )[:2],
+            (200, {"inserted": 2})
+        )
+        status, body, _ = self.request(
+            connection, "POST", "/qty-deltas",
+            {"deltas": [[7, 3], [["A", "B"], 4], [99, 1]]}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(body["applied"], 2)
+        self.assertEqual(body["failures"], [[[99, 1], "Book not found"]])
+        self.assertEqual(
+            self.request(connection, "GET", "/books/7")[1]["qty"], 5
+        )
+        self.assertEqual(
+            self.request(
+                connection, "POST", "/books/import", {"books": [["A"]]}
+            )[0],
+            400
+        )
+        # Records the store would choke on are refused up front
+        for books in (
+            [["x", "E", "F", 1]], [[1.5, "E", "F", 1]], [[True, "E", "F", 1]],
+            [[-1, "E", "F", 1]], [[None, "E", "F", "1"]],
+            [[None, "E", "F", False]], [[None, 1, "F", 1]], "E",
+        ):
+            with self.subTest(books=books):
+                status, body, _ = self.request(
+                    connection, "POST", "/books/import", {"books": books}
+                )
+                self.assertEqual(status, 400)
+                self.assertIn(
+                    "Expected" if books == "E" else "Invalid book",
+                    body["error"]
+                )
+        self.assertEqual(
+            self.request(connection, "GET", "/books/1")[1]["title"], "A"
+        )
+        connection.close()
+
+    def test_workers_are_bounded(self):
+        """Test connections wait for a free worker."""
+        port = self.start_server(workers=1, keep_alive_timeout=0.3)
+        first = http.client.HTTPConnection("127.0.0.1", port)
+        self.assertEqual(self.request(first, "GET", "/books/1")[0], 404)
+
+        # The only worker holds the kept-alive connection until it idles
+        second = http.client.HTTPConnection("127.0.0.1", port)
+        start = time.monotonic()
+        self.assertEqual(self.request(second, "GET", "/books/1")[0], 404)
+        self.assertGreater(time.monotonic() - start, 0.2)
+        first.close()
+        second.close()
+
+
+class TestBookStoreServerMySQL(unittest.TestCase):
+    """Test cases for BookStoreServer over MySQL."""
+
+    @patch('builtins.print')
+    def test_workers_call_the_store(self, mock_print):
+        """Test workers call the store and release their connection."""
+        store = MagicMock(spec=BookStoreMySQL)
+        store.find_book.return_value = (1, "Title", "Author", 2)
+        server = BookStoreServer(("127.0.0.1", 0), store, workers=2)
+        thread = threading.Thread(target=server.serve)
+        thread.start()
+
+        connection = http.client.HTTPConnection(
+            "127.0.0.1", server.server_port
+        )
+        connection.request("GET", "/books/1")
+        response = connection.getresponse()
+        self.assertEqual(
+            json.loads(response.read()),
+            {"id": 1, "title": "Title", "author": "Author", "qty": 2}
+        )
+        connection.close()
+        server.shutdown()
+        thread.join(5)
+
+        store.find_book.assert_called_once_with({"id": 1})
+        # Once by serve, once when the client disconnected
+        self.assertEqual(store.release_connection.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
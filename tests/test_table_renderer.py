@@ -0,0 +1,114 @@
+"""
+Unit tests for the TableRenderer class.
+Tests the layout matches tabulate's and rows are streamed.
+"""
+
+import io
+import unittest
+import os
+import sys
+from tabulate import tabulate
+
+# Add parent directory to path to import application modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from table_renderer import TableRenderer
+
+
+HEADERS = ["ID", "Title", "Author", "Quantity"]
+
+
+class TestTableRenderer(unittest.TestCase):
+    """Test cases for TableRenderer class."""
+
+    def render(self, rows, **kwargs):
+        """Return the text TableRenderer writes for rows."""
+        output = io.StringIO()
+        written = TableRenderer(HEADERS, file=output, **kwargs).render(rows)
+        self.assertEqual(written, len(rows))
+        return output.getvalue()
+
+    def tabulate_output(self, rows):
+        """Return the text print('\\n', tabulate(rows, HEADERS)) writes."""
+        output = io.StringIO()
+        print('\n', tabulate(rows, HEADERS), file=output)
+        return output.getvalue()
+
+    def test_small_results_match_tabulate(self):
+        """Test the layout is byte for byte tabulate's for small results."""
+        cases = [
+            [(1, "A Tale of Two Cities", "Charles Dickens", 30)],
+            [
+                (1, "A Tale of Two Cities", "Charles Dickens", 30),
+                (12, "Harry Potter", "J. K. Rowling", 0),
+                (3001, "The Lord of the Rings", "J. R. R. Tolkien", 37),
+            ],
+            [(7, "  Spaced  ", "", 5), (8, "1984", "George Orwell", 2)],
+            [(1, "True", "False", 1)],
+            [(1, "漢字の本", "著者", 3)],
+            [(1, "Unknown", None, 4)],
+            [(1, "1.5", "1e5", 3), (2, "inf", "nan", 4)],
+            [(1, "1.5", "2", 3), (2, "10", "x", 4)],
+            [(1, "1.50", None, 2), (2, "-inf", "1e999", 1.25)],
+            [(1, "Title", "Author", 1.5), (2, "Title", "Author", 10)],
+            [(1, "a\tb", "c", 1)],
+        ]
+        for rows in cases:
+            with self.subTest(rows=rows):
+                self.assertEqual(
+                    self.render(rows), self.tabulate_output(rows)
+                )
+
+    def test_long_text_is_truncated(self):
+        """Test text longer than max_width is cut short."""
+        title = "A Very Long Title " * 10
+        table = self.render(
+            [(1, title, "Author", 3), (2, "Short", "Author", 4)],
+            max_width=20
+        )
+        lines = table.splitlines()
+        self.assertEqual(
+            lines[3], "   1  A Very Long Title A…  Author             3"
+        )
+        # Every row lines up with the header rule
+        self.assertEqual(len({len(line) for line in lines[2:]}), 1)
+
+    def test_rows_after_sample_are_streamed(self):
+        """Test rows past the sample keep the sampled widths."""
+        rows = [(i, f"Book {i}", "Author", i) for i in range(1, 6)]
+        rows.append((6, "A much longer title than the others", "Author", 6))
+        table = self.render(rows, sample_size=5)
+
+        lines = table.splitlines()
+        self.assertEqual(len(lines), 3 + len(rows))
+        self.assertEqual(lines[-1], "   6  A much…  Author             6")
+        self.assertEqual(len(lines[-1]), len(lines[-2]))
+
+    def test_rows_are_written_as_they_come(self):
+        """Test the table is written before all rows are fetched."""
+        output = io.StringIO()
+        fetched = []
+
+        def rows():
+            for i in range(1, 4):
+                fetched.append(i)
+                yield (i, f"Book {i}", "Author", i)
+                if i == 2:
+                    # The header and the sample are already written
+                    self.assertIn("Book 1", output.getvalue())
+
+        TableRenderer(HEADERS, file=output, sample_size=1).render(rows())
+        self.assertEqual(fetched, [1, 2, 3])
+        self.assertIn("Book 3", output.getvalue())
+
+    def test_fixed_widths(self):
+        """Test given widths are used instead of sampling."""
+        table = self.render(
+            [(1, "Great Expectations", "Charles Dickens", 3)],
+            widths=[4, 10, 10, 10]
+        )
+        self.assertIn("   1  Great Exp…  Charles D…           3", table)
+
+
+if __name__ == '__main__':
+    unittest.main()